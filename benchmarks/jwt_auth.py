@@ -0,0 +1,71 @@
+"""Measure per-request JWT verification overhead with and without the verified-token cache.
+
+    python benchmarks/jwt_auth.py --requests 20000 --tokens 100
+"""
+import argparse
+import os
+import sys
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openapi_server.jwt_verifier import JWTVerifier  # noqa: E402
+
+SECRET = "benchmark-secret-that-is-long-enough-for-hs256"
+
+
+def signing_keys() -> dict:
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    ec_key = ec.generate_private_key(ec.SECP256R1())
+    return {
+        "HS256": (SECRET, SECRET),
+        "RS256": (rsa_key, rsa_key.public_key()),
+        "ES256": (ec_key, ec_key.public_key()),
+    }
+
+
+def make_tokens(algorithm: str, private_key, count: int) -> list:
+    expires_at = int(time.time()) + 3600
+    return [
+        jwt.encode({"sub": f"user-{index}", "exp": expires_at, "aud": "api"}, private_key, algorithm=algorithm)
+        for index in range(count)
+    ]
+
+
+def measure(verifier: JWTVerifier, tokens: list, request_count: int) -> float:
+    # Each distinct token is seen once before timing starts, as it would be after a client's first request.
+    for token in tokens:
+        verifier.verify(token)
+    start = time.perf_counter()
+    for index in range(request_count):
+        verifier.verify(tokens[index % len(tokens)])
+    return (time.perf_counter() - start) / request_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Number of verified requests per mode")
+    parser.add_argument("--tokens", type=int, default=100, help="Number of distinct tokens the requests cycle through")
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests over {args.tokens} tokens")
+    print(f"{'algorithm':<10} {'uncached (us)':>14} {'cached (us)':>12} {'speedup':>9}")
+    for algorithm, (private_key, public_key) in signing_keys().items():
+        tokens = make_tokens(algorithm, private_key, args.tokens)
+        timings = [
+            measure(
+                JWTVerifier(lambda header: public_key, [algorithm], audience="api", cache_size=cache_size),
+                tokens,
+                args.requests
+            )
+            for cache_size in (0, 10000)
+        ]
+        uncached, cached = (timing * 1e6 for timing in timings)
+        print(f"{algorithm:<10} {uncached:>14.1f} {cached:>12.1f} {uncached / cached:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compare full and incremental OpenAPI regeneration on a synthetic spec.
+
+    python benchmarks/openapi_regeneration.py --paths 10000 --changed 0.01
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils import find_and_apply_updates, find_and_apply_updates_incremental  # noqa: E402
+
+
+def synthetic_operation(index: int, method: str, generated: bool) -> dict:
+    operation = {
+        "summary": f"{method.upper()} resource {index}",
+        "parameters": [
+            {"name": "resourceId", "in": "path", "required": True, "schema": {"type": "integer"}},
+            {"name": "expand", "in": "query", "required": False, "schema": {"type": "string"}},
+        ],
+        "responses": {
+            "200": {
+                "description": "OK",
+                "content": {"application/json": {"schema": {"$ref": f"#/components/schemas/Model{index % 1000}"}}},
+            },
+        },
+    }
+    if generated:
+        operation["operationId"] = f"{method}_resource_{index}"
+        operation["responses"]["422"] = {"description": "Validation Error"}
+    else:
+        operation["x-table"] = f"resource_{index}"
+        operation["parameters"][0]["style"] = "simple"
+    return operation
+
+
+def synthetic_spec(path_count: int, generated: bool, changed: frozenset = frozenset()) -> dict:
+    paths = {}
+    for index in range(path_count):
+        paths[f"/resources{index}/{{resourceId}}"] = {
+            method: synthetic_operation(index, method, generated) for method in ("get", "put", "delete")
+        }
+        if index in changed:
+            paths[f"/resources{index}/{{resourceId}}"]["get"]["summary"] += " (changed)"
+    schemas = {
+        f"Model{index}": {
+            "type": "object",
+            "title": f"Model{index}",
+            "properties": {
+                "id": {"type": "integer", "title": "id"},
+                "name": {"type": "string", "title": "name"},
+            },
+            **({} if generated else {"x-owner": "team"}),
+        }
+        for index in range(min(path_count, 1000))
+    }
+    return {
+        "openapi": "3.1.0",
+        "info": {"title": "Synthetic API", "version": "1.0.0"},
+        "paths": paths,
+        "components": {"schemas": schemas},
+    }
+
+
+def measure(func, make_args):
+    # Inputs are rebuilt for every call because the full merge mutates the generated spec.
+    args = make_args()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    args = make_args()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", type=int, default=10000, help="Number of synthetic paths")
+    parser.add_argument("--changed", type=float, default=0.01, help="Fraction of paths changed between runs")
+    args = parser.parse_args()
+
+    existing = synthetic_spec(args.paths, generated=False)
+    generated = synthetic_spec(args.paths, generated=True)
+    changed = frozenset(range(0, args.paths, max(1, int(1 / args.changed)))) if args.changed else frozenset()
+    regenerated = synthetic_spec(args.paths, generated=True, changed=changed)
+
+    warm_cache = {}
+    find_and_apply_updates_incremental(copy.deepcopy(generated), existing, warm_cache)
+
+    results = {
+        "full": measure(find_and_apply_updates, lambda: (copy.deepcopy(regenerated), existing)),
+        "incremental (cold)": measure(
+            find_and_apply_updates_incremental, lambda: (copy.deepcopy(regenerated), existing, {})
+        ),
+        "incremental (warm)": measure(
+            find_and_apply_updates_incremental, lambda: (copy.deepcopy(regenerated), existing, dict(warm_cache))
+        ),
+    }
+
+    print(f"{args.paths} paths, {len(changed)} changed")
+    print(f"{'mode':<20} {'time (s)':>10} {'peak (MiB)':>12}")
+    for mode, (elapsed, peak) in results.items():
+        print(f"{mode:<20} {elapsed:>10.3f} {peak / 2 ** 20:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""In-memory stand-in for the IAM, Resource Manager and Code Engine APIs used by deploy.py.
+
+    python code_engine_stub.py --port 8090
+    python deploy.py token Default my-project my-namespace \\
+        --ibm_iam_url http://localhost:8090 \\
+        --resource_manager_url http://localhost:8090 \\
+        --code_engine_url http://localhost:8090/v2
+
+Resources report a transitional status for --settle_polls reads before they
+settle, so the script's polling is exercised too. Deployed apps answer every
+GET under their endpoint with 200, which is enough for the smoke test.
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+
+DEFAULT_PORT = 8090
+DEFAULT_SETTLE_POLLS = 2
+DEFAULT_RESOURCE_GROUP = 'Default'
+# Fields whose change makes Code Engine create a new app revision.
+REVISION_FIELDS = ('image_reference', 'image_secret', 'run_env_variables', 'scale_min_instances',
+                   'scale_max_instances', 'scale_concurrency', 'scale_concurrency_target', 'scale_cpu_limit',
+                   'scale_memory_limit', 'scale_down_delay')
+KINDS = {'secrets': 'secret', 'config_maps': 'config_map', 'builds': 'build', 'build_runs': 'build_run'}
+
+
+class StubError(Exception):
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+
+
+class CodeEngineStub:
+  def __init__(self, base_url, resource_group_name, settle_polls, fail_revisions):
+    self.base_url = base_url
+    self.resource_group_name = resource_group_name
+    self.settle_polls = settle_polls
+    self.fail_revisions = fail_revisions
+    self.lock = threading.Lock()
+    self.projects = {}
+    self.resources = {}
+    self.revisions = {}
+
+  def _settle(self, resource):
+    # Each read moves a transitional resource one step closer to its final state.
+    pending = resource.get('_pending')
+    if pending:
+      pending['polls'] -= 1
+      if pending['polls'] <= 0:
+        resource.pop('_pending')
+        for key, value in pending['fields'].items():
+          if isinstance(value, dict) and isinstance(resource.get(key), dict):
+            resource[key].update(value)
+          else:
+            resource[key] = value
+        if 'on_settle' in pending:
+          pending['on_settle']()
+    return {key: value for key, value in resource.items() if not key.startswith('_')}
+
+  def _pending(self, resource, on_settle=None, **fields):
+    resource['_pending'] = {'polls': self.settle_polls, 'fields': fields}
+    if on_settle:
+      resource['_pending']['on_settle'] = on_settle
+
+  def _get(self, key):
+    resource = self.resources.get(key)
+    if resource is None:
+      raise StubError(404, f'{key[1]} {key[2]} not found')
+    return resource
+
+  def _check_entity_tag(self, resource, if_match):
+    if if_match and if_match != resource['entity_tag']:
+      raise StubError(412, f"entity tag {if_match} does not match {resource['entity_tag']}")
+
+  def _update(self, resource, body):
+    resource.update(body)
+    resource['entity_tag'] = str(int(resource['entity_tag']) + 1)
+
+  def token(self):
+    now = int(time.time())
+    return {
+        'access_token': jwt.encode({'sub': 'stub', 'iat': now, 'exp': now + 3600}, 'stub-signing-key', algorithm='HS256'),
+        'refresh_token': 'stub', 'token_type': 'Bearer', 'expires_in': 3600, 'expiration': now + 3600,
+    }
+
+  def resource_groups(self):
+    return {'resources': [{'id': 'stub-resource-group', 'name': self.resource_group_name}]}
+
+  def list_projects(self):
+    return {'projects': [self._settle(project) for project in self.projects.values()], 'limit': 100}
+
+  def create_project(self, body):
+    project = {'id': str(uuid.uuid4()), 'name': body['name'], 'resource_group_id': body.get('resource_group_id'),
+               'status': 'creating'}
+    self._pending(project, status='active')
+    self.projects[project['id']] = project
+    return 201, self._settle(dict(project, _pending=None))
+
+  def get_project(self, project_id):
+    if project_id not in self.projects:
+      raise StubError(404, f'project {project_id} not found')
+    return self._settle(self.projects[project_id])
+
+  def get_resource(self, project_id, kind, name):
+    return self._settle(self._get((project_id, kind, name)))
+
+  def create_resource(self, project_id, kind, body):
+    key = (project_id, kind, body['name'])
+    if key in self.resources:
+      raise StubError(409, f'{kind} {body["name"]} already exists')
+    resource = dict(body, entity_tag='1', project_id=project_id)
+    if kind == 'build':
+      resource['status'] = 'creating'
+      self._pending(resource, status='ready')
+    elif kind == 'build_run':
+      resource['status'] = 'pending'
+      self._pending(resource, status='succeeded')
+    self.resources[key] = resource
+    return 201, {k: v for k, v in resource.items() if not k.startswith('_')}
+
+  def replace_resource(self, project_id, kind, name, body, if_match):
+    resource = self._get((project_id, kind, name))
+    self._check_entity_tag(resource, if_match)
+    self._update(resource, body)
+    return self._settle(resource)
+
+  def _new_revision(self, app):
+    app['_revision_count'] = app.get('_revision_count', 0) + 1
+    name = f"{app['name']}-{app['_revision_count']:05d}"
+    revision = {'name': name, 'app_name': app['name'], 'status': 'loading'}
+    failed = self.fail_revisions
+    self._pending(revision, status='failed' if failed else 'ready')
+    self.revisions[(app['project_id'], app['name'], name)] = revision
+    app['status_details']['latest_created_revision'] = name
+    app['status_details']['reason'] = 'deploying'
+    if app['status_details'].get('latest_ready_revision') is None:
+      app['status'] = 'deploying'
+    if failed:
+      ready_fields = {'status': 'failed' if app['status'] == 'deploying' else app['status'],
+                      'status_details': {'reason': 'ready_but_latest_revision_failed'}}
+    else:
+      ready_fields = {'status': 'ready', 'status_details': {'latest_ready_revision': name, 'reason': 'ready'}}
+    # The app settles together with its revision, however the two are polled.
+    self._pending(app, on_settle=lambda: self._settle_revision(revision), **ready_fields)
+    return revision
+
+  def _settle_revision(self, revision):
+    revision.get('_pending', {})['polls'] = 0
+    self._settle(revision)
+
+  def create_app(self, project_id, body):
+    key = (project_id, 'app', body['name'])
+    if key in self.resources:
+      raise StubError(409, f'app {body["name"]} already exists')
+    app = dict(body, entity_tag='1', project_id=project_id, status='deploying',
+               endpoint=f"{self.base_url}/app/{body['name']}", status_details={})
+    self.resources[key] = app
+    self._new_revision(app)
+    return 201, {k: v for k, v in app.items() if not k.startswith('_')}
+
+  def update_app(self, project_id, name, body, if_match):
+    app = self._get((project_id, 'app', name))
+    self._check_entity_tag(app, if_match)
+    before = {field: app.get(field) for field in REVISION_FIELDS}
+    self._update(app, body)
+    if {field: app.get(field) for field in REVISION_FIELDS} != before:
+      self._new_revision(app)
+    return self._settle(app)
+
+  def get_revision(self, project_id, app_name, name):
+    revision = self.revisions.get((project_id, app_name, name))
+    if revision is None:
+      raise StubError(404, f'revision {name} not found')
+    return self._settle(revision)
+
+
+def build_run_body(headers, body):
+  message = BytesParser().parsebytes(
+      f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + body
+  )
+  for part in message.get_payload():
+    if part.get_param('name', header='content-disposition') == 'json':
+      return json.loads(part.get_payload(decode=True))
+  raise StubError(400, 'multipart body has no json part')
+
+
+def make_handler(stub):
+  resource_path = r'/v2/projects/([^/]+)/(secrets|config_maps|builds|build_runs)'
+  routes = [
+      ('POST', r'/identity/token', lambda m, h, b: stub.token()),
+      ('GET', r'/v2/resource_groups', lambda m, h, b: stub.resource_groups()),
+      ('GET', r'/v2/projects', lambda m, h, b: stub.list_projects()),
+      ('POST', r'/v2/projects', lambda m, h, b: stub.create_project(json.loads(b))),
+      ('GET', r'/v2/projects/([^/]+)', lambda m, h, b: stub.get_project(m[1])),
+      ('GET', resource_path + r'/([^/]+)', lambda m, h, b: stub.get_resource(m[1], KINDS[m[2]], m[3])),
+      ('POST', r'/v2/projects/([^/]+)/build_runs',
+       lambda m, h, b: stub.create_resource(m[1], 'build_run', build_run_body(h, b)
+                                            if 'multipart' in h.get('Content-Type', '') else json.loads(b))),
+      ('POST', resource_path, lambda m, h, b: stub.create_resource(m[1], KINDS[m[2]], json.loads(b))),
+      ('PUT', resource_path + r'/([^/]+)',
+       lambda m, h, b: stub.replace_resource(m[1], KINDS[m[2]], m[3], json.loads(b), h.get('If-Match'))),
+      ('PATCH', resource_path + r'/([^/]+)',
+       lambda m, h, b: stub.replace_resource(m[1], KINDS[m[2]], m[3], json.loads(b), h.get('If-Match'))),
+      ('GET', r'/v2/projects/([^/]+)/apps/([^/]+)', lambda m, h, b: stub.get_resource(m[1], 'app', m[2])),
+      ('POST', r'/v2/projects/([^/]+)/apps', lambda m, h, b: stub.create_app(m[1], json.loads(b))),
+      ('PATCH', r'/v2/projects/([^/]+)/apps/([^/]+)',
+       lambda m, h, b: stub.update_app(m[1], m[2], json.loads(b), h.get('If-Match'))),
+      ('GET', r'/v2/projects/([^/]+)/apps/([^/]+)/revisions/([^/]+)',
+       lambda m, h, b: stub.get_revision(m[1], m[2], m[3])),
+      ('GET', r'/app/.*', lambda m, h, b: {'stub': True}),
+  ]
+
+  class Handler(BaseHTTPRequestHandler):
+    def _dispatch(self, method):
+      path = self.path.split('?', 1)[0]
+      body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+      status, result = 404, {'errors': [{'code': 'not_found', 'message': f'no stub route for {method} {path}'}]}
+      for route_method, pattern, action in routes:
+        match = re.fullmatch(pattern, path)
+        if route_method == method and match:
+          try:
+            with stub.lock:
+              result = action(match, self.headers, body)
+            status, result = result if isinstance(result, tuple) else (200, result)
+          except StubError as e:
+            status, result = e.status, {'errors': [{'code': 'stub_error', 'message': str(e)}], 'status_code': e.status}
+          break
+      payload = json.dumps(result).encode()
+      self.send_response(status)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(payload)))
+      self.end_headers()
+      self.wfile.write(payload)
+
+    def do_GET(self):
+      self._dispatch('GET')
+
+    def do_POST(self):
+      self._dispatch('POST')
+
+    def do_PUT(self):
+      self._dispatch('PUT')
+
+    def do_PATCH(self):
+      self._dispatch('PATCH')
+
+  return Handler
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+  parser.add_argument('--resource_group_name', type=str, default=DEFAULT_RESOURCE_GROUP,
+                      help='Name of the one resource group the stub reports')
+  parser.add_argument('--settle_polls', type=int, default=DEFAULT_SETTLE_POLLS,
+                      help='Reads a resource reports a transitional status for before it settles')
+  parser.add_argument('--fail_revisions', action='store_true', help='Make every new app revision fail')
+  args = parser.parse_args()
+
+  stub = CodeEngineStub(f'http://localhost:{args.port}', args.resource_group_name, args.settle_polls,
+                        args.fail_revisions)
+  server = ThreadingHTTPServer(('localhost', args.port), make_handler(stub))
+  print(f'Code Engine stub listening on http://localhost:{args.port}')
+  server.serve_forever()
+
+
+if __name__ == '__main__':
+  main()
@@ -1,19 +1,29 @@
 import os
+import io
 import sys
+import gzip
 import time
 import json
 import yaml
+import fnmatch
+import hmac
+import hashlib
 import tarfile
+import secrets
 import argparse
 import requests
 import logging
 import coloredlogs
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 from ibm_cloud_sdk_core import *
 from ibm_code_engine_sdk.code_engine_v2 import *
 from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
 from ibm_platform_services import ResourceManagerV2
 
+from smoke_test import add_smoke_test_arguments, check_smoke_test_arguments, smoke_test
+
 try:
     from http.client import HTTPConnection
 except ImportError:
@@ -32,6 +42,8 @@ BUILD_NAME = None
 IMAGE_PATH = None
 BUILD_RUN_NAME = None
 APPLICATION_NAME = None
+DEPLOY_DEADLINE = None
+STEP_TIMINGS = {}
 
 #test
 
@@ -96,7 +108,126 @@ def cli_args_config():
       help="IBM Cloud Registry Token"
   )
 
-  return parser.parse_args()
+  parser.add_argument(
+      "--resource_manager_url",
+      type=str,
+      required=False,
+      default=DEFAULT_RESOURCE_MANAGER_URL,
+      help="IBM Cloud Resource Manager API URL"
+  )
+
+  parser.add_argument(
+      "--code_engine_url",
+      type=str,
+      required=False,
+      default=DEFAULT_CODE_ENGINE_URL,
+      help="IBM Code Engine API URL"
+  )
+
+  parser.add_argument(
+      "--min_scale",
+      type=int,
+      required=False,
+      default=None,
+      help="Minimum number of app instances, 0 allows scaling to zero"
+  )
+
+  parser.add_argument(
+      "--max_scale",
+      type=int,
+      required=False,
+      default=None,
+      help="Maximum number of app instances"
+  )
+
+  parser.add_argument(
+      "--concurrency",
+      type=int,
+      required=False,
+      default=None,
+      help="Maximum concurrent requests per instance"
+  )
+
+  parser.add_argument(
+      "--concurrency_target",
+      type=int,
+      required=False,
+      default=None,
+      help="Concurrent requests per instance at which the app scales out"
+  )
+
+  parser.add_argument(
+      "--cpu",
+      type=str,
+      required=False,
+      default=None,
+      help="CPU limit per instance, e.g. 0.5 or 1"
+  )
+
+  parser.add_argument(
+      "--memory",
+      type=str,
+      required=False,
+      default=None,
+      help="Memory limit per instance, e.g. 1G or 4G"
+  )
+
+  parser.add_argument(
+      "--scale_down_delay",
+      type=int,
+      required=False,
+      default=None,
+      help="Seconds to keep idle instances before scaling down"
+  )
+
+  parser.add_argument(
+      "--smoke_test",
+      action="store_true",
+      help="Load test the deployed app and roll back when latency or error thresholds are exceeded"
+  )
+
+  add_smoke_test_arguments(parser, prefix='smoke_')
+
+  parser.add_argument(
+      "--timeout",
+      type=int,
+      required=False,
+      default=DEFAULT_DEPLOY_TIMEOUT,
+      help="Overall deployment timeout in seconds"
+  )
+
+  args = parser.parse_args()
+  if args.smoke_test:
+    check_smoke_test_arguments(parser, args.smoke_path, args.smoke_ids, prefix='smoke_')
+  return args
+
+
+@contextmanager
+def timed_step(step_name):
+  start = time.monotonic()
+  try:
+    yield
+  finally:
+    STEP_TIMINGS[step_name] = time.monotonic() - start
+    LOGGER.info(f'Step {YELLOW}{step_name}{RESET} took {BLUE}{STEP_TIMINGS[step_name]:.1f}s{RESET}')
+
+
+def run_step(step_name, step, **kwargs):
+  with timed_step(step_name):
+    return step(**kwargs)
+
+
+def poll_until(fetch, is_done, description):
+  delay = POLL_INITIAL_DELAY
+  while True:
+    result = fetch()
+    if is_done(result):
+      return result
+    remaining = DEPLOY_DEADLINE - time.monotonic()
+    if remaining <= 0:
+      raise TimeoutError(f'{RED}Timed out waiting for {description}{RESET}')
+    time.sleep(min(delay, remaining))
+    delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
 
 
 def authenticator_generator(cli_args):
@@ -107,6 +238,7 @@ def authenticator_generator(cli_args):
 
 def resource_group_id_provider(resource_group_name):
   resource_manager_service = ResourceManagerV2(authenticator=AUTHENTICATOR)
+  resource_manager_service.set_service_url(RESOURCE_MANAGER_URL)
   resource_group_list = resource_manager_service.list_resource_groups(
   ).get_result().get('resources')
   for resource_group in resource_group_list:
@@ -128,6 +260,19 @@ def code_engine_service_generator():
   CODE_ENGINE_SERVICE.set_service_url(CODE_ENGINE_URL)
 
 
+def upsert_resource(kind, name, get_resource, create_resource, update_resource):
+  try:
+    existing = get_resource().get_result()
+  except ApiException as e:
+    if e.code != 404:
+      raise
+    LOGGER.debug(f'{kind} {YELLOW}{name}{RESET} does not exist, creating it.')
+    return create_resource().get_result()
+
+  LOGGER.debug(f'{kind} {YELLOW}{name}{RESET} exists, updating it in place.')
+  return update_resource(existing['entity_tag']).get_result()
+
+
 def registry_secret_provider(cli_args, project_id):
   if cli_args.icr_token is not None:
     icr_token = cli_args.icr_token
@@ -137,34 +282,27 @@ def registry_secret_provider(cli_args, project_id):
   registry_secret_data = SecretDataRegistrySecretData(
       username='iamapikey', password=icr_token, server='icr.io')
 
-  try:
-    response = CODE_ENGINE_SERVICE.get_secret(
-        project_id=project_id,
-        name=REGISTRY_SECRET_NAME,
-    ).get_result()
-
-    LOGGER.debug(f'Registry with name {YELLOW}{REGISTRY_SECRET_NAME}{RESET} exists, recreating the registry secret.')
-
-    CODE_ENGINE_SERVICE.delete_secret(
-        project_id=project_id,
-        name=REGISTRY_SECRET_NAME,
-    ).get_result()
-
-    response = CODE_ENGINE_SERVICE.create_secret(
-        project_id=project_id,
-        format='registry',
-        name=REGISTRY_SECRET_NAME,
-        data=registry_secret_data,
-    )
-  except ApiException:
-      response = CODE_ENGINE_SERVICE.create_secret(
+  upsert_resource(
+      'Registry secret',
+      REGISTRY_SECRET_NAME,
+      get_resource=lambda: CODE_ENGINE_SERVICE.get_secret(
+          project_id=project_id,
+          name=REGISTRY_SECRET_NAME,
+      ),
+      create_resource=lambda: CODE_ENGINE_SERVICE.create_secret(
           project_id=project_id,
           format='registry',
           name=REGISTRY_SECRET_NAME,
           data=registry_secret_data,
+      ),
+      update_resource=lambda entity_tag: CODE_ENGINE_SERVICE.replace_secret(
+          project_id=project_id,
+          name=REGISTRY_SECRET_NAME,
+          if_match=entity_tag,
+          format='registry',
+          data=registry_secret_data,
       )
-
-  secret = response.get_result()
+  )
 
   response = CODE_ENGINE_SERVICE.get_secret(
       project_id=project_id,
@@ -210,14 +348,20 @@ def project_provider(cli_args):
         id=project_id
     ).get_result()
 
-  project_status = project['status']
-
-  while project_status in ['creating', 'pending']:
-    time.sleep(10)
+  def fetch_project_status():
     project_status = CODE_ENGINE_SERVICE.get_project(
         id=project['id']
     ).get_result()['status']
     LOGGER.debug(f'Project {YELLOW}{CODE_ENGINE_PROJECT_NAME}{RESET} Status: {BLUE}{str(project_status).upper()}{RESET}')
+    return project_status
+
+  project_status = project['status']
+  if project_status in ['creating', 'pending']:
+    project_status = poll_until(
+        fetch_project_status,
+        lambda status: status not in ['creating', 'pending'],
+        f'project {CODE_ENGINE_PROJECT_NAME}'
+    )
 
   LOGGER.info(f'Project {YELLOW}{CODE_ENGINE_PROJECT_NAME}{RESET} Status: {BLUE}{str(project_status).upper()}{RESET}')
 
@@ -226,79 +370,139 @@ def project_provider(cli_args):
 
 
 def build_generator(project_id, registry_secret_name):
-  try:
-    response = CODE_ENGINE_SERVICE.get_build(
-        project_id=project_id,
-        name=BUILD_NAME,
-    ).get_result()
+  build_settings = {
+      'output_image': IMAGE_PATH,
+      'output_secret': registry_secret_name,
+      'strategy_type': 'buildpacks',
+      'source_type': 'local',
+      'strategy_size': 'small',
+  }
 
-    CODE_ENGINE_SERVICE.delete_build(
-        project_id=project_id,
-        name=BUILD_NAME,
-    )
+  build = upsert_resource(
+      'Build',
+      BUILD_NAME,
+      get_resource=lambda: CODE_ENGINE_SERVICE.get_build(
+          project_id=project_id,
+          name=BUILD_NAME,
+      ),
+      create_resource=lambda: CODE_ENGINE_SERVICE.create_build(
+          project_id=project_id,
+          name=BUILD_NAME,
+          **build_settings,
+      ),
+      update_resource=lambda entity_tag: CODE_ENGINE_SERVICE.update_build(
+          project_id=project_id,
+          name=BUILD_NAME,
+          if_match=entity_tag,
+          build=build_settings,
+      )
+  )
 
-    response = CODE_ENGINE_SERVICE.create_build(
-        project_id=project_id,
-        name=BUILD_NAME,
-        output_image=IMAGE_PATH,
-        output_secret=registry_secret_name,
-        strategy_type='buildpacks',
-        source_type='local',
-        strategy_size='small',
-    )
-  except ApiException:
-    response = CODE_ENGINE_SERVICE.create_build(
+  def fetch_build():
+    build = CODE_ENGINE_SERVICE.get_build(
         project_id=project_id,
         name=BUILD_NAME,
-        output_image=IMAGE_PATH,
-        output_secret=registry_secret_name,
-        strategy_type='buildpacks',
-        source_type='local',
-        strategy_size='small',
-    )
+    ).get_result()
+    LOGGER.info(f"Build {YELLOW}{BUILD_NAME}{RESET} Status: {BLUE}{str(build['status']).upper()}{RESET}")
+    return build
 
-  build = response.get_result()
+  if build['status'] != 'ready':
+    build = poll_until(fetch_build, lambda build: build['status'] == 'ready', f'build {BUILD_NAME}')
 
-  while build['status'] != 'ready':
-    response = CODE_ENGINE_SERVICE.get_build(
-        project_id=project_id,
-        name=BUILD_NAME,
-    )
+  LOGGER.debug(f'Build {YELLOW}{BUILD_NAME}{RESET} Config:\n{json.dumps(build, indent=2)}')
 
-    build = response.get_result()
 
-    LOGGER.info(f"Build {YELLOW}{BUILD_NAME}{RESET} Status: {BLUE}{str(build['status']).upper()}{RESET}")
-    time.sleep(10)
+def ignore_patterns():
+  patterns = list(DEFAULT_IGNORE_PATTERNS)
+  if os.path.exists(CE_IGNORE_FILE_NAME):
+    with open(CE_IGNORE_FILE_NAME, 'r') as file:
+      for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+          patterns.append(line)
+  return patterns
+
+
+def is_ignored(path, is_dir, patterns):
+  for pattern in patterns:
+    if pattern.endswith('/'):
+      if not is_dir:
+        continue
+      pattern = pattern.rstrip('/')
+    pattern = pattern.lstrip('/')
+    if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern):
+      return True
+  return False
 
-  LOGGER.debug(f'Build {YELLOW}{BUILD_NAME}{RESET} Config:\n{json.dumps(build, indent=2)}')
+
+def source_entries(patterns):
+  entries = [name for name in (BUILD_SPEC_FILE_NAME, 'requirements.txt', CE_IGNORE_FILE_NAME) if os.path.exists(name)]
+  for root, dirs, files in os.walk(SOURCE_CODE_PATH):
+    dirs[:] = sorted(d for d in dirs if not is_ignored(os.path.join(root, d), True, patterns))
+    entries.append(root)
+    entries.extend(
+        os.path.join(root, name) for name in sorted(files)
+        if not is_ignored(os.path.join(root, name), False, patterns)
+    )
+  return entries
+
+
+def add_normalised(tar, path):
+  # Fixed metadata keeps the archive, and therefore its hash, identical for identical sources.
+  info = tar.gettarinfo(path, arcname=path.replace(os.sep, '/'))
+  info.mtime = SOURCE_DATE_EPOCH
+  info.uid = info.gid = 0
+  info.uname = info.gname = ''
+  info.mode = 0o755 if info.isdir() or info.mode & 0o111 else 0o644
+  if info.isfile():
+    with open(path, 'rb') as file:
+      tar.addfile(info, file)
+  else:
+    tar.addfile(info)
 
 
 def source_tar_generator():
   try:
     file_path = os.path.join(FILE_DIR, SOURCE_FILE_NAME)
+    patterns = ignore_patterns()
+
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w', format=tarfile.GNU_FORMAT) as tar:
+      for entry in source_entries(patterns):
+        add_normalised(tar, entry)
+    source_hash = hashlib.sha256(archive.getvalue()).hexdigest()
 
-    with tarfile.open(file_path, 'w:gz') as tar:
-      tar.add(BUILD_SPEC_FILE_NAME)
-      tar.add('requirements.txt')
-      tar.add('.ceignore')
-      tar.add(SOURCE_CODE_PATH)
+    with open(file_path, 'wb') as file:
+      with gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as gz:
+        gz.write(archive.getvalue())
   except Exception as e:
-    raise Exception(f'{RED}Error creating source archive{RESET}')
+    raise Exception(f'{RED}Error creating source archive: {e}{RESET}')
 
   LOGGER.info(f'Archive with required source files created successfully.')
-  LOGGER.info(f'Archive File: {YELLOW}{file_path}{RESET}')
-  return file_path
+  LOGGER.info(f'Archive File: {YELLOW}{file_path}{RESET}, content hash: {BLUE}{source_hash}{RESET}')
+  return file_path, source_hash
 
 
-def build_run_generator(project_id):
+def build_run_succeeded(project_id, build_run_name):
+  try:
+    build_run = CODE_ENGINE_SERVICE.get_build_run(
+        project_id=project_id,
+        name=build_run_name,
+    ).get_result()
+  except ApiException:
+    return False
+  return build_run.get('status') == 'succeeded'
+
+
+def build_run_generator(project_id, source_file, build_run_name, image_reference):
   token = AUTHENTICATOR.token_manager.get_token()
-  source_file = source_tar_generator()
   url = f"{CODE_ENGINE_URL}/projects/{project_id}/build_runs"
   files = {
       'json': json.dumps({
-          "name": BUILD_RUN_NAME,
+          "name": build_run_name,
           "build_name": BUILD_NAME,
-          "project_id": project_id
+          "project_id": project_id,
+          "output_image": image_reference
       }),
       'source': (SOURCE_FILE_NAME, open(source_file, 'rb'), 'application/octet-stream')
   }
@@ -308,17 +512,24 @@ def build_run_generator(project_id):
   build_run = response.json()
   LOGGER.debug(f'Build Run Config:\n{json.dumps(build_run, indent=2)}')
 
-  while build_run['status'] in ['running', 'pending']:
-
-      response = CODE_ENGINE_SERVICE.get_build_run(
-          project_id=project_id,
-          name=BUILD_RUN_NAME,
-      )
-
-      build_run = response.get_result()
-      LOGGER.info(f"Build Run {YELLOW}{BUILD_RUN_NAME}{RESET} Status: {BLUE}{str(build_run['status']).upper()}{RESET}")
+  def fetch_build_run():
+    build_run = CODE_ENGINE_SERVICE.get_build_run(
+        project_id=project_id,
+        name=build_run_name,
+    ).get_result()
+    LOGGER.info(f"Build Run {YELLOW}{build_run_name}{RESET} Status: {BLUE}{str(build_run['status']).upper()}{RESET}")
+    return build_run
+
+  if build_run['status'] in ['running', 'pending']:
+    build_run = poll_until(
+        fetch_build_run,
+        lambda build_run: build_run['status'] not in ['running', 'pending'],
+        f'build run {build_run_name}'
+    )
 
-      time.sleep(15)
+  if build_run['status'] != 'succeeded':
+    LOGGER.error(f"Build Run {YELLOW}{build_run_name}{RESET} Data:\n{json.dumps(build_run, indent=2)}")
+    raise Exception(f'{RED}Build Run {YELLOW}{build_run_name}{RESET} finished with status {str(build_run["status"]).upper()}{RESET}')
 
 
 def get_config_map_data():
@@ -340,46 +551,72 @@ def get_config_map_data():
   return config_map_data, secret_map_data
 
 
-def env_var_provider(project_id):
-  config_map_data, secret_map_data = get_config_map_data()
-
+def config_hash_salt(project_id):
+  # The salt is kept in the secret, next to the password it protects, so it stays the same across deploys.
   try:
-    response = CODE_ENGINE_SERVICE.create_config_map(
-        project_id=project_id,
-        name=CONFIG_MAP_NAME,
-        data=config_map_data
-    )
-  except ApiException:
-    CODE_ENGINE_SERVICE.delete_config_map(
-        project_id=project_id,
-        name=CONFIG_MAP_NAME,
-    ).get_result()
+    secret = CODE_ENGINE_SERVICE.get_secret(project_id=project_id, name=SECRET_MAP_NAME).get_result()
+  except ApiException as e:
+    if e.code != 404:
+      raise
+    secret = {}
+  return (secret.get('data') or {}).get(CONFIG_HASH_SALT_KEY) or secrets.token_hex(CONFIG_HASH_SALT_BYTES)
 
-    response = CODE_ENGINE_SERVICE.create_config_map(
-        project_id=project_id,
-        name=CONFIG_MAP_NAME,
-        data=config_map_data
-    )
 
-  try:
-    response = CODE_ENGINE_SERVICE.create_secret(
-        project_id=project_id,
-        name=SECRET_MAP_NAME,
-        format='generic',
-        data=secret_map_data
-    )
-  except ApiException:
-    CODE_ENGINE_SERVICE.delete_secret(
-        project_id=project_id,
-        name=SECRET_MAP_NAME,
-    ).get_result()
+def config_hash(config_map_data, secret_map_data, salt):
+  # Full references don't change when the referenced data does, so the hash goes into the app spec
+  # itself and a changed host or password still produces a new revision. It is keyed with the salt,
+  # so the published value can't be used to guess the password offline.
+  data = json.dumps({'config_map': config_map_data, 'secret': secret_map_data}, sort_keys=True)
+  return hmac.new(salt.encode(), data.encode(), hashlib.sha256).hexdigest()[:CONFIG_HASH_LENGTH]
 
-    response = CODE_ENGINE_SERVICE.create_secret(
-        project_id=project_id,
-        name=SECRET_MAP_NAME,
-        format='generic',
-        data=secret_map_data
-    ).get_result()
+
+def env_var_provider(project_id):
+  config_map_data, secret_map_data = get_config_map_data()
+  salt = config_hash_salt(project_id)
+  hash_value = config_hash(config_map_data, secret_map_data, salt)
+  secret_map_data[CONFIG_HASH_SALT_KEY] = salt
+
+  upsert_resource(
+      'Config map',
+      CONFIG_MAP_NAME,
+      get_resource=lambda: CODE_ENGINE_SERVICE.get_config_map(
+          project_id=project_id,
+          name=CONFIG_MAP_NAME,
+      ),
+      create_resource=lambda: CODE_ENGINE_SERVICE.create_config_map(
+          project_id=project_id,
+          name=CONFIG_MAP_NAME,
+          data=config_map_data
+      ),
+      update_resource=lambda entity_tag: CODE_ENGINE_SERVICE.replace_config_map(
+          project_id=project_id,
+          name=CONFIG_MAP_NAME,
+          if_match=entity_tag,
+          data=config_map_data
+      )
+  )
+
+  upsert_resource(
+      'Secret',
+      SECRET_MAP_NAME,
+      get_resource=lambda: CODE_ENGINE_SERVICE.get_secret(
+          project_id=project_id,
+          name=SECRET_MAP_NAME,
+      ),
+      create_resource=lambda: CODE_ENGINE_SERVICE.create_secret(
+          project_id=project_id,
+          name=SECRET_MAP_NAME,
+          format='generic',
+          data=secret_map_data
+      ),
+      update_resource=lambda entity_tag: CODE_ENGINE_SERVICE.replace_secret(
+          project_id=project_id,
+          name=SECRET_MAP_NAME,
+          if_match=entity_tag,
+          format='generic',
+          data=secret_map_data
+      )
+  )
 
   env_data = [
       {
@@ -391,6 +628,11 @@ def env_var_provider(project_id):
           'name': SECRET_MAP_NAME,
           'type': 'secret_full_reference',
           'reference': SECRET_MAP_NAME
+      },
+      {
+          'name': CONFIG_HASH_ENV_NAME,
+          'type': 'literal',
+          'value': hash_value
       }
   ]
 
@@ -398,51 +640,84 @@ def env_var_provider(project_id):
   return env_data
 
 
-def application_generator(project_id):
-  env_vars = env_var_provider(project_id=project_id)
-  try:
-    app = CODE_ENGINE_SERVICE.get_app(
-        project_id=project_id,
-        name=APPLICATION_NAME
-    ).get_result()
+def scale_settings(cli_args):
+  settings = {
+      'scale_min_instances': cli_args.min_scale,
+      'scale_max_instances': cli_args.max_scale,
+      'scale_concurrency': cli_args.concurrency,
+      'scale_concurrency_target': cli_args.concurrency_target,
+      'scale_cpu_limit': cli_args.cpu,
+      'scale_memory_limit': cli_args.memory,
+      'scale_down_delay': cli_args.scale_down_delay,
+  }
+  return {key: value for key, value in settings.items() if value is not None}
 
-    CODE_ENGINE_SERVICE.delete_app(
-        project_id=project_id,
-        name=APPLICATION_NAME
-    )
-    response = CODE_ENGINE_SERVICE.create_app(
-        project_id=project_id,
-        image_reference=IMAGE_PATH,
-        image_secret=REGISTRY_SECRET_NAME,
-        name=APPLICATION_NAME,
-        run_env_variables=env_vars
-    )
-  except ApiException:
-    response = CODE_ENGINE_SERVICE.create_app(
-        project_id=project_id,
-        image_reference=IMAGE_PATH,
-        image_secret=REGISTRY_SECRET_NAME,
-        name=APPLICATION_NAME,
-        run_env_variables=env_vars
-    )
 
-  app = response.get_result()
+def application_generator(project_id, env_vars, image_reference, scale):
+  app_settings = {
+      'image_reference': image_reference,
+      'image_secret': REGISTRY_SECRET_NAME,
+      'run_env_variables': env_vars,
+      **scale,
+  }
+
+  # Updating creates a new revision; Code Engine shifts traffic to it once it is ready,
+  # so the running instances keep serving instead of going through a delete and cold start.
+  app = upsert_resource(
+      'App',
+      APPLICATION_NAME,
+      get_resource=lambda: CODE_ENGINE_SERVICE.get_app(
+          project_id=project_id,
+          name=APPLICATION_NAME
+      ),
+      create_resource=lambda: CODE_ENGINE_SERVICE.create_app(
+          project_id=project_id,
+          name=APPLICATION_NAME,
+          **app_settings
+      ),
+      update_resource=lambda entity_tag: CODE_ENGINE_SERVICE.update_app(
+          project_id=project_id,
+          name=APPLICATION_NAME,
+          if_match=entity_tag,
+          app=app_settings
+      )
+  )
   LOGGER.debug(f'App Data:\n{json.dumps(app, indent=2)}')
 
 
 def application_url_provider(project_id):
-  app = None
-
-  while app is None or app['status'] not in ['pending', 'failed', 'ready']:
+  def fetch_app():
     app = CODE_ENGINE_SERVICE.get_app(
         project_id=project_id,
         name=APPLICATION_NAME
     ).get_result()
-
     LOGGER.info(f"App {YELLOW}{APPLICATION_NAME}{RESET} Status: {BLUE}{str(app['status']).upper()}{RESET}")
-    time.sleep(10)
 
-  if app['status'] == 'failed':
+    # An app that is ready on its previous revision stays ready when the new one fails, so check the new one directly.
+    status_details = app.get('status_details', {})
+    latest_created = status_details.get('latest_created_revision')
+    revision_status = None
+    if latest_created and latest_created != status_details.get('latest_ready_revision'):
+      revision_status = CODE_ENGINE_SERVICE.get_app_revision(
+          project_id=project_id,
+          app_name=APPLICATION_NAME,
+          name=latest_created
+      ).get_result()['status']
+      LOGGER.info(f"Revision {YELLOW}{latest_created}{RESET} Status: {BLUE}{str(revision_status).upper()}{RESET}")
+    return app, revision_status
+
+  def app_settled(result):
+    app, revision_status = result
+    if app['status'] in ['pending', 'failed'] or revision_status == 'failed':
+      return True
+    if app['status'] == 'ready':
+      status_details = app.get('status_details', {})
+      return status_details.get('latest_ready_revision') == status_details.get('latest_created_revision')
+    return False
+
+  app, revision_status = poll_until(fetch_app, app_settled, f'app {APPLICATION_NAME}')
+
+  if app['status'] == 'failed' or revision_status == 'failed':
     LOGGER.error(
         f"{RED}App {YELLOW}{APPLICATION_NAME} {RED}failed to deploy, please check logs for more details.{RESET}")
     LOGGER.error(f"App {YELLOW}{APPLICATION_NAME}{RESET} Data:\n{json.dumps(app, indent=2)}")
@@ -453,6 +728,60 @@ def application_url_provider(project_id):
     return app['endpoint']
 
 
+def current_image_reference(project_id):
+  try:
+    return CODE_ENGINE_SERVICE.get_app(
+        project_id=project_id,
+        name=APPLICATION_NAME
+    ).get_result().get('image_reference')
+  except ApiException:
+    return None
+
+
+def ready_app_url(project_id):
+  def fetch_app():
+    app = CODE_ENGINE_SERVICE.get_app(
+        project_id=project_id,
+        name=APPLICATION_NAME
+    ).get_result()
+    LOGGER.info(f"App {YELLOW}{APPLICATION_NAME}{RESET} Status: {BLUE}{str(app['status']).upper()}{RESET}")
+    if app['status'] == 'failed':
+      raise Exception(f'{RED}App {YELLOW}{APPLICATION_NAME}{RESET} failed to deploy{RESET}')
+    return app
+
+  app = poll_until(fetch_app, lambda app: app['status'] == 'ready' and app.get('endpoint'),
+                   f'the URL of app {APPLICATION_NAME}')
+  return app['endpoint']
+
+
+def smoke_test_gate(cli_args, project_id, app_url, env_vars, previous_image):
+  if not app_url:
+    # An app can settle as pending, before it has an endpoint to send the load to.
+    app_url = ready_app_url(project_id)
+  results, violations = smoke_test(
+      app_url, cli_args.smoke_path, cli_args.smoke_ids, cli_args.smoke_requests, cli_args.smoke_concurrency,
+      cli_args.smoke_max_p95_ms, cli_args.smoke_max_error_rate, cli_args.smoke_regression_factor,
+      cli_args.smoke_results_file
+  )
+  LOGGER.info(
+      f"Smoke test: {BLUE}{results['requests']}{RESET} requests, "
+      f"error rate {BLUE}{results['error_rate']:.2%}{RESET}, "
+      f"p50 {BLUE}{results['p50_ms']:.1f}ms{RESET}, p95 {BLUE}{results['p95_ms']:.1f}ms{RESET}, "
+      f"p99 {BLUE}{results['p99_ms']:.1f}ms{RESET}"
+  )
+  if not violations:
+    LOGGER.info(f'Smoke test {GREEN}passed{RESET}.')
+    return
+
+  for violation in violations:
+    LOGGER.error(f'{RED}Smoke test failed: {violation}{RESET}')
+  if previous_image:
+    LOGGER.warning(f'Rolling back app {YELLOW}{APPLICATION_NAME}{RESET} to image {YELLOW}{previous_image}{RESET}')
+    application_generator(project_id, env_vars, previous_image, scale_settings(cli_args))
+    application_url_provider(project_id)
+  raise Exception(f'{RED}Deployment rejected by the smoke test{RESET}')
+
+
 def update_yaml(app_url):
   updated_yaml = {}
   ce_server = {
@@ -480,25 +809,61 @@ def update_yaml(app_url):
     pass
 
 
-def main(cli_args):
-
-  authenticator_generator(cli_args)
-
-  code_engine_service_generator()
+def log_step_timings(start):
+  LOGGER.info('Deployment step timings:')
+  for step_name, elapsed in STEP_TIMINGS.items():
+    LOGGER.info(f'  {step_name:<24} {elapsed:>7.1f}s')
+  LOGGER.info(f'  {"total":<24} {time.monotonic() - start:>7.1f}s')
 
-  project = project_provider(cli_args)
 
-  registry_secret = registry_secret_provider(
-      cli_args=cli_args, project_id=project['id'])
-
-  build_generator(project_id=project['id'],
-                  registry_secret_name=registry_secret['name'])
-
-  build_run_generator(project_id=project['id'])
-
-  application_generator(project_id=project['id'])
+def main(cli_args):
+  global DEPLOY_DEADLINE
+  start = time.monotonic()
+  DEPLOY_DEADLINE = start + cli_args.timeout
 
-  app_url = application_url_provider(project_id=project['id'])
+  try:
+    with timed_step('authentication'):
+      authenticator_generator(cli_args)
+      code_engine_service_generator()
+
+    project = run_step('project', project_provider, cli_args=cli_args)
+
+    # The registry secret, environment config, build definition and source archive only depend on the project.
+    with ThreadPoolExecutor(max_workers=4) as executor:
+      registry_secret = executor.submit(
+          run_step, 'registry secret', registry_secret_provider, cli_args=cli_args, project_id=project['id'])
+      env_vars = executor.submit(
+          run_step, 'config map and secret', env_var_provider, project_id=project['id'])
+      build = executor.submit(
+          run_step, 'build', build_generator, project_id=project['id'], registry_secret_name=REGISTRY_SECRET_NAME)
+      source_file = executor.submit(run_step, 'source archive', source_tar_generator)
+
+      source_file, source_hash = source_file.result()
+      # Images and build runs are named after the source hash, so a succeeded run means the image already exists.
+      image_tag = source_hash[:IMAGE_TAG_LENGTH]
+      image_reference = f'{IMAGE_PATH}:{image_tag}'
+      build_run_name = f'{BUILD_RUN_NAME}-{image_tag}'
+
+      registry_secret.result()
+      build.result()
+
+      if build_run_succeeded(project['id'], build_run_name):
+        LOGGER.info(f'Sources unchanged, reusing image {YELLOW}{image_reference}{RESET} and skipping the build run.')
+      else:
+        run_step('build run', build_run_generator, project_id=project['id'], source_file=source_file,
+                 build_run_name=build_run_name, image_reference=image_reference)
+
+      previous_image = current_image_reference(project['id'])
+      run_step('application', application_generator, project_id=project['id'], env_vars=env_vars.result(),
+               image_reference=image_reference, scale=scale_settings(cli_args))
+
+    app_url = run_step('application ready', application_url_provider, project_id=project['id'])
+
+    if cli_args.smoke_test:
+      run_step('smoke test', smoke_test_gate, cli_args=cli_args, project_id=project['id'], app_url=app_url,
+               env_vars=env_vars.result(), previous_image=previous_image if previous_image != image_reference else None)
+  finally:
+    log_step_timings(start)
 
   if str(app_url).startswith('https'):
     update_yaml(app_url)
@@ -517,15 +882,30 @@ if __name__ == '__main__':
   CM_FILE_NAME = 'database-props'
   BUILD_SPEC_FILE_NAME = 'Procfile'
   SOURCE_FILE_NAME = 'source.tar.gz'
+  CE_IGNORE_FILE_NAME = '.ceignore'
+  DEFAULT_IGNORE_PATTERNS = ['__pycache__/', '*.py[cod]']
+  SOURCE_DATE_EPOCH = 315532800
+  IMAGE_TAG_LENGTH = 16
+  CONFIG_HASH_ENV_NAME = 'DEPLOY_CONFIG_HASH'
+  CONFIG_HASH_LENGTH = 16
+  CONFIG_HASH_SALT_KEY = 'DEPLOY_CONFIG_HASH_SALT'
+  CONFIG_HASH_SALT_BYTES = 32
   DEFAULT_IAM_URL = 'https://iam.cloud.ibm.com'
+  DEFAULT_RESOURCE_MANAGER_URL = 'https://resource-controller.cloud.ibm.com'
   FILE_DIR = os.path.dirname(os.path.abspath(__file__))
-  CODE_ENGINE_URL = 'https://api.us-south.codeengine.cloud.ibm.com/v2'
+  DEFAULT_CODE_ENGINE_URL = 'https://api.us-south.codeengine.cloud.ibm.com/v2'
+  DEFAULT_DEPLOY_TIMEOUT = 1800
+  POLL_INITIAL_DELAY = 1
+  POLL_MAX_DELAY = 15
+  POLL_BACKOFF_FACTOR = 1.5
 
   cli_args = cli_args_config()
   LOG_LEVEL = cli_args.log_level
   log_config()
 
   IBM_IAM_URL = cli_args.ibm_iam_url
+  RESOURCE_MANAGER_URL = cli_args.resource_manager_url
+  CODE_ENGINE_URL = cli_args.code_engine_url
   CODE_ENGINE_PROJECT_NAME = cli_args.ce_project_name
   CONFIG_MAP_NAME = f"{CODE_ENGINE_PROJECT_NAME}-cm"
   SECRET_MAP_NAME = f"{CODE_ENGINE_PROJECT_NAME}-sm"
@@ -0,0 +1,156 @@
+import os
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+# A database-backed route, so the run goes through the pool, the caches and Postgres.
+DEFAULT_PATH = '/users/{userId}'
+DEFAULT_REQUESTS = 200
+DEFAULT_WARMUP_REQUESTS = 10
+DEFAULT_CONCURRENCY = 10
+DEFAULT_REQUEST_TIMEOUT = 10
+DEFAULT_MAX_ERROR_RATE = 0.01
+DEFAULT_REGRESSION_FACTOR = 1.5
+DEFAULT_RESULTS_FILE = '.deploy-smoke-results.json'
+
+
+def percentile(sorted_values, fraction):
+  if not sorted_values:
+    return None
+  rank = max(1, math.ceil(fraction * len(sorted_values)))
+  return sorted_values[rank - 1]
+
+
+def path_placeholder(path_template):
+  return path_template[path_template.find('{'):path_template.find('}') + 1] if '{' in path_template else None
+
+
+def parse_ids(ids):
+  return [i.strip() for i in (ids or '').split(',') if i.strip()]
+
+
+def check_smoke_test_arguments(parser, path, ids, prefix=''):
+  if path_placeholder(path) and not parse_ids(ids):
+    parser.error(f'--{prefix}ids is required to fill the placeholder of --{prefix}path {path}')
+
+
+def run_load(base_url, path_template, ids, request_count, concurrency,
+             warmup_requests=DEFAULT_WARMUP_REQUESTS, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+  sessions = threading.local()
+  placeholder = path_placeholder(path_template)
+  if placeholder and not ids:
+    raise ValueError(f'Path {path_template} has a placeholder, but no IDs were given to fill it')
+
+  def send(_):
+    if not hasattr(sessions, 'session'):
+      sessions.session = requests.Session()
+    path = path_template.replace(placeholder, str(random.choice(ids))) if placeholder else path_template
+    start = time.perf_counter()
+    try:
+      response = sessions.session.get(base_url.rstrip('/') + path, timeout=request_timeout)
+      failed = response.status_code >= 400
+    except requests.RequestException:
+      failed = True
+    return (time.perf_counter() - start) * 1000, failed
+
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    # Warm-up requests absorb cold starts and are not counted.
+    list(executor.map(send, range(warmup_requests)))
+    samples = list(executor.map(send, range(request_count)))
+
+  latencies = sorted(latency for latency, _ in samples)
+  errors = sum(1 for _, failed in samples if failed)
+  return {
+      'requests': len(samples),
+      'errors': errors,
+      'error_rate': errors / len(samples) if samples else 0.0,
+      'p50_ms': percentile(latencies, 0.50),
+      'p95_ms': percentile(latencies, 0.95),
+      'p99_ms': percentile(latencies, 0.99),
+      'max_ms': latencies[-1] if latencies else None,
+  }
+
+
+def evaluate(results, max_p95_ms=None, max_error_rate=DEFAULT_MAX_ERROR_RATE,
+             baseline=None, regression_factor=DEFAULT_REGRESSION_FACTOR):
+  violations = []
+  if results['error_rate'] > max_error_rate:
+    violations.append(f"error rate {results['error_rate']:.2%} exceeds {max_error_rate:.2%}")
+  if max_p95_ms is not None and results['p95_ms'] > max_p95_ms:
+    violations.append(f"p95 latency {results['p95_ms']:.1f}ms exceeds {max_p95_ms:.1f}ms")
+  if baseline and baseline.get('p95_ms') and results['p95_ms'] > baseline['p95_ms'] * regression_factor:
+    violations.append(
+        f"p95 latency {results['p95_ms']:.1f}ms is more than {regression_factor}x "
+        f"the previous deploy's {baseline['p95_ms']:.1f}ms"
+    )
+  return violations
+
+
+def load_baseline(file_path):
+  if not os.path.exists(file_path):
+    return None
+  with open(file_path, 'r') as file:
+    return json.load(file)
+
+
+def save_results(file_path, results):
+  with open(file_path, 'w') as file:
+    json.dump(results, file, indent=2)
+
+
+def add_smoke_test_arguments(parser, prefix=''):
+  parser.add_argument(f'--{prefix}path', type=str, default=DEFAULT_PATH,
+                      help='Path to request, the {placeholder} is filled with a sampled ID')
+  parser.add_argument(f'--{prefix}ids', type=str, default=None,
+                      help='Comma separated IDs to sample for the path placeholder, required when it has one')
+  parser.add_argument(f'--{prefix}requests', type=int, default=DEFAULT_REQUESTS,
+                      help='Number of measured requests')
+  parser.add_argument(f'--{prefix}concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                      help='Number of concurrent clients')
+  parser.add_argument(f'--{prefix}max_p95_ms', type=float, default=None,
+                      help='Fail when p95 latency exceeds this many milliseconds')
+  parser.add_argument(f'--{prefix}max_error_rate', type=float, default=DEFAULT_MAX_ERROR_RATE,
+                      help='Fail when the fraction of failed requests exceeds this')
+  parser.add_argument(f'--{prefix}regression_factor', type=float, default=DEFAULT_REGRESSION_FACTOR,
+                      help="Fail when p95 latency exceeds the previous run's by this factor")
+  parser.add_argument(f'--{prefix}results_file', type=str, default=DEFAULT_RESULTS_FILE,
+                      help='Where results are stored as the baseline for the next run')
+
+
+def smoke_test(base_url, path, ids, request_count, concurrency, max_p95_ms, max_error_rate,
+               regression_factor, results_file):
+  """Drive load against base_url; return (results, violations) and store passing results as the new baseline."""
+  baseline = load_baseline(results_file)
+  results = run_load(base_url, path, parse_ids(ids), request_count, concurrency)
+  violations = evaluate(results, max_p95_ms, max_error_rate, baseline, regression_factor)
+  if not violations:
+    save_results(results_file, results)
+  return results, violations
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Post-deploy performance smoke test')
+  parser.add_argument('base_url', type=str, help='Base URL of the server, e.g. http://localhost:8080')
+  add_smoke_test_arguments(parser)
+  args = parser.parse_args()
+  check_smoke_test_arguments(parser, args.path, args.ids)
+  logging.basicConfig(level=logging.INFO)
+
+  results, violations = smoke_test(args.base_url, args.path, args.ids, args.requests, args.concurrency,
+                                   args.max_p95_ms, args.max_error_rate, args.regression_factor, args.results_file)
+  LOGGER.info(f'Smoke test results: {json.dumps(results)}')
+  for violation in violations:
+    LOGGER.error(violation)
+  raise SystemExit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+  main()
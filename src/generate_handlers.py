@@ -0,0 +1,431 @@
+import argparse
+import re
+import yaml
+from typing import Optional
+
+METHODS = ['get', 'post', 'put', 'delete']
+STATUS_CODES = {"get": 200, "post": 201, "put": 200, "delete": 204}
+PYTHON_TYPES = {"integer": "int", "number": "float", "boolean": "bool", "string": "str"}
+DEFAULT_OUTPUT = './src/openapi_server/apis/specialized_api.py'
+
+HEADER = '''# coding: utf-8
+# Generated by src/generate_handlers.py from {spec_file}. Do not edit by hand, regenerate instead.
+
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Body, HTTPException, Path, Query, Request, Response
+from psycopg2.extras import RealDictCursor
+
+from openapi_server.db.database import (
+    DB_CACHE_TTL_SECONDS,
+    IDEMPOTENCY_KEY_HEADER,
+    count_rows,
+    db_session,
+    group_committer,
+    invalidate_cached_rows,
+    key_filters,
+    read_with_snapshot,
+    row_cache,
+    run_with_deadline,
+    with_idempotency,
+)
+from openapi_server.db.idempotency import record_result
+from openapi_server.db.shared_cache import row_cache_key, table_cache_key
+{model_imports}
+
+router = APIRouter(include_in_schema=False)
+'''
+
+
+class CodegenError(Exception):
+    pass
+
+
+def snake_case(name: str) -> str:
+    name = re.sub(r'[^0-9a-zA-Z]+', '_', name)
+    name = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', name)
+    return name.strip('_').lower()
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def load_spec(file_path: str) -> dict:
+    with open(file_path, 'r') as spec_file:
+        return yaml.load(spec_file, Loader=yaml.CLoader)
+
+
+def load_table_mapping(file_path: str) -> dict:
+    if not file_path:
+        return {}
+    with open(file_path, 'r') as mapping_file:
+        mapping = yaml.safe_load(mapping_file) or {}
+    return {key.lower(): value for key, value in mapping.items()}
+
+
+def resolve_ref(spec: dict, schema: dict) -> tuple:
+    ref = schema.get("$ref")
+    if not ref:
+        return None, schema
+    name = ref.rsplit("/", 1)[-1]
+    try:
+        return name, spec["components"]["schemas"][name]
+    except KeyError:
+        raise CodegenError(f"Unresolvable schema reference '{ref}'")
+
+
+def json_schema(container: dict) -> Optional[dict]:
+    content = (container or {}).get("content", {})
+    media = content.get("application/json")
+    return media.get("schema") if media else None
+
+
+def response_schema(spec: dict, operation: dict, method: str) -> tuple:
+    responses = operation.get("responses", {})
+    response = responses.get(str(STATUS_CODES[method])) or responses.get(STATUS_CODES[method])
+    schema = json_schema(response) if response else None
+    if schema is None:
+        return None, None, False
+    if schema.get("type") == "array":
+        name, resolved = resolve_ref(spec, schema.get("items", {}))
+        return name, resolved, True
+    name, resolved = resolve_ref(spec, schema)
+    return name, resolved, False
+
+
+def table_for(operation: dict, path_item: dict, mapping: dict, method: str, path: str) -> Optional[tuple]:
+    table = operation.get("x-table") or path_item.get("x-table") or mapping.get(f"{method} {path}".lower())
+    if not table:
+        return None
+    schema, _, table_name = table.rpartition(".")
+    if not schema or not table_name:
+        raise CodegenError(f"Table for {method.upper()} {path} must be given as 'schema.table', got '{table}'")
+    return schema, table_name
+
+
+class Operation:
+    def __init__(self, spec: dict, path: str, method: str, operation: dict, schema: str, table: str):
+        self.path = path
+        self.method = method
+        self.schema = schema
+        self.table = table
+        self.name = snake_case(operation.get("operationId") or f"{path}_{method}")
+        self.constant = self.name.upper() + "_SQL"
+        self.path_params = []
+        self.query_params = []
+        for parameter in operation.get("parameters", []) + spec["paths"][path].get("parameters", []):
+            _, parameter = resolve_ref(spec, parameter) if "$ref" in parameter else (None, parameter)
+            entry = {
+                "name": parameter["name"],
+                "variable": snake_case(parameter["name"]),
+                "column": parameter.get("x-column") or snake_case(parameter["name"]),
+                "type": PYTHON_TYPES.get(parameter.get("schema", {}).get("type"), "str"),
+            }
+            if parameter.get("in") == "path":
+                self.path_params.append(entry)
+            elif parameter.get("in") == "query":
+                self.query_params.append(entry)
+        self.model, model_schema, self.is_list = response_schema(spec, operation, method)
+        self.columns = list((model_schema or {}).get("properties", {}))
+        self.body_model, self.body_columns = None, []
+        body_schema = json_schema(operation.get("requestBody"))
+        if body_schema:
+            self.body_model, resolved = resolve_ref(spec, body_schema)
+            self.body_columns = list(resolved.get("properties", {}))
+        self.countable = method == "get" and self.is_list and operation.get("x-count", True)
+        if method in ("post", "put") and not (self.body_model and self.body_columns):
+            raise CodegenError(f"{method.upper()} {path} needs a JSON request body with a named schema")
+        if method in ("put", "delete") and not self.path_params:
+            raise CodegenError(f"{method.upper()} {path} needs path parameters to identify the rows")
+
+    @property
+    def table_sql(self) -> str:
+        return f"{quote_identifier(self.schema)}.{quote_identifier(self.table)}"
+
+    def where_sql(self) -> tuple:
+        filters = [f"{quote_identifier(p['column'])} = %s" for p in self.path_params]
+        values = [p["variable"] for p in self.path_params]
+        for parameter in self.query_params:
+            filters.append(f"(%s IS NULL OR {quote_identifier(parameter['column'])} = %s)")
+            values += [parameter["variable"], parameter["variable"]]
+        return (" WHERE " + " AND ".join(filters) if filters else ""), values
+
+    def statement(self) -> tuple:
+        where, values = self.where_sql()
+        if self.method == "get":
+            columns = ", ".join(map(quote_identifier, self.columns)) or "*"
+            return f"SELECT {columns} FROM {self.table_sql}{where}", values
+        if self.method == "post":
+            columns = ", ".join(map(quote_identifier, self.body_columns))
+            placeholders = ", ".join("%s" for _ in self.body_columns)
+            values = [f"body_values[{column!r}]" for column in self.body_columns]
+            # Writes return whole rows so the key filter sees the key column even when the model lacks it.
+            return f"INSERT INTO {self.table_sql} ({columns}) VALUES ({placeholders}) RETURNING *", values
+        if self.method == "put":
+            updates = ", ".join(f"{quote_identifier(column)} = %s" for column in self.body_columns)
+            values = [f"body_values[{column!r}]" for column in self.body_columns] + values
+            return f"UPDATE {self.table_sql} SET {updates}{where} RETURNING *", values
+        return f"DELETE FROM {self.table_sql}{where} RETURNING 1", values
+
+
+def render_serializer(operation: Operation) -> list:
+    if not operation.columns:
+        return []
+    if operation.method == "get":
+        fields = ", ".join(f'"{column}": row[{index}]' for index, column in enumerate(operation.columns))
+    else:
+        # Write rows come from RETURNING * through a RealDictCursor, so fields are picked by name.
+        fields = ", ".join(f'"{column}": row["{column}"]' for column in operation.columns)
+    return [
+        "",
+        "",
+        f"def _serialize_{operation.name}(row) -> Dict[str, Any]:",
+        f"    return {{{fields}}}",
+    ]
+
+
+def render_idempotent_handler(operation: Operation, arguments: list) -> list:
+    path_values = ", ".join(f'"{p["column"]}": {p["variable"]}' for p in operation.path_params)
+    fingerprint = f'("{operation.schema}", "{operation.table}", "{operation.method}", {{{path_values}}}, body.model_dump(by_alias=True))'
+    return [
+        "",
+        "",
+        f"def {operation.name}_handler({', '.join(arguments + ['deadline=None', 'canceller=None', 'idempotency_key=None'])}):",
+        "    return with_idempotency(",
+        "        idempotency_key,",
+        f"        {fingerprint},",
+        f"        lambda: _{operation.name}({', '.join(arguments + ['deadline', 'canceller'])}),",
+        "        deadline",
+        "    )",
+    ]
+
+
+def render_handler(operation: Operation) -> list:
+    statement, values = operation.statement()
+    arguments = [p["variable"] for p in operation.path_params + operation.query_params]
+    if operation.body_model:
+        arguments.append("body")
+    values_tuple = "(" + ", ".join(values) + ("," if len(values) == 1 else "") + ")"
+    serializer = f"_serialize_{operation.name}"
+    table_args = f'"{operation.schema}", "{operation.table}"'
+    idempotent = operation.method in ("post", "put")
+    function_name = f"_{operation.name}" if idempotent else f"{operation.name}_handler"
+    lines = [
+        "",
+        "",
+        f"{operation.constant} = {statement!r}",
+        *render_serializer(operation),
+        *(render_idempotent_handler(operation, arguments) if idempotent else []),
+        "",
+        "",
+        f"def {function_name}({', '.join(arguments + ['deadline=None', 'canceller=None'])}):",
+    ]
+    if operation.method == "get":
+        cache_params = ", ".join(f'"{p["column"]}": {p["variable"]}' for p in operation.path_params + operation.query_params)
+        if not operation.is_list:
+            call_arguments = ", ".join(arguments + ["deadline", "canceller"])
+            lines += [
+                f"    if key_filters and key_filters.definitely_missing({table_args}, {{{cache_params}}}):",
+                '        raise HTTPException(status_code=404, detail="No records found")',
+                f"    lookup = {{key: value for key, value in {{{cache_params}}}.items() if value is not None}}",
+                f"    return read_with_snapshot({table_args}, lookup, lambda: _{operation.name}_query({call_arguments}))",
+                "",
+                "",
+                f"def _{operation.name}_query({', '.join(arguments + ['deadline=None', 'canceller=None'])}):",
+            ]
+        lines += [
+            "    cache_key = None",
+            "    if row_cache:",
+            f"        cache_key = row_cache_key({table_args}, {{{cache_params}}})",
+            "        cached = row_cache.get(cache_key)",
+            "        if cached is not None:",
+            "            return json.loads(cached)",
+            f"        cache_generation = row_cache.generation(table_cache_key({table_args}))",
+            "    with db_session(deadline, canceller) as (conn, cursor):",
+            f"        cursor.execute({operation.constant}, {values_tuple})",
+        ]
+        if operation.is_list:
+            lines += [
+                "        rows = cursor.fetchall()",
+                f"    result = [{serializer}(row) for row in rows]" if operation.columns else "    result = rows",
+            ]
+        else:
+            lines += [
+                "        row = cursor.fetchone()",
+                "    if row is None:",
+                '        raise HTTPException(status_code=404, detail="No records found")',
+                f"    result = {serializer}(row)" if operation.columns else "    result = row",
+            ]
+        lines += [
+            "    if cache_key:",
+            f"        row_cache.set(cache_key, table_cache_key({table_args}), json.dumps(result, default=str).encode(), DB_CACHE_TTL_SECONDS, cache_generation)",
+            "    return result",
+        ]
+        return lines
+    if operation.body_model:
+        lines.append("    body_values = body.model_dump(by_alias=True)")
+    # The response is stored for the Idempotency-Key in the write's own transaction, so it is built before the commit.
+    response = f"{serializer}(rows[0])" if operation.columns else "None"
+    if operation.method == "post":
+        respond = serializer if operation.columns else "lambda row: None"
+        lines += [
+            "    if group_committer:",
+            f"        rows = [group_committer.submit({table_args}, body_values, deadline, {respond})]",
+            "    else:",
+            "        with db_session(deadline, canceller, RealDictCursor) as (conn, cursor):",
+            f"            cursor.execute({operation.constant}, {values_tuple})",
+            "            rows = cursor.fetchall()",
+            f"            record_result(cursor, {response} if rows else None)",
+            "            conn.commit()",
+            f"        invalidate_cached_rows({table_args})",
+        ]
+    elif operation.method == "put":
+        lines += [
+            "    with db_session(deadline, canceller, RealDictCursor) as (conn, cursor):",
+            f"        cursor.execute({operation.constant}, {values_tuple})",
+            "        rows = cursor.fetchall()",
+            "        if rows:",
+            f"            record_result(cursor, {response})",
+            "        conn.commit()",
+            f"    invalidate_cached_rows({table_args})",
+        ]
+    else:
+        lines += [
+            "    with db_session(deadline, canceller) as (conn, cursor):",
+            f"        cursor.execute({operation.constant}, {values_tuple})",
+            "        rows = cursor.fetchall()",
+            "        conn.commit()",
+            f"    invalidate_cached_rows({table_args})",
+        ]
+    if operation.method in ("post", "put"):
+        lines += [
+            "    if key_filters:",
+            f"        key_filters.add_rows({table_args}, rows)",
+        ]
+    if operation.method == "delete":
+        lines += [
+            "    if not rows:",
+            '        raise HTTPException(status_code=404, detail="No records found to delete.")',
+            "    return len(rows)",
+        ]
+    elif operation.method == "put":
+        lines += [
+            "    if not rows:",
+            '        raise HTTPException(status_code=404, detail="No records found to update.")',
+            f"    return {serializer}(rows[0])" if operation.columns else "    return None",
+        ]
+    else:
+        lines.append(f"    return {serializer}(rows[0]) if rows else None" if operation.columns else "    return None")
+    return lines
+
+
+def render_route(operation: Operation) -> list:
+    response_model = operation.model and (f"List[{operation.model}]" if operation.is_list else operation.model)
+    decorator_args = [f'"{operation.path}"', f"status_code={STATUS_CODES[operation.method]}"]
+    if response_model and operation.method != "delete":
+        decorator_args.append(f"response_model={response_model}")
+    parameters = ["    request: Request,"]
+    for parameter in operation.path_params:
+        parameters.append(f'    {parameter["variable"]}: {parameter["type"]} = Path(..., alias="{parameter["name"]}"),')
+    for parameter in operation.query_params:
+        parameters.append(
+            f'    {parameter["variable"]}: Optional[{parameter["type"]}] = Query(None, alias="{parameter["name"]}"),'
+        )
+    if operation.body_model:
+        parameters.append(f"    body: {operation.body_model} = Body(...),")
+    arguments = ", ".join(["request", f"{operation.name}_handler"] + [p["variable"] for p in operation.path_params + operation.query_params] + (["body"] if operation.body_model else []))
+    if operation.method in ("post", "put"):
+        arguments += ", idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER)"
+    lines = [
+        "",
+        "",
+        f"@router.{operation.method}({', '.join(decorator_args)})",
+        f"async def {operation.name}(",
+        *parameters,
+        "):",
+    ]
+    if operation.method == "delete":
+        lines += [
+            f"    await run_with_deadline({arguments})",
+            "    return Response(status_code=204)",
+        ]
+    else:
+        lines.append(f"    return await run_with_deadline({arguments})")
+    return lines
+
+
+def render_count_route(operation: Operation) -> list:
+    parameters = ["    request: Request,"]
+    for parameter in operation.path_params:
+        parameters.append(f'    {parameter["variable"]}: {parameter["type"]} = Path(..., alias="{parameter["name"]}"),')
+    for parameter in operation.query_params:
+        parameters.append(
+            f'    {parameter["variable"]}: Optional[{parameter["type"]}] = Query(None, alias="{parameter["name"]}"),'
+        )
+    parameters.append('    count_mode: str = Query("auto", alias="mode", pattern="^(exact|estimate|auto)$"),')
+    filters = ", ".join(f'"{p["column"]}": {p["variable"]}' for p in operation.path_params + operation.query_params)
+    return [
+        "",
+        "",
+        f'@router.get("{operation.path.rstrip("/")}/count")',
+        f"async def {operation.name}_count(",
+        *parameters,
+        ") -> Dict[str, Any]:",
+        f'    return await run_with_deadline(request, count_rows, "{operation.schema}", "{operation.table}", {{{filters}}}, count_mode)',
+    ]
+
+
+def collect_operations(spec: dict, mapping: dict) -> list:
+    operations = []
+    for path, path_item in spec.get("paths", {}).items():
+        for method in METHODS:
+            operation = path_item.get(method)
+            if not operation:
+                continue
+            table = table_for(operation, path_item, mapping, method, path)
+            if table:
+                operations.append(Operation(spec, path, method, operation, *table))
+    return operations
+
+
+def generate_module(spec: dict, mapping: dict, spec_file: str) -> tuple:
+    operations = collect_operations(spec, mapping)
+    models = sorted({name for op in operations for name in (op.model, op.body_model) if name})
+    model_imports = "\n".join(f"from openapi_server.models.{snake_case(name)} import {name}" for name in models)
+    lines = [HEADER.format(spec_file=spec_file, model_imports=model_imports).rstrip("\n")]
+    # Count routes go first so '/items/count' is not captured by an '/items/{id}' route.
+    for operation in operations:
+        if operation.countable:
+            lines += render_count_route(operation)
+    for operation in operations:
+        lines += render_handler(operation)
+        lines += render_route(operation)
+    return "\n".join(lines) + "\n", len(operations)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate specialised handlers for OpenAPI operations mapped to database tables"
+    )
+    parser.add_argument("--spec_file", default='./openapi.yaml', help="OpenAPI file to read")
+    parser.add_argument(
+        "--table_mapping",
+        default=None,
+        help="YAML file mapping '<method> <path>' to 'schema.table', for operations without an x-table extension"
+    )
+    parser.add_argument("--output_file", default=DEFAULT_OUTPUT, help="Module to write")
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec_file)
+    source, count = generate_module(spec, load_table_mapping(args.table_mapping), args.spec_file)
+    if not count:
+        raise CodegenError("No operations are mapped to a table; add x-table extensions or a --table_mapping file")
+    with open(args.output_file, 'w') as output:
+        output.write(source)
+    print(f"{count} specialised handlers saved to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from openapi_server.db.database import get_optional_config_value, key_filters, snapshot_store
+from openapi_server.profiler import ProfilerGate, SamplingProfiler
+from openapi_server.security_api import get_admin_token
+
+PROFILE_MAX_SECONDS = float(get_optional_config_value("PROFILE_MAX_SECONDS", "30"))
+PROFILE_COOLDOWN_SECONDS = float(get_optional_config_value("PROFILE_COOLDOWN_SECONDS", "60"))
+
+profiler_gate = ProfilerGate(PROFILE_COOLDOWN_SECONDS)
+
+router = APIRouter(prefix="/admin", include_in_schema=False, dependencies=[Depends(get_admin_token)])
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(10, gt=0, description="How long to sample"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="Time between samples"),
+    include_idle: bool = Query(False, description="Also count threads blocked in wait/select"),
+    format: str = Query("json", pattern="^(json|collapsed)$", description="json, or collapsed stacks as text"),
+    top: int = Query(25, ge=1, le=500, description="Number of top functions to return"),
+) -> Response:
+    if seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must not exceed {PROFILE_MAX_SECONDS}")
+    retry_after = profiler_gate.acquire()
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="A profile is running or finished too recently",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+    try:
+        profiler = SamplingProfiler(interval_ms / 1000, include_idle)
+        # Sampling runs on its own thread, so the event loop keeps serving traffic meanwhile.
+        await run_in_threadpool(profiler.run, seconds)
+    finally:
+        profiler_gate.release()
+
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return {
+        "seconds": seconds,
+        "interval_ms": interval_ms,
+        "samples": profiler.samples,
+        "top": profiler.top_functions(top),
+        "collapsed": profiler.collapsed(),
+    }
+
+
+@router.get("/key-filters")
+async def key_filter_stats() -> dict:
+    return key_filters.stats() if key_filters else {}
+
+
+@router.get("/snapshots")
+async def snapshot_stats() -> dict:
+    return snapshot_store.stats() if snapshot_store else {}
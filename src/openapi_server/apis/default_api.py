@@ -16,7 +16,7 @@ from fastapi import (
     status,
 )
 
-from openapi_server.db.database import db_operation_handler
+from openapi_server.db.database import run_db_operation
 
 from pydantic import StrictInt
 from openapi_server.models.user import User
@@ -33,23 +33,27 @@ router = APIRouter()
     response_model_by_alias=True
 )
 async def users_user_id_get(
+    request: Request,
     response: Response,
     userId: int = Path(..., description=""),
 ) -> User:
 
     schema_name = ""
     table_name = ""
+    timeout_ms = None
     if not schema_name or not table_name:
         raise HTTPException(status_code=501, detail="Schema name and/or Table name not implemented")
     path_params = {
         "user_id": userId
     }
-    db_result = db_operation_handler(
+    db_result = await run_db_operation(
+        request,
         schema_name, 
         table_name,
         "get",
         body_params=None,
-        path_params=path_params
+        path_params=path_params,
+        default_timeout_ms=timeout_ms
     )
     response.status_code = get_status_code("get")
     return return_type_handler("User", db_result)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Request, Response
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+
+OPENAPI_JSON_URL = "/openapi.json"
+OPENAPI_YAML_URL = "/openapi.yaml"
+
+router = APIRouter(include_in_schema=False)
+
+
+@router.get(OPENAPI_JSON_URL)
+async def openapi_json(request: Request) -> Response:
+    return request.app.state.openapi_document.json.response(request)
+
+
+@router.get(OPENAPI_YAML_URL)
+async def openapi_yaml(request: Request) -> Response:
+    return request.app.state.openapi_document.yaml.response(request)
+
+
+@router.get("/docs")
+async def swagger_ui(request: Request) -> Response:
+    return get_swagger_ui_html(openapi_url=OPENAPI_JSON_URL, title=f"{request.app.title} - Swagger UI")
+
+
+@router.get("/redoc")
+async def redoc(request: Request) -> Response:
+    return get_redoc_html(openapi_url=OPENAPI_JSON_URL, title=f"{request.app.title} - ReDoc")
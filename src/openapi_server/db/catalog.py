@@ -0,0 +1,40 @@
+from typing import Dict, Optional, Tuple
+
+COLUMN_TYPES_SQL = (
+    "SELECT a.attname, format_type(a.atttypid, a.atttypmod) "
+    "FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "WHERE n.nspname = %s AND c.relname = %s AND a.attnum > 0 AND NOT a.attisdropped"
+)
+PRIMARY_KEY_SQL = (
+    "SELECT a.attname "
+    "FROM pg_index i JOIN pg_class c ON c.oid = i.indrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+    "WHERE n.nspname = %s AND c.relname = %s AND i.indisprimary"
+)
+
+
+def parse_table_columns(value: str) -> Dict[Tuple[str, str], Optional[str]]:
+    """Parses 'schema.table[:column],...' into {(schema, table): column}; the column is None when omitted."""
+    tables = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, _, column = entry.partition(":")
+        schema, _, table = name.partition(".")
+        if not schema or not table:
+            raise ValueError(f"Table must be given as 'schema.table[:column]', got '{entry}'")
+        tables[(schema, table)] = column or None
+    return tables
+
+
+def column_types(conn, schema: str, table: str) -> Dict[str, str]:
+    """Returns {column: SQL type name} for a table, e.g. {'id': 'integer', 'name': 'character varying(64)'}."""
+    with conn.cursor() as cursor:
+        cursor.execute(COLUMN_TYPES_SQL, (schema, table))
+        return dict(cursor.fetchall())
+
+
+def primary_key_column(conn, schema: str, table: str) -> Optional[str]:
+    """Returns the table's primary key column, or None when it has no primary key or a composite one."""
+    with conn.cursor() as cursor:
+        cursor.execute(PRIMARY_KEY_SQL, (schema, table))
+        columns = [column for (column,) in cursor.fetchall()]
+    return columns[0] if len(columns) == 1 else None
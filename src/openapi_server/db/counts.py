@@ -0,0 +1,139 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from psycopg2 import sql
+
+COUNT_MODES = ("exact", "estimate", "auto")
+
+# Scales reltuples, which is only refreshed by VACUUM/ANALYZE, by how much the table grew since,
+# which is what the planner does for an unfiltered scan. NULL when the table was never analysed.
+ESTIMATE_TABLE_SQL = (
+    "SELECT CASE WHEN c.reltuples < 0 THEN NULL "
+    "WHEN c.relpages = 0 THEN c.reltuples "
+    "ELSE c.reltuples / c.relpages * (pg_relation_size(c.oid) / current_setting('block_size')::int) END "
+    "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "WHERE n.nspname = %s AND c.relname = %s"
+)
+
+
+def where_clause(filters: Dict[str, Any]) -> tuple:
+    if not filters:
+        return sql.SQL(""), []
+    conditions = [sql.SQL("{} = %s").format(sql.Identifier(column)) for column in filters]
+    return sql.SQL("WHERE {}").format(sql.SQL(" AND ").join(conditions)), list(filters.values())
+
+
+class RowCounter:
+    """Counts the rows of a table matching equality filters, exactly or from planner statistics.
+
+    ``exact`` runs ``COUNT(*)`` and keeps the result for ``ttl`` seconds or until the
+    table is invalidated. A count that was running when its table was invalidated
+    is returned but not kept. ``estimate`` never scans: unfiltered counts come from
+    ``pg_class.reltuples`` and filtered ones from the row estimate of ``EXPLAIN``.
+    ``auto`` estimates first and only counts exactly when the estimate is below
+    ``exact_threshold``, where a scan is cheap and an estimate is most misleading.
+    """
+
+    def __init__(self, session_factory: Callable, ttl: float, exact_threshold: int, max_entries: int = 10000):
+        self._session_factory = session_factory
+        self._ttl = ttl
+        self._exact_threshold = exact_threshold
+        self._max_entries = max_entries
+        self._exact_counts = {}
+        self._epoch = 0
+        self._generations: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def count(
+        self,
+        schema: str,
+        table: str,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "auto",
+        deadline: Optional[float] = None,
+        canceller=None
+    ) -> Dict[str, Any]:
+        if mode not in COUNT_MODES:
+            raise HTTPException(status_code=400, detail=f"Count mode must be one of {', '.join(COUNT_MODES)}.")
+        filters = {column: value for column, value in (filters or {}).items() if value is not None}
+        key = (schema, table, tuple(sorted(filters.items(), key=lambda item: item[0])))
+        if mode != "estimate":
+            cached = self._cached(key)
+            if cached is not None:
+                return {"count": cached, "exact": True}
+            # Read before the query, so an invalidation that lands while it runs makes the count uncacheable.
+            generation = self._generation(schema, table)
+
+        with self._session_factory(deadline, canceller) as (conn, cursor):
+            if mode != "exact":
+                estimate = self._estimate(cursor, schema, table, filters)
+                if mode == "estimate" or estimate >= self._exact_threshold:
+                    return {"count": estimate, "exact": False}
+            clause, values = where_clause(filters)
+            cursor.execute(
+                sql.SQL("SELECT COUNT(*) FROM {table} {where}").format(
+                    table=sql.Identifier(schema, table), where=clause
+                ),
+                values
+            )
+            count = cursor.fetchone()[0]
+        self._remember(key, count, generation)
+        return {"count": count, "exact": True}
+
+    def invalidate(self, schema: Optional[str], table: Optional[str]):
+        with self._lock:
+            if table is None:
+                self._epoch += 1
+                self._exact_counts.clear()
+                return
+            self._generations[(schema, table)] = self._generations.get((schema, table), 0) + 1
+            for key in [key for key in self._exact_counts if key[:2] == (schema, table)]:
+                del self._exact_counts[key]
+
+    def _estimate(self, cursor, schema: str, table: str, filters: Dict[str, Any]) -> int:
+        if not filters:
+            cursor.execute(ESTIMATE_TABLE_SQL, (schema, table))
+            row = cursor.fetchone()
+            if row is None:
+                raise HTTPException(status_code=404, detail=f"Table {schema}.{table} not found")
+            if row[0] is not None:
+                return int(row[0])
+        clause, values = where_clause(filters)
+        cursor.execute(
+            sql.SQL("EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} {where}").format(
+                table=sql.Identifier(schema, table), where=clause
+            ),
+            values
+        )
+        plan = cursor.fetchone()[0]
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def _generation(self, schema: str, table: str) -> tuple:
+        with self._lock:
+            return self._epoch, self._generations.get((schema, table), 0)
+
+    def _cached(self, key: tuple) -> Optional[int]:
+        with self._lock:
+            entry = self._exact_counts.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._exact_counts[key]
+                return None
+            return entry[0]
+
+    def _remember(self, key: tuple, count: int, generation: tuple):
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            if (self._epoch, self._generations.get(key[:2], 0)) != generation:
+                return
+            now = time.monotonic()
+            if len(self._exact_counts) >= self._max_entries:
+                for stale in [k for k, entry in self._exact_counts.items() if entry[1] < now]:
+                    del self._exact_counts[stale]
+                if len(self._exact_counts) >= self._max_entries:
+                    self._exact_counts.clear()
+            self._exact_counts[key] = (count, now + self._ttl)
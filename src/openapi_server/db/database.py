@@ -1,10 +1,35 @@
-from psycopg2 import sql, pool, DatabaseError
+from psycopg2 import sql, pool, DatabaseError, InterfaceError
+from psycopg2.extensions import QueryCanceledError
 from psycopg2.extras import RealDictCursor
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import functools
+import json
 import os
-from typing import Dict, Any, Optional, Union
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Optional, Union
 from enum import Enum
 
+from openapi_server.db.catalog import parse_table_columns
+from openapi_server.db.counts import RowCounter
+from openapi_server.db.group_commit import GroupCommitter
+from openapi_server.db.idempotency import IdempotencyStore, record_result, request_fingerprint
+from openapi_server.db.key_filter import KeyFilters
+from openapi_server.db.resilience import (
+    IDEMPOTENT_METHODS,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    TransientDatabaseError,
+    classify_error,
+)
+from openapi_server.db.shared_cache import SharedRowCache, row_cache_key, table_cache_key
+from openapi_server.db.snapshot import Snapshot, SnapshotStore
+from openapi_server.tracing import start_span, trace_cursor
+
 class ConfigurationError(Exception):
     pass
 
@@ -26,11 +51,60 @@ def get_config_value(db_key: str) -> str:
         else:
             raise ConfigurationError(f"Configuration file '{prop_file}' not found.")
 
+def get_optional_config_value(db_key: str, default: str) -> str:
+    try:
+        return get_config_value(db_key)
+    except ConfigurationError:
+        return default
+
 DB_HOST = get_config_value("DB_HOST")
 DB_NAME = get_config_value("DB_NAME")
 DB_USER = get_config_value("DB_USER")
 DB_PASSWORD = get_config_value("DB_PASSWORD")
 DB_PORT = get_config_value("DB_PORT")
+DB_STATEMENT_TIMEOUT_MS = int(get_optional_config_value("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_MAX_STATEMENT_TIMEOUT_MS = int(get_optional_config_value("DB_MAX_STATEMENT_TIMEOUT_MS", "120000"))
+DB_POOL_MAX_CONNECTIONS = int(get_optional_config_value("DB_POOL_MAX_CONNECTIONS", "10"))
+
+DB_CACHE_TTL_SECONDS = float(get_optional_config_value("DB_CACHE_TTL_SECONDS", "60"))
+DB_SHARED_CACHE_NAME = get_optional_config_value("DB_SHARED_CACHE_NAME", "openapi_server_rows")
+DB_SHARED_CACHE_SLOTS = int(get_optional_config_value("DB_SHARED_CACHE_SLOTS", "0"))
+DB_SHARED_CACHE_SLOT_BYTES = int(get_optional_config_value("DB_SHARED_CACHE_SLOT_BYTES", "1024"))
+DB_CHANGE_LISTENER = get_optional_config_value("DB_CHANGE_LISTENER", "false").lower() == "true"
+DB_NOTIFY_CHANNEL = get_optional_config_value("DB_NOTIFY_CHANNEL", "openapi_server_changes")
+DB_GROUP_COMMIT = get_optional_config_value("DB_GROUP_COMMIT", "false").lower() == "true"
+DB_GROUP_COMMIT_MAX_ROWS = int(get_optional_config_value("DB_GROUP_COMMIT_MAX_ROWS", "100"))
+DB_GROUP_COMMIT_MAX_DELAY_MS = float(get_optional_config_value("DB_GROUP_COMMIT_MAX_DELAY_MS", "5"))
+DB_IDEMPOTENCY_MAX_ENTRIES = int(get_optional_config_value("DB_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+DB_IDEMPOTENCY_TTL_SECONDS = float(get_optional_config_value("DB_IDEMPOTENCY_TTL_SECONDS", "86400"))
+DB_IDEMPOTENCY_TABLE = get_optional_config_value("DB_IDEMPOTENCY_TABLE", "")
+# Must outlast the longest request, or a slow write loses its claim and is rolled back.
+DB_IDEMPOTENCY_LEASE_SECONDS = float(
+    get_optional_config_value("DB_IDEMPOTENCY_LEASE_SECONDS", str(DB_MAX_STATEMENT_TIMEOUT_MS / 1000 + 30))
+)
+DB_COUNT_CACHE_TTL_SECONDS = float(get_optional_config_value("DB_COUNT_CACHE_TTL_SECONDS", "5"))
+DB_COUNT_EXACT_THRESHOLD = int(get_optional_config_value("DB_COUNT_EXACT_THRESHOLD", "10000"))
+DB_KEY_FILTER_TABLES = parse_table_columns(get_optional_config_value("DB_KEY_FILTER_TABLES", ""))
+DB_KEY_FILTER_NAME = get_optional_config_value("DB_KEY_FILTER_NAME", "openapi_server_keys")
+DB_KEY_FILTER_CAPACITY = int(get_optional_config_value("DB_KEY_FILTER_CAPACITY", "1000000"))
+DB_KEY_FILTER_FP_RATE = float(get_optional_config_value("DB_KEY_FILTER_FP_RATE", "0.01"))
+DB_KEY_FILTER_REBUILD_SECONDS = float(get_optional_config_value("DB_KEY_FILTER_REBUILD_SECONDS", "3600"))
+DB_RETRY_ATTEMPTS = int(get_optional_config_value("DB_RETRY_ATTEMPTS", "2"))
+DB_RETRY_BASE_DELAY_MS = float(get_optional_config_value("DB_RETRY_BASE_DELAY_MS", "50"))
+DB_RETRY_MAX_DELAY_MS = float(get_optional_config_value("DB_RETRY_MAX_DELAY_MS", "1000"))
+DB_BREAKER_FAILURE_THRESHOLD = int(get_optional_config_value("DB_BREAKER_FAILURE_THRESHOLD", "5"))
+DB_BREAKER_RESET_SECONDS = float(get_optional_config_value("DB_BREAKER_RESET_SECONDS", "10"))
+DB_SNAPSHOT_DIR = get_optional_config_value("DB_SNAPSHOT_DIR", "snapshots")
+DB_SNAPSHOT_TABLES = set(parse_table_columns(get_optional_config_value("DB_SNAPSHOT_TABLES", "")))
+DB_SNAPSHOT_FALLBACK = get_optional_config_value("DB_SNAPSHOT_FALLBACK", "false").lower() == "true"
+DB_SNAPSHOT_CHECK_SECONDS = float(get_optional_config_value("DB_SNAPSHOT_CHECK_SECONDS", "5"))
+
+# Sent with every pooled connection; change notifications use it to tell this service's writes from others'.
+APPLICATION_NAME = "openapi_server"
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+DISCONNECT_POLL_INTERVAL = 0.1
+CLIENT_CLOSED_REQUEST = 499
 
 class HTTPMethod(str, Enum):
     GET = "get"
@@ -38,25 +112,313 @@ class HTTPMethod(str, Enum):
     PUT = "put"
     DELETE = "delete"
 
-db_pool = pool.SimpleConnectionPool(
+# Sessions are opened from the threadpool and from background threads, so the pool must be thread-safe.
+db_pool = pool.ThreadedConnectionPool(
     minconn=1,
-    maxconn=10,
+    maxconn=DB_POOL_MAX_CONNECTIONS,
     host=DB_HOST,
     dbname=DB_NAME,
     user=DB_USER,
     password=DB_PASSWORD,
-    port=DB_PORT
+    port=DB_PORT,
+    application_name=APPLICATION_NAME
+)
+# The pool raises instead of waiting when it is exhausted, so callers queue here for a free connection.
+pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_CONNECTIONS)
+
+row_cache = SharedRowCache(
+    DB_SHARED_CACHE_NAME,
+    slots=DB_SHARED_CACHE_SLOTS,
+    slot_size=DB_SHARED_CACHE_SLOT_BYTES
+) if DB_SHARED_CACHE_SLOTS > 0 else None
+
+retry_policy = RetryPolicy(
+    attempts=DB_RETRY_ATTEMPTS,
+    base_delay=DB_RETRY_BASE_DELAY_MS / 1000,
+    max_delay=DB_RETRY_MAX_DELAY_MS / 1000
 )
 
-def get_db_connection():
+circuit_breaker = CircuitBreaker(
+    failure_threshold=DB_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=DB_BREAKER_RESET_SECONDS
+) if DB_BREAKER_FAILURE_THRESHOLD > 0 else None
+
+def get_db_connection(deadline: Optional[float] = None):
+    wait = (deadline - time.monotonic()) if deadline is not None else DB_STATEMENT_TIMEOUT_MS / 1000
+    if not pool_slots.acquire(timeout=max(0, wait)):
+        raise TransientDatabaseError("No database connection became free in time", write_safe=True, outage=False)
     try:
         return db_pool.getconn()
+    except pool.PoolError as e:
+        pool_slots.release()
+        raise TransientDatabaseError(f"Database connection pool error: {str(e)}", write_safe=True, outage=False)
     except DatabaseError as e:
+        pool_slots.release()
+        transient = classify_error(e, connecting=True)
+        if transient:
+            raise transient
         raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
 
 def release_db_connection(conn):
     if conn:
-        db_pool.putconn(conn)
+        try:
+            db_pool.putconn(conn)
+        finally:
+            pool_slots.release()
+
+class QueryCanceller:
+    """Cancels the statement running on a pooled connection from another thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelled = False
+
+    def attach(self, conn):
+        with self._lock:
+            self._conn = conn
+            if self.cancelled:
+                conn.cancel()
+
+    def detach(self):
+        with self._lock:
+            self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.cancel()
+
+def resolve_timeout_ms(header_value: Optional[str], default_timeout_ms: Optional[int] = None) -> int:
+    timeout_ms = default_timeout_ms or DB_STATEMENT_TIMEOUT_MS
+    if header_value:
+        try:
+            timeout_ms = int(header_value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid {REQUEST_TIMEOUT_HEADER} header: {header_value}")
+        if timeout_ms <= 0:
+            raise HTTPException(status_code=400, detail=f"{REQUEST_TIMEOUT_HEADER} must be a positive number of milliseconds.")
+    return min(timeout_ms, DB_MAX_STATEMENT_TIMEOUT_MS)
+
+def apply_statement_timeout(cursor, deadline: Optional[float]):
+    if deadline is None:
+        return
+    remaining_ms = int((deadline - time.monotonic()) * 1000)
+    if remaining_ms <= 0:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded before the query started.")
+    cursor.execute(
+        sql.SQL("SET LOCAL statement_timeout = {}").format(sql.Literal(remaining_ms))
+    )
+
+def rollback_quietly(conn):
+    # A connection that was lost can't be rolled back; the pool discards it on release.
+    if conn and not conn.closed:
+        try:
+            conn.rollback()
+        except (DatabaseError, InterfaceError):
+            pass
+
+@contextmanager
+def db_session(
+    deadline: Optional[float] = None,
+    canceller: Optional[QueryCanceller] = None,
+    cursor_factory=None
+):
+    if circuit_breaker:
+        circuit_breaker.before_call()
+    conn = None
+    outage = False
+    # Only a session that got an answer from Postgres says anything about its health.
+    reached_database = False
+    try:
+        with start_span("db.get_connection"):
+            conn = get_db_connection(deadline)
+        if canceller:
+            canceller.attach(conn)
+
+        with conn.cursor(cursor_factory=cursor_factory) as raw_cursor:
+            cursor = trace_cursor(raw_cursor)
+            try:
+                apply_statement_timeout(cursor, deadline)
+                yield conn, cursor
+                if raw_cursor.query is None and circuit_breaker and circuit_breaker.state == "half-open":
+                    # The probe ran its statements on cursors of its own, or none at all.
+                    raw_cursor.execute("SELECT 1")
+            finally:
+                reached_database = raw_cursor.query is not None
+
+    except TransientDatabaseError as e:
+        outage = e.outage
+        raise
+
+    except QueryCanceledError as e:
+        reached_database = True
+        rollback_quietly(conn)
+        if canceller and canceller.cancelled:
+            raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+        raise HTTPException(status_code=504, detail=f"Query exceeded request deadline: {str(e)}")
+
+    except (DatabaseError, InterfaceError) as e:
+        rollback_quietly(conn)
+        # Errors raised by the server carry an SQLSTATE; errors raised client-side never reached it.
+        reached_database = getattr(e, "pgcode", None) is not None
+        transient = classify_error(e)
+        if transient:
+            outage = transient.outage
+            raise transient
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    finally:
+        if circuit_breaker:
+            if outage:
+                circuit_breaker.record_failure()
+            elif reached_database:
+                circuit_breaker.record_success()
+            else:
+                circuit_breaker.release_probe()
+        if canceller:
+            canceller.detach()
+        if conn:
+            release_db_connection(conn)
+
+async def run_with_deadline(
+    request: Request,
+    handler: Callable,
+    *args,
+    default_timeout_ms: Optional[int] = None,
+    **kwargs
+) -> Any:
+    timeout_ms = resolve_timeout_ms(request.headers.get(REQUEST_TIMEOUT_HEADER), default_timeout_ms)
+    deadline = time.monotonic() + timeout_ms / 1000
+    canceller = QueryCanceller()
+    operation = functools.partial(handler, *args, deadline=deadline, canceller=canceller, **kwargs)
+    idempotent = request.method in IDEMPOTENT_METHODS
+    # The span is opened before the task is created so the threadpool thread inherits it as the parent.
+    with start_span(f"handler {handler.__name__}", {"db.timeout_ms": timeout_ms}):
+        task = asyncio.ensure_future(
+            run_in_threadpool(retry_policy.run, operation, idempotent, deadline, canceller)
+        )
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                canceller.cancel()
+                try:
+                    await task
+                except Exception:
+                    pass
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+async def run_db_operation(
+    request: Request,
+    *args,
+    default_timeout_ms: Optional[int] = None,
+    **kwargs
+) -> Union[Dict[str, Any], list]:
+    kwargs.setdefault("idempotency_key", request.headers.get(IDEMPOTENCY_KEY_HEADER))
+    return await run_with_deadline(
+        request, db_operation_handler, *args, default_timeout_ms=default_timeout_ms, **kwargs
+    )
+
+# In-process caches register a callable(schema, table) here; table is None when everything must go.
+cache_invalidators = []
+
+def register_cache_invalidator(invalidator):
+    cache_invalidators.append(invalidator)
+
+# shared=False leaves the shared row cache alone, for callers that know another worker handles it.
+def invalidate_cached_rows(schema: str, table: str, shared: bool = True):
+    if row_cache and shared:
+        row_cache.invalidate_table(table_cache_key(schema, table))
+    for invalidator in cache_invalidators:
+        invalidator(schema, table)
+
+def invalidate_all_cached_rows(shared: bool = True):
+    if row_cache and shared:
+        row_cache.clear()
+    for invalidator in cache_invalidators:
+        invalidator(None, None)
+
+group_committer = GroupCommitter(
+    db_session,
+    invalidate_cached_rows,
+    max_rows=DB_GROUP_COMMIT_MAX_ROWS,
+    max_delay=DB_GROUP_COMMIT_MAX_DELAY_MS / 1000
+) if DB_GROUP_COMMIT else None
+
+idempotency_store = IdempotencyStore(
+    max_entries=DB_IDEMPOTENCY_MAX_ENTRIES,
+    ttl=DB_IDEMPOTENCY_TTL_SECONDS,
+    session_factory=db_session,
+    table=tuple(DB_IDEMPOTENCY_TABLE.split(".", 1)) if DB_IDEMPOTENCY_TABLE else None,
+    lease=DB_IDEMPOTENCY_LEASE_SECONDS
+) if DB_IDEMPOTENCY_MAX_ENTRIES > 0 else None
+
+row_counter = RowCounter(
+    db_session,
+    ttl=DB_COUNT_CACHE_TTL_SECONDS,
+    exact_threshold=DB_COUNT_EXACT_THRESHOLD
+)
+register_cache_invalidator(row_counter.invalidate)
+
+def count_rows(
+    schema: str,
+    table: str,
+    filters: Optional[Dict[str, Any]] = None,
+    mode: str = "auto",
+    deadline: Optional[float] = None,
+    canceller: Optional[QueryCanceller] = None
+) -> Dict[str, Any]:
+    return row_counter.count(schema, table, filters, mode, deadline, canceller)
+
+key_filters = KeyFilters(
+    db_session,
+    DB_KEY_FILTER_TABLES,
+    name=DB_KEY_FILTER_NAME,
+    capacity=DB_KEY_FILTER_CAPACITY,
+    fp_rate=DB_KEY_FILTER_FP_RATE,
+    rebuild_interval=DB_KEY_FILTER_REBUILD_SECONDS
+) if DB_KEY_FILTER_TABLES else None
+
+snapshot_store = SnapshotStore(
+    DB_SNAPSHOT_DIR,
+    DB_SNAPSHOT_TABLES,
+    check_interval=DB_SNAPSHOT_CHECK_SECONDS
+) if DB_SNAPSHOT_TABLES or DB_SNAPSHOT_FALLBACK else None
+
+def snapshot_row(snapshot: Snapshot, params: Dict[str, Any]) -> Dict[str, Any]:
+    with start_span("snapshot.lookup", {"snapshot.table": f"{snapshot.schema}.{snapshot.table}"}):
+        row = snapshot.get(params[snapshot.key_column])
+    if row is None:
+        raise HTTPException(status_code=404, detail="No records found")
+    return row
+
+def read_with_snapshot(schema: str, table: str, params: Dict[str, Any], read: Callable[[], Any]) -> Any:
+    """Runs a key lookup through read(), unless the table's snapshot should answer it instead."""
+    snapshot = snapshot_store.lookup_snapshot(schema, table, params) if snapshot_store else None
+    if snapshot and snapshot_store.serves(schema, table):
+        return snapshot_row(snapshot, params)
+    if not (snapshot and DB_SNAPSHOT_FALLBACK):
+        return read()
+    try:
+        return read()
+    except (CircuitOpenError, TransientDatabaseError) as e:
+        # Only an unreachable database is answered from the snapshot; other errors still reach the client.
+        if isinstance(e, TransientDatabaseError) and not e.outage:
+            raise
+        return snapshot_row(snapshot, params)
+
+def with_idempotency(
+    idempotency_key: Optional[str],
+    fingerprint_parts: tuple,
+    operation: Callable[[], Any],
+    deadline: Optional[float] = None
+) -> Any:
+    if not idempotency_key or not idempotency_store:
+        return operation()
+    return idempotency_store.execute(idempotency_key, request_fingerprint(*fingerprint_parts), operation, deadline)
 
 def db_operation_handler(
     schema: str, 
@@ -64,113 +426,155 @@ def db_operation_handler(
     http_method: HTTPMethod, 
     path_params: Optional[Dict[str, Any]] = None, 
     query_params: Optional[Dict[str, Any]] = None, 
-    body_params: Optional[Dict[str, Any]] = None
+    body_params: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+    canceller: Optional[QueryCanceller] = None,
+    idempotency_key: Optional[str] = None,
+    use_snapshot: bool = True
 ) -> Union[Dict[str, Any], list]:
-    conn = None
-    try:
-        conn = get_db_connection()
-        combined_params = {**(path_params or {}), **(query_params or {})}
-        
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            schema_table_name = sql.SQL("{}.{}").format(
-                sql.Identifier(schema),
-                sql.Identifier(table)
+    if idempotency_key and http_method in (HTTPMethod.POST, HTTPMethod.PUT):
+        return with_idempotency(
+            idempotency_key,
+            (schema, table, http_method, path_params, query_params, body_params),
+            lambda: db_operation_handler(
+                schema, table, http_method, path_params, query_params, body_params, deadline, canceller
+            ),
+            deadline
+        )
+    combined_params = {**(path_params or {}), **(query_params or {})}
+    if http_method == HTTPMethod.POST and body_params and group_committer:
+        row = group_committer.submit(schema, table, body_params, deadline)
+        if key_filters:
+            key_filters.add_rows(schema, table, [row])
+        return row
+    if http_method == HTTPMethod.GET and key_filters and key_filters.definitely_missing(schema, table, combined_params):
+        raise HTTPException(status_code=404, detail="No records found")
+    if http_method == HTTPMethod.GET and snapshot_store and use_snapshot:
+        return read_with_snapshot(schema, table, combined_params, lambda: db_operation_handler(
+            schema, table, http_method, path_params, query_params, body_params, deadline, canceller,
+            use_snapshot=False
+        ))
+    cache_key = None
+    if http_method == HTTPMethod.GET and row_cache:
+        cache_key = row_cache_key(schema, table, combined_params)
+        cached = row_cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+        # Read before the query, so a write that commits while it runs makes this result uncacheable.
+        cache_generation = row_cache.generation(table_cache_key(schema, table))
+    with db_session(deadline, canceller, RealDictCursor) as (conn, cursor):
+        schema_table_name = sql.SQL("{}.{}").format(
+            sql.Identifier(schema),
+            sql.Identifier(table)
+        )
+
+        if http_method == HTTPMethod.POST:
+            if not body_params:
+                raise HTTPException(status_code=400, detail="No data provided for POST operation.")
+            
+            columns = body_params.keys()
+            values = list(body_params.values())
+
+            insert_query = sql.SQL(
+                "INSERT INTO {table} ({fields}) VALUES ({placeholders}) RETURNING *"
+            ).format(
+                table=schema_table_name,
+                fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                placeholders=sql.SQL(', ').join(sql.Placeholder() for _ in values)
             )
+            
+            cursor.execute(insert_query, values)
+            row = cursor.fetchone()
+            record_result(cursor, row)
+            conn.commit()
+            invalidate_cached_rows(schema, table)
+            written_rows = [row]
 
-            if http_method == HTTPMethod.POST:
-                if not body_params:
-                    raise HTTPException(status_code=400, detail="No data provided for POST operation.")
-                
-                columns = body_params.keys()
-                values = list(body_params.values())
-
-                insert_query = sql.SQL(
-                    "INSERT INTO {table} ({fields}) VALUES ({placeholders}) RETURNING *"
-                ).format(
-                    table=schema_table_name,
-                    fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-                    placeholders=sql.SQL(', ').join(sql.Placeholder() for _ in values)
-                )
-                
-                cursor.execute(insert_query, values)
-                conn.commit()
-                return cursor.fetchone()
-
-            elif http_method == HTTPMethod.GET:
-                filters = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in combined_params.keys()]
-                values = list(combined_params.values())
-                where_clause = sql.SQL("WHERE {}").format(sql.SQL(" AND ").join(filters)) if filters else sql.SQL("")
-
-                query = sql.SQL("SELECT * FROM {table} {where_clause}").format(
-                    table=schema_table_name,
-                    where_clause=where_clause
-                )
-                
-                cursor.execute(query, values)
-                results = cursor.fetchall()
-
-                if not results:
-                    raise HTTPException(status_code=404, detail="No records found")
-                return results if len(results) > 1 else results[0]
-
-            elif http_method == HTTPMethod.PUT:
-                if not body_params:
-                    raise HTTPException(status_code=400, detail="No data provided for PUT operation.")
-                if not path_params:
-                    raise HTTPException(status_code=400, detail="No parameters provided for PUT operation.")
-
-                updates = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in body_params.keys()]
-                filters = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in path_params.keys()]
-                
-                values = list(body_params.values()) + list(path_params.values())
-
-                update_query = sql.SQL(
-                    "UPDATE {table} SET {updates} WHERE {filters} RETURNING *"
-                ).format(
-                    table=schema_table_name,
-                    updates=sql.SQL(", ").join(updates),
-                    filters=sql.SQL(" AND ").join(filters)
-                )
+        elif http_method == HTTPMethod.GET:
+            filters = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in combined_params.keys()]
+            values = list(combined_params.values())
+            where_clause = sql.SQL("WHERE {}").format(sql.SQL(" AND ").join(filters)) if filters else sql.SQL("")
 
-                cursor.execute(update_query, values)
-                conn.commit()
-                result = cursor.fetchall()
-                if not result:
-                    raise HTTPException(status_code=404, detail="No records found to update.")
-                
-                return result[0]
-
-            elif http_method == HTTPMethod.DELETE:
-                filters = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in combined_params.keys()]
-                values = list(combined_params.values())
-                
-                where_clause = sql.SQL("WHERE {}").format(sql.SQL(" AND ").join(filters)) if filters else sql.SQL("")
-
-                delete_query = sql.SQL(
-                    "DELETE FROM {table} {where_clause} RETURNING 1"
-                ).format(
-                    table=schema_table_name,
-                    where_clause=where_clause
+            query = sql.SQL("SELECT * FROM {table} {where_clause}").format(
+                table=schema_table_name,
+                where_clause=where_clause
+            )
+            
+            cursor.execute(query, values)
+            results = cursor.fetchall()
+
+            if not results:
+                raise HTTPException(status_code=404, detail="No records found")
+            result = results if len(results) > 1 else results[0]
+            if cache_key:
+                row_cache.set(
+                    cache_key,
+                    table_cache_key(schema, table),
+                    json.dumps(result, default=str).encode(),
+                    DB_CACHE_TTL_SECONDS,
+                    cache_generation
                 )
+            return result
 
-                cursor.execute(delete_query, values)
-                conn.commit()
-                deleted_records = cursor.fetchall()
-                results = len(deleted_records)
+        elif http_method == HTTPMethod.PUT:
+            if not body_params:
+                raise HTTPException(status_code=400, detail="No data provided for PUT operation.")
+            if not path_params:
+                raise HTTPException(status_code=400, detail="No parameters provided for PUT operation.")
 
-                if results == 0:
-                    raise HTTPException(status_code=404, detail="No records found to delete.")
-                
-                return {"deleted_count": results, "message": f"{results} records deleted successfully"}
+            updates = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in body_params.keys()]
+            filters = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in path_params.keys()]
+            
+            values = list(body_params.values()) + list(path_params.values())
 
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported HTTP method")
+            update_query = sql.SQL(
+                "UPDATE {table} SET {updates} WHERE {filters} RETURNING *"
+            ).format(
+                table=schema_table_name,
+                updates=sql.SQL(", ").join(updates),
+                filters=sql.SQL(" AND ").join(filters)
+            )
 
-    except DatabaseError as e:
-        if conn:
-            conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+            cursor.execute(update_query, values)
+            result = cursor.fetchall()
+            if result:
+                record_result(cursor, result[0])
+            conn.commit()
+            invalidate_cached_rows(schema, table)
+            if not result:
+                raise HTTPException(status_code=404, detail="No records found to update.")
+            written_rows = result
+
+        elif http_method == HTTPMethod.DELETE:
+            filters = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in combined_params.keys()]
+            values = list(combined_params.values())
+            
+            where_clause = sql.SQL("WHERE {}").format(sql.SQL(" AND ").join(filters)) if filters else sql.SQL("")
+
+            delete_query = sql.SQL(
+                "DELETE FROM {table} {where_clause} RETURNING 1"
+            ).format(
+                table=schema_table_name,
+                where_clause=where_clause
+            )
+
+            cursor.execute(delete_query, values)
+            conn.commit()
+            invalidate_cached_rows(schema, table)
+            deleted_records = cursor.fetchall()
+            results = len(deleted_records)
+
+            if results == 0:
+                raise HTTPException(status_code=404, detail="No records found to delete.")
+            
+            return {"deleted_count": results, "message": f"{results} records deleted successfully"}
+
+        else:
+            raise HTTPException(status_code=400, detail="Unsupported HTTP method")
+
+    # Keys are added only after the commit, so a concurrent key filter rebuild cannot miss them,
+    # and after the connection is back in the pool.
+    if key_filters:
+        key_filters.add_rows(schema, table, written_rows)
+    return written_rows[0]
 
-    finally:
-        if conn:
-            release_db_connection(conn)
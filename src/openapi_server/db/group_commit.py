@@ -0,0 +1,159 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+from openapi_server.db.catalog import column_types
+from openapi_server.db.idempotency import current_claim
+from openapi_server.db.resilience import CircuitOpenError, TransientDatabaseError
+
+ORDINAL_COLUMN = "openapi_server_ordinal"
+
+
+class _Batch:
+    def __init__(self):
+        self.rows = []
+        self.deadlines = []
+        self.claims = []
+        self.results = []
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """Coalesces concurrent single-row inserts into one multi-row INSERT and commit.
+
+    The first caller to open a batch for a (schema, table, columns) key becomes its
+    leader: it waits until the batch is full or ``max_delay`` has passed, then runs
+    the insert for everyone. Each caller gets the RETURNING row for its own values.
+    If the database rejects the batch insert, for example on a constraint
+    violation, the rows are retried one by one so only the offending row fails.
+    Any other failure of the leader, including an unreachable database or an open
+    circuit breaker, is raised to every caller in the batch.
+    Callers executing an Idempotency-Key get their response recorded in the batch's
+    transaction; ``respond`` turns the inserted row into that response.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        on_commit: Callable[[str, str], None],
+        max_rows: int,
+        max_delay: float
+    ):
+        self._session_factory = session_factory
+        self._on_commit = on_commit
+        self._max_rows = max_rows
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._open_batches: Dict[Tuple, _Batch] = {}
+        self._column_types: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+    def submit(
+        self,
+        schema: str,
+        table: str,
+        body_params: Dict[str, Any],
+        deadline: Optional[float] = None,
+        respond: Optional[Callable[[Dict[str, Any]], Any]] = None
+    ):
+        key = (schema, table, tuple(body_params))
+        with self._lock:
+            batch = self._open_batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open_batches[key] = batch
+            index = len(batch.rows)
+            batch.rows.append(list(body_params.values()))
+            batch.deadlines.append(deadline)
+            batch.claims.append((current_claim.get(), respond))
+            if len(batch.rows) >= self._max_rows:
+                del self._open_batches[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self._max_delay)
+            with self._lock:
+                if self._open_batches.get(key) is batch:
+                    del self._open_batches[key]
+            try:
+                self._flush(key, batch)
+            except BaseException as error:
+                batch.error = error
+                raise
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+
+        result = batch.results[index] if index < len(batch.results) else HTTPException(
+            status_code=500, detail="Group commit failed before the row was inserted."
+        )
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _placeholders(self, conn, schema: str, table: str, columns: Tuple) -> list:
+        # Inside a SELECT the values lose the implicit cast to their column, so cast them explicitly.
+        types = self._column_types.get((schema, table))
+        if types is None or not set(columns) <= types.keys():
+            types = self._column_types[(schema, table)] = column_types(conn, schema, table)
+        return [
+            sql.SQL("{}::{}").format(sql.Placeholder(), sql.SQL(types[column])) if column in types
+            else sql.Placeholder()
+            for column in columns
+        ]
+
+    def _insert(
+        self, schema: str, table: str, columns: Tuple, rows: list, claims: list, deadline: Optional[float]
+    ) -> list:
+        with self._session_factory(deadline, None, RealDictCursor) as (conn, cursor):
+            placeholders = self._placeholders(conn, schema, table, columns)
+            fields = sql.SQL(', ').join(map(sql.Identifier, columns))
+            # RETURNING emits rows in the order they were inserted, which only the ORDER BY pins to the input order.
+            insert_query = sql.SQL(
+                "INSERT INTO {table} ({fields}) SELECT {fields} FROM (VALUES {values}) AS v ({fields}, {ordinal}) "
+                "ORDER BY {ordinal} RETURNING *"
+            ).format(
+                table=sql.Identifier(schema, table),
+                fields=fields,
+                ordinal=sql.Identifier(ORDINAL_COLUMN),
+                values=sql.SQL(', ').join(
+                    sql.SQL("({}, {})").format(sql.SQL(', ').join(placeholders), sql.Literal(ordinal))
+                    for ordinal in range(len(rows))
+                )
+            )
+            cursor.execute(insert_query, [value for row in rows for value in row])
+            results = cursor.fetchall()
+            for (claim, respond), row in zip(claims, results):
+                if claim:
+                    claim.record(cursor, respond(row) if respond else row)
+            conn.commit()
+        return results
+
+    def _flush(self, key: Tuple, batch: _Batch):
+        schema, table, columns = key
+        deadline = None if None in batch.deadlines else max(batch.deadlines)
+        try:
+            batch.results = self._insert(schema, table, columns, batch.rows, batch.claims, deadline)
+        except (TransientDatabaseError, CircuitOpenError):
+            # Retrying each row would only add a failing round trip per row.
+            raise
+        except HTTPException as error:
+            if len(batch.rows) == 1:
+                batch.results = [error]
+                return
+            batch.results = []
+            for row, claim, row_deadline in zip(batch.rows, batch.claims, batch.deadlines):
+                try:
+                    batch.results.extend(self._insert(schema, table, columns, [row], [claim], row_deadline))
+                except HTTPException as row_error:
+                    batch.results.append(row_error)
+        if any(not isinstance(result, Exception) for result in batch.results):
+            self._on_commit(schema, table)
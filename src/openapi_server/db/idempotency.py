@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from psycopg2 import sql
+from psycopg2.extras import Json
+
+LOGGER = logging.getLogger(__name__)
+
+IN_FLIGHT_POLL_INTERVAL = 0.05
+DEFAULT_LEASE_SECONDS = 150.0
+_MISSING = object()
+
+
+def request_fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Claim:
+    """A key claimed in the idempotency table. The token changes when another worker reclaims the key."""
+
+    def __init__(self, table: sql.Identifier, key: str):
+        self.table = table
+        self.key = key
+        self.token = uuid.uuid4().hex
+        self.recorded = False
+
+    def record(self, cursor, result: Any):
+        cursor.execute(
+            sql.SQL(
+                "UPDATE {table} SET response = %s, claimed_until = NULL WHERE key = %s AND claim_token = %s RETURNING key"
+            ).format(table=self.table),
+            (Json(result, dumps=lambda value: json.dumps(value, default=str)), self.key, self.token)
+        )
+        if cursor.fetchone() is None:
+            # Raised before the commit, so the write is rolled back rather than applied twice.
+            raise HTTPException(status_code=409, detail="The Idempotency-Key claim expired before the write committed.")
+        self.recorded = True
+
+
+current_claim: ContextVar[Optional[_Claim]] = ContextVar("openapi_server_idempotency_claim", default=None)
+
+
+def record_result(cursor, result: Any):
+    """Stores ``result`` as the response of the Idempotency-Key being executed, in the cursor's transaction.
+
+    Write paths call this right before they commit, so the response is stored if and only if
+    the write commits. Outside an execution that claimed a key in the table it does nothing.
+    """
+    claim = current_claim.get()
+    if claim is not None:
+        claim.record(cursor, result)
+
+
+class IdempotencyStore:
+    """Remembers the result of each write by its Idempotency-Key so retries are answered without re-executing it.
+
+    Results live in a bounded in-memory LRU. With ``table`` set they are also
+    written to Postgres, which lets other workers answer retries and makes a
+    worker wait while another one is still executing the same key. The response
+    is written by ``record_result`` in the same transaction as the write. A claim
+    holds a lease of ``lease`` seconds; a key whose worker died before answering
+    is claimed again once its lease runs out. Concurrent duplicates inside one
+    worker wait on the first execution. A duplicate waits at most until the
+    request ``deadline``, or for one lease without a deadline, and then gets a
+    409. Failed executions are not remembered, so the client can retry them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        session_factory: Optional[Callable] = None,
+        table: Optional[Tuple[str, str]] = None,
+        lease: float = DEFAULT_LEASE_SECONDS
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lease = lease
+        self._session_factory = session_factory
+        self._table = sql.Identifier(*table) if table else None
+        self._table_ready = False
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def execute(self, key: str, fingerprint: str, operation: Callable[[], Any], deadline: Optional[float] = None) -> Any:
+        wait_until = deadline if deadline is not None else time.monotonic() + self._lease
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[2] < time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                if entry:
+                    self._entries.move_to_end(key)
+                    self._check_fingerprint(entry[0], fingerprint)
+                    return entry[1]
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    done = threading.Event()
+                    self._in_flight[key] = (fingerprint, done)
+                    break
+            self._check_fingerprint(in_flight[0], fingerprint)
+            # If the first execution fails, the next waiter to get here runs the operation itself.
+            if not in_flight[1].wait(max(0.0, wait_until - time.monotonic())):
+                raise self._in_progress()
+
+        try:
+            claim, result = self._claim(key, fingerprint, wait_until, deadline) if self._table else (None, _MISSING)
+            if result is _MISSING:
+                result = self._run(claim, operation, deadline)
+            self._remember(key, fingerprint, result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _run(self, claim: Optional[_Claim], operation: Callable[[], Any], deadline: Optional[float]) -> Any:
+        context = current_claim.set(claim)
+        try:
+            result = operation()
+        except BaseException:
+            if claim:
+                self._release(claim, deadline)
+            raise
+        finally:
+            current_claim.reset(context)
+        if claim and not claim.recorded:
+            self._persist(claim, result, deadline)
+        return result
+
+    def _in_progress(self) -> HTTPException:
+        return HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress.")
+
+    def _check_fingerprint(self, stored: str, fingerprint: str):
+        if stored != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request.")
+
+    def _remember(self, key: str, fingerprint: str, result: Any):
+        with self._lock:
+            self._entries[key] = (fingerprint, result, time.monotonic() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _ensure_table(self, cursor):
+        if self._table_ready:
+            return
+        cursor.execute(sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {table} ("
+            "key text PRIMARY KEY, fingerprint text NOT NULL, response jsonb, "
+            "claim_token text, claimed_until timestamptz, created_at timestamptz NOT NULL DEFAULT now())"
+        ).format(table=self._table))
+        cursor.execute(sql.SQL(
+            "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS claim_token text, "
+            "ADD COLUMN IF NOT EXISTS claimed_until timestamptz"
+        ).format(table=self._table))
+        self._table_ready = True
+
+    def _claim(
+        self, key: str, fingerprint: str, wait_until: float, deadline: Optional[float]
+    ) -> Tuple[Optional[_Claim], Any]:
+        """Returns (claim, _MISSING) when this worker should execute, or (None, response) when it is stored."""
+        while True:
+            claim = _Claim(self._table, key)
+            with self._session_factory(deadline) as (conn, cursor):
+                self._ensure_table(cursor)
+                cursor.execute(
+                    sql.SQL("DELETE FROM {table} WHERE key = %s AND created_at < now() - %s * interval '1 second'")
+                    .format(table=self._table),
+                    (key, self._ttl)
+                )
+                # An in-flight row whose lease ran out belongs to an execution that never committed a response.
+                cursor.execute(
+                    sql.SQL(
+                        "INSERT INTO {table} AS t (key, fingerprint, claim_token, claimed_until) "
+                        "VALUES (%s, %s, %s, now() + %s * interval '1 second') "
+                        "ON CONFLICT (key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, "
+                        "claim_token = EXCLUDED.claim_token, claimed_until = EXCLUDED.claimed_until, created_at = now() "
+                        "WHERE t.response IS NULL AND t.claimed_until < now() RETURNING key"
+                    ).format(table=self._table),
+                    (key, fingerprint, claim.token, self._lease)
+                )
+                claimed = cursor.fetchone() is not None
+                stored = None
+                if not claimed:
+                    cursor.execute(
+                        sql.SQL("SELECT fingerprint, response, response IS NOT NULL FROM {table} WHERE key = %s").format(table=self._table),
+                        (key,)
+                    )
+                    stored = cursor.fetchone()
+                conn.commit()
+            if claimed:
+                return claim, _MISSING
+            if stored is None:
+                # The other execution failed and released the key in between; try to claim it again.
+                continue
+            self._check_fingerprint(stored[0], fingerprint)
+            # A stored JSON null is still a response; only SQL NULL means the key is in flight.
+            if stored[2]:
+                return None, stored[1]
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                raise self._in_progress()
+            time.sleep(min(IN_FLIGHT_POLL_INTERVAL, remaining))
+
+    def _persist(self, claim: _Claim, result: Any, deadline: Optional[float]):
+        """Stores the response of a write that did not call ``record_result`` before its commit."""
+        try:
+            with self._session_factory(deadline) as (conn, cursor):
+                claim.record(cursor, result)
+                conn.commit()
+        except Exception:
+            # The write has committed, so the result is returned anyway; failing now would invite a second write.
+            LOGGER.warning(f"Storing the response for Idempotency-Key {claim.key} failed", exc_info=True)
+
+    def _release(self, claim: _Claim, deadline: Optional[float]):
+        try:
+            with self._session_factory(deadline) as (conn, cursor):
+                cursor.execute(
+                    sql.SQL("DELETE FROM {table} WHERE key = %s AND claim_token = %s AND response IS NULL")
+                    .format(table=self._table),
+                    (claim.key, claim.token)
+                )
+                conn.commit()
+        except HTTPException:
+            pass
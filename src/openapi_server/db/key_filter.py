@@ -0,0 +1,349 @@
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from psycopg2 import sql
+
+from openapi_server.db.catalog import primary_key_column
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"OASBLOOM"
+HEADER = struct.Struct("=8sQIxxxxQd")  # magic, bit count, hash count, capacity, target false-positive rate
+HEADER_SIZE = 128
+ACTIVE_OFFSET = 48
+REBUILDING_OFFSET = 49
+READY_OFFSET = 50
+BUILT_AT = struct.Struct("=d")
+BUILT_AT_OFFSET = 56
+KEYS = struct.Struct("=QQ")  # keys added to buffer 0 and buffer 1
+KEYS_OFFSET = 64
+STALE_EPOCH = struct.Struct("=Q")
+STALE_EPOCH_OFFSET = 80
+WRITE_LOCK = 0
+BUILD_LOCK = 1
+SCAN_BATCH_ROWS = 10000
+REBUILD_CHECK_INTERVAL = 30.0
+
+
+class SharedBloomFilter:
+    """Bloom filter in POSIX shared memory, shared by every worker on the host.
+
+    The segment holds two bit arrays. Lookups read the active one without locks.
+    A rebuild fills the inactive array from a fresh scan while concurrent adds go
+    into both, then flips which one is active, so a rebuild never loses a key
+    inserted while it ran. Bits are only ever set under an fcntl lock, because
+    setting a bit rewrites the whole byte. Until the first build finishes, or
+    after ``mark_stale``, every lookup answers "maybe".
+    """
+
+    def __init__(self, name: str, capacity: int, fp_rate: float):
+        self._name = name
+        self._thread_locks = [threading.Lock(), threading.Lock()]
+        lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        capacity = max(1, capacity)
+        bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        bits = (bits + 511) // 512 * 512
+        hashes = max(1, round(bits / capacity * math.log(2)))
+
+        with self._locked(WRITE_LOCK):
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + 2 * bits // 8)
+                HEADER.pack_into(self._shm.buf, 0, MAGIC, bits, hashes, capacity, fp_rate)
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+        # Workers come and go independently; the segment must outlive whichever one created it.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        magic, self.bits, self.hashes, self.capacity, self.fp_rate = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC:
+            raise RuntimeError(f"Shared memory segment '{name}' is not a key filter.")
+        self._buf = self._shm.buf
+        self._array_bytes = self.bits // 8
+
+    @contextmanager
+    def _locked(self, lock_index: int, blocking: bool = True):
+        thread_lock = self._thread_locks[lock_index]
+        acquired = thread_lock.acquire(blocking)
+        if acquired:
+            try:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, 1, lock_index)
+            except OSError:
+                thread_lock.release()
+                acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, lock_index)
+                thread_lock.release()
+
+    def _positions(self, key: bytes) -> List[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def _array_offset(self, array: int) -> int:
+        return HEADER_SIZE + array * self._array_bytes
+
+    def _set_bits(self, array: int, positions: List[int]):
+        base = self._array_offset(array)
+        for position in positions:
+            self._buf[base + (position >> 3)] |= 1 << (position & 7)
+
+    def _add_count(self, array: int, added: int):
+        counts = list(KEYS.unpack_from(self._buf, KEYS_OFFSET))
+        counts[array] += added
+        KEYS.pack_into(self._buf, KEYS_OFFSET, *counts)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._buf[READY_OFFSET])
+
+    @property
+    def built_at(self) -> float:
+        return BUILT_AT.unpack_from(self._buf, BUILT_AT_OFFSET)[0]
+
+    def might_contain(self, key: bytes) -> bool:
+        if not self._buf[READY_OFFSET]:
+            return True
+        base = self._array_offset(self._buf[ACTIVE_OFFSET])
+        return all(self._buf[base + (position >> 3)] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, keys: Iterable[bytes]):
+        positions = [self._positions(key) for key in keys]
+        if not positions:
+            return
+        with self._locked(WRITE_LOCK):
+            active = self._buf[ACTIVE_OFFSET]
+            arrays = (active, 1 - active) if self._buf[REBUILDING_OFFSET] else (active,)
+            for array in arrays:
+                for key_positions in positions:
+                    self._set_bits(array, key_positions)
+                self._add_count(array, len(positions))
+
+    def mark_stale(self):
+        with self._locked(WRITE_LOCK):
+            self._buf[READY_OFFSET] = 0
+            STALE_EPOCH.pack_into(self._buf, STALE_EPOCH_OFFSET, STALE_EPOCH.unpack_from(self._buf, STALE_EPOCH_OFFSET)[0] + 1)
+
+    def needs_rebuild(self, max_age: float) -> bool:
+        return not self.ready or time.time() - self.built_at >= max_age
+
+    def rebuild(self, scan: Callable[[], Iterator[bytes]], max_age: float) -> bool:
+        """Rebuilds from ``scan`` unless another worker is already doing it or just did; returns whether it ran."""
+        with self._locked(BUILD_LOCK, blocking=False) as acquired:
+            if not acquired or not self.needs_rebuild(max_age):
+                return False
+            with self._locked(WRITE_LOCK):
+                target = 1 - self._buf[ACTIVE_OFFSET]
+                offset = self._array_offset(target)
+                self._buf[offset:offset + self._array_bytes] = bytes(self._array_bytes)
+                counts = list(KEYS.unpack_from(self._buf, KEYS_OFFSET))
+                counts[target] = 0
+                KEYS.pack_into(self._buf, KEYS_OFFSET, *counts)
+                # Set before the scan takes its snapshot: rows committed after it are added to both arrays.
+                self._buf[REBUILDING_OFFSET] = 1
+                stale_epoch = STALE_EPOCH.unpack_from(self._buf, STALE_EPOCH_OFFSET)[0]
+            try:
+                batch = []
+                for key in scan():
+                    batch.append(self._positions(key))
+                    if len(batch) >= SCAN_BATCH_ROWS:
+                        self._add_scanned(target, batch)
+                        batch = []
+                self._add_scanned(target, batch)
+            except BaseException:
+                with self._locked(WRITE_LOCK):
+                    self._buf[REBUILDING_OFFSET] = 0
+                raise
+            with self._locked(WRITE_LOCK):
+                self._buf[ACTIVE_OFFSET] = target
+                self._buf[REBUILDING_OFFSET] = 0
+                BUILT_AT.pack_into(self._buf, BUILT_AT_OFFSET, time.time())
+                # A key that could not be added while the scan ran may be missing from both arrays.
+                self._buf[READY_OFFSET] = int(STALE_EPOCH.unpack_from(self._buf, STALE_EPOCH_OFFSET)[0] == stale_epoch)
+            return True
+
+    def _add_scanned(self, array: int, batch: List[List[int]]):
+        with self._locked(WRITE_LOCK):
+            for positions in batch:
+                self._set_bits(array, positions)
+            self._add_count(array, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        active = self._buf[ACTIVE_OFFSET]
+        offset = self._array_offset(active)
+        set_bits = int.from_bytes(self._buf[offset:offset + self._array_bytes], "little").bit_count()
+        fill = set_bits / self.bits
+        return {
+            "ready": self.ready,
+            "built_at": self.built_at or None,
+            "keys": KEYS.unpack_from(self._buf, KEYS_OFFSET)[active],
+            "capacity": self.capacity,
+            "memory_bytes": self._shm.size,
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "fill_ratio": round(fill, 6),
+            "target_false_positive_rate": self.fp_rate,
+            "estimated_false_positive_rate": fill ** self.hashes,
+        }
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        os.close(self._lock_fd)
+
+
+class KeyFilters:
+    """Keeps a shared Bloom filter of the primary keys of each configured table.
+
+    Lookups by exactly the key column that the filter rules out are definite
+    misses and can be answered with a 404 without a query. A table configured
+    without a column uses its primary key column, read from the catalog once at
+    startup and retried by the rebuild thread, never on the request path. Until
+    the column is known, lookups go to the database and writes mark the filter
+    stale. Inserted keys are added after their commit. Deleted keys stay in
+    the filter until the next rebuild, which only costs the query a lookup
+    would have made anyway. A background thread rebuilds each filter with a
+    streaming scan at startup, every ``rebuild_interval`` seconds, and soon
+    after a filter is marked stale.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        tables: Dict[Tuple[str, str], Optional[str]],
+        name: str,
+        capacity: int,
+        fp_rate: float,
+        rebuild_interval: float
+    ):
+        self._session_factory = session_factory
+        self._columns = dict(tables)
+        self._without_primary_key = set()
+        self._rebuild_interval = rebuild_interval
+        self._filters = {
+            (schema, table): SharedBloomFilter(
+                f"{name}_{hashlib.blake2b(f'{schema}.{table}'.encode(), digest_size=8).hexdigest()}",
+                capacity,
+                fp_rate
+            )
+            for schema, table in tables
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def resolve_columns(self):
+        """Reads the primary key column of every table configured without one, in a single session."""
+        missing = [
+            key for key in self._filters if self._columns.get(key) is None and key not in self._without_primary_key
+        ]
+        if not missing:
+            return
+        try:
+            with self._session_factory() as (conn, _):
+                for schema, table in missing:
+                    column = primary_key_column(conn, schema, table)
+                    if column is None:
+                        LOGGER.error(
+                            f"{schema}.{table} has no single-column primary key, "
+                            f"configure the key filter as {schema}.{table}:<column>"
+                        )
+                        self._without_primary_key.add((schema, table))
+                    else:
+                        self._columns[(schema, table)] = column
+        except Exception:
+            LOGGER.exception("Finding the key columns of the key filter tables failed")
+
+    def definitely_missing(self, schema: str, table: str, params: Dict[str, Any]) -> bool:
+        # Reads never wait on the catalog; until the column is known, every lookup goes to the database.
+        column = self._columns.get((schema, table))
+        if column is None or len(params) != 1 or column not in params or params[column] is None:
+            return False
+        return not self._filters[(schema, table)].might_contain(str(params[column]).encode())
+
+    def add_rows(self, schema: str, table: str, rows: Iterable[Optional[Dict[str, Any]]]):
+        """Adds the keys of committed rows; must run after the commit, see SharedBloomFilter.rebuild."""
+        if (schema, table) not in self._filters:
+            return
+        # Another worker may already have built the shared filter, and without the column these keys can't be added.
+        column = self._columns.get((schema, table))
+        if column is None:
+            self.mark_stale(schema, table)
+            return
+        keys = []
+        for row in rows:
+            if not row or column not in row:
+                # Without the key a definite miss could be wrong, so stop trusting the filter until it is rebuilt.
+                self.mark_stale(schema, table)
+                return
+            if row[column] is not None:
+                keys.append(str(row[column]).encode())
+        self._filters[(schema, table)].add(keys)
+
+    def mark_stale(self, schema: str, table: str):
+        if (schema, table) in self._filters:
+            self._filters[(schema, table)].mark_stale()
+
+    def _scan(self, schema: str, table: str) -> Iterator[bytes]:
+        column = sql.Identifier(self._columns[(schema, table)])
+        with self._session_factory() as (conn, _):
+            with conn.cursor(name="openapi_server_key_scan") as scan:
+                scan.itersize = SCAN_BATCH_ROWS
+                scan.execute(sql.SQL("SELECT {column}::text FROM {table} WHERE {column} IS NOT NULL").format(
+                    column=column, table=sql.Identifier(schema, table)
+                ))
+                for (key,) in scan:
+                    yield key.encode()
+
+    def rebuild_stale(self):
+        for (schema, table), key_filter in self._filters.items():
+            if self._columns.get((schema, table)) is None or not key_filter.needs_rebuild(self._rebuild_interval):
+                continue
+            started = time.monotonic()
+            try:
+                rebuilt = key_filter.rebuild(lambda: self._scan(schema, table), self._rebuild_interval)
+            except Exception:
+                LOGGER.exception(f"Rebuilding the key filter of {schema}.{table} failed")
+                continue
+            if rebuilt:
+                stats = key_filter.stats()
+                LOGGER.info(
+                    f"Key filter of {schema}.{table} rebuilt in {time.monotonic() - started:.1f}s: "
+                    f"{stats['keys']} keys, {stats['memory_bytes']} bytes, "
+                    f"estimated false-positive rate {stats['estimated_false_positive_rate']:.4%}"
+                )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            f"{schema}.{table}": {"column": self._columns.get((schema, table)), **key_filter.stats()}
+            for (schema, table), key_filter in self._filters.items()
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.resolve_columns()
+            self.rebuild_stale()
+            self._stop.wait(min(REBUILD_CHECK_INTERVAL, self._rebuild_interval))
+
+    def start(self):
+        self.resolve_columns()
+        self._thread = threading.Thread(target=self._run, name="key-filter-rebuild", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
@@ -0,0 +1,204 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import select
+import tempfile
+import threading
+from typing import Iterable, Optional, Tuple
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from openapi_server.db.database import (
+    APPLICATION_NAME,
+    DB_CHANGE_LISTENER,
+    DB_HOST,
+    DB_NAME,
+    DB_NOTIFY_CHANNEL,
+    DB_PASSWORD,
+    DB_PORT,
+    DB_SHARED_CACHE_NAME,
+    DB_USER,
+    invalidate_all_cached_rows,
+    invalidate_cached_rows,
+    key_filters,
+    row_cache,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+TRIGGER_NAME = "openapi_server_notify_change"
+POLL_INTERVAL = 5.0
+MIN_RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+def connect():
+    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT)
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+def install_notify_trigger(conn, schema: str, table: str, channel: str = DB_NOTIFY_CHANNEL):
+    function_name = sql.Identifier(schema, TRIGGER_NAME)
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            """
+            CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify({channel}, json_build_object(
+                    'schema', TG_TABLE_SCHEMA, 'table', TG_TABLE_NAME, 'op', TG_OP,
+                    'application', current_setting('application_name')
+                )::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """
+        ).format(function=function_name, channel=sql.Literal(channel)))
+        cursor.execute(sql.SQL("DROP TRIGGER IF EXISTS {trigger} ON {table}").format(
+            trigger=sql.Identifier(TRIGGER_NAME),
+            table=sql.Identifier(schema, table)
+        ))
+        cursor.execute(sql.SQL(
+            "CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+        ).format(
+            trigger=sql.Identifier(TRIGGER_NAME),
+            table=sql.Identifier(schema, table),
+            function=function_name
+        ))
+
+
+def install_notify_triggers(tables: Iterable[Tuple[str, str]], channel: str = DB_NOTIFY_CHANNEL):
+    conn = connect()
+    try:
+        for schema, table in tables:
+            install_notify_trigger(conn, schema, table, channel)
+            LOGGER.info("Installed change trigger on %s.%s", schema, table)
+    finally:
+        conn.close()
+
+
+def handle_notification(payload: str, shared: bool = True):
+    try:
+        change = json.loads(payload)
+        schema, table = change["schema"], change["table"]
+    except (ValueError, KeyError, TypeError):
+        LOGGER.warning("Unrecognised change notification %r, dropping all cached rows", payload)
+        invalidate_all_cached_rows(shared)
+        return
+    invalidate_cached_rows(schema, table, shared)
+    # Keys written by this service were added to the key filters after their commit. Keys written by
+    # anyone else are unknown, so the filter must answer "maybe" until it has been rebuilt.
+    if (
+        key_filters and shared and change.get("op") in ("INSERT", "UPDATE")
+        and change.get("application") != APPLICATION_NAME
+    ):
+        key_filters.mark_stale(schema, table)
+
+
+class ChangeListener(threading.Thread):
+    """Background thread that invalidates cached rows when Postgres reports a change.
+
+    Notifications sent while the listener is disconnected are lost, so every
+    (re)connect starts by dropping all cached rows. Every worker runs a listener
+    for its own in-process caches, but only the one holding an flock on the
+    shared cache's listener lock file invalidates the shared row cache. When
+    that worker exits, another listener takes the lock over and starts by
+    dropping all cached rows.
+    """
+
+    def __init__(self, channel: str = DB_NOTIFY_CHANNEL):
+        super().__init__(name="db-change-listener", daemon=True)
+        self.channel = channel
+        self._stopped = threading.Event()
+        self._owner_fd = None
+        self._owns_shared_cache = row_cache is None
+
+    def stop(self):
+        self._stopped.set()
+
+    def _claim_shared_cache(self) -> bool:
+        """Tries to become the listener that invalidates the shared row cache; True when it just did."""
+        if self._owns_shared_cache:
+            return False
+        if self._owner_fd is None:
+            lock_path = os.path.join(tempfile.gettempdir(), f"{DB_SHARED_CACHE_NAME}.listener.lock")
+            self._owner_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._owner_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self._owns_shared_cache = True
+        LOGGER.info("This worker's change listener now invalidates the shared row cache")
+        return True
+
+    def run(self):
+        delay = MIN_RECONNECT_DELAY
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                self._claim_shared_cache()
+                invalidate_all_cached_rows(self._owns_shared_cache)
+                LOGGER.info("Listening for changes on channel %s", self.channel)
+                delay = MIN_RECONNECT_DELAY
+                self._listen(conn)
+            except psycopg2.Error as e:
+                LOGGER.warning("Change listener lost its connection (%s), reconnecting in %.0fs", e, delay)
+                self._stopped.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            except Exception:
+                # Anything else would end the thread and leave the caches silently stale.
+                LOGGER.exception("Change listener failed, reconnecting in %.0fs", delay)
+                self._stopped.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+        if self._owner_fd is not None:
+            # Closing the descriptor releases the lock to the next worker's listener.
+            os.close(self._owner_fd)
+
+    def _listen(self, conn):
+        while not self._stopped.is_set():
+            if self._claim_shared_cache():
+                # The previous owner may have missed notifications before it went away.
+                invalidate_all_cached_rows()
+            if select.select([conn], [], [], POLL_INTERVAL) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                handle_notification(conn.notifies.pop(0).payload, self._owns_shared_cache)
+
+
+def start_change_listener() -> Optional[ChangeListener]:
+    if not DB_CHANGE_LISTENER:
+        return None
+    listener = ChangeListener()
+    listener.start()
+    return listener
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Install change notification triggers for cache invalidation")
+    parser.add_argument("tables", nargs="+", help="Tables to watch, as schema.table")
+    parser.add_argument("--channel", default=DB_NOTIFY_CHANNEL, help="NOTIFY channel name")
+    args = parser.parse_args()
+    tables = []
+    for name in args.tables:
+        schema, _, table = name.partition(".")
+        if not schema or not table:
+            parser.error(f"table '{name}' must be written as schema.table")
+        tables.append((schema, table))
+    logging.basicConfig(level=logging.INFO)
+    install_notify_triggers(tables, args.channel)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from psycopg2 import InterfaceError, OperationalError
+
+# The server rolled the transaction back, so running it again cannot apply a write twice.
+ROLLED_BACK_SQLSTATES = {"40001", "40P01"}  # serialization_failure, deadlock_detected
+# The server is going away or refusing connections.
+SHUTDOWN_SQLSTATES = {"57P01", "57P02", "57P03"}  # admin_shutdown, crash_shutdown, cannot_connect_now
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class TransientDatabaseError(HTTPException):
+    """A database failure that may succeed when tried again.
+
+    ``write_safe`` means the failed attempt cannot have committed anything, so
+    even non-idempotent operations may be retried. ``outage`` means the failure
+    says the database is unreachable, and counts towards opening the circuit
+    breaker.
+    """
+
+    def __init__(self, detail: str, write_safe: bool, outage: bool):
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": "1"})
+        self.write_safe = write_safe
+        self.outage = outage
+
+
+class CircuitOpenError(HTTPException):
+    """Raised instead of calling a database that the circuit breaker has given up on."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail="Database unavailable, circuit breaker is open",
+            headers={"Retry-After": str(max(1, int(retry_after + 1)))},
+        )
+
+
+def classify_error(error: Exception, connecting: bool = False) -> Optional[TransientDatabaseError]:
+    """Returns the transient error to raise for a psycopg2 error, or None when retrying cannot help."""
+    code = getattr(error, "pgcode", None)
+    if code in ROLLED_BACK_SQLSTATES:
+        return TransientDatabaseError(f"Transaction aborted, retry the request: {error}", write_safe=True, outage=False)
+    if code in SHUTDOWN_SQLSTATES or (code or "").startswith("08") or (
+        code is None and isinstance(error, (OperationalError, InterfaceError))
+    ):
+        # A connection that fails before any statement was sent cannot have written anything.
+        return TransientDatabaseError(f"Database unavailable: {error}", write_safe=connecting, outage=True)
+    return None
+
+
+class CircuitBreaker:
+    """Stops sending work to a database that keeps failing.
+
+    After ``failure_threshold`` consecutive outage failures the breaker opens
+    and every call fails at once with a 503 for ``reset_timeout`` seconds. After
+    that, one call is let through as a probe. If the probe succeeds the breaker
+    closes, and if it fails the breaker opens again. A call that never reached
+    the database, such as one that timed out waiting for a pooled connection,
+    counts as neither and only lets the next call probe.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            retry_after = self._opened_at + self._reset_timeout - time.monotonic()
+            if retry_after <= 0 and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpenError(retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._probing else "open"
+
+
+class RetryPolicy:
+    """Retries transient database errors with exponential backoff and full jitter.
+
+    Operations that are not idempotent are only retried when the failed attempt
+    cannot have committed anything. A retry is never started if its backoff would
+    run past the request deadline.
+    """
+
+    def __init__(self, attempts: int, base_delay: float, max_delay: float):
+        self._attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    def run(self, operation: Callable[[], Any], idempotent: bool, deadline: Optional[float] = None, canceller=None) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return operation()
+            except TransientDatabaseError as error:
+                attempt += 1
+                if attempt > self._attempts or not (idempotent or error.write_safe):
+                    raise
+                delay = random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                if canceller is not None and canceller.cancelled:
+                    raise
+                time.sleep(delay)
@@ -0,0 +1,225 @@
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional
+
+MAGIC = b"OASCACH2"
+HEADER = struct.Struct("=8sIII")  # magic, bucket_count, ways, slot_size
+HEADER_SIZE = 64
+# version (seqlock), key hash, table hash, expires at, CLOCK reference bit, key length, value length, table generation
+SLOT_HEADER = struct.Struct("=QQQdBHIQ")
+VERSION = struct.Struct("=Q")
+GENERATION = struct.Struct("=Q")
+REF_OFFSET = 32
+SLOT_ALIGNMENT = 64
+# Tables hash onto this many generation counters; a collision only costs the other table some misses.
+GENERATION_SLOTS = 4096
+LOCK_STRIPES = 64
+READ_RETRIES = 3
+INIT_LOCK = 0
+GENERATION_LOCK = LOCK_STRIPES + 1
+
+
+def _hash(data: bytes) -> int:
+    # 0 marks an empty slot, so never hand it out as a real hash.
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little") or 1
+
+
+def _align(value: int, alignment: int = SLOT_ALIGNMENT) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def table_cache_key(schema: str, table: str) -> str:
+    return f"{schema}.{table}"
+
+
+def row_cache_key(schema: str, table: str, params: Dict[str, Any]) -> str:
+    return f"{table_cache_key(schema, table)}?{json.dumps(sorted(params.items()), default=str)}"
+
+
+class SharedRowCache:
+    """Set-associative hash table in POSIX shared memory, shared by every worker on the host.
+
+    Each key maps to a bucket of ``ways`` fixed-size slots; a per-bucket CLOCK hand
+    picks the victim when the bucket is full. Reads are lock-free: writers bump a
+    per-slot sequence counter to an odd value while copying data in, and a reader
+    that sees the counter move treats the lookup as a miss. Writers serialise per
+    bucket stripe with a thread lock inside the worker and an fcntl byte-range
+    lock across workers.
+
+    Invalidating a table bumps its generation counter instead of scanning the
+    slots. Every entry is stamped with the generation its caller read before
+    querying the database, and an entry whose stamp no longer matches is a miss.
+    So a row read before a concurrent write cannot be cached after that write's
+    invalidation.
+    """
+
+    def __init__(self, name: str, slots: int, slot_size: int, ways: int = 8):
+        self._name = name
+        self._thread_locks = [threading.Lock() for _ in range(GENERATION_LOCK + 1)]
+        lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        ways = max(1, min(ways, 255))
+        bucket_count = max(1, slots // ways)
+        slot_size = _align(max(slot_size, SLOT_HEADER.size + 1))
+        hands_size = _align(bucket_count)
+        size = HEADER_SIZE + GENERATION_SLOTS * GENERATION.size + hands_size + bucket_count * ways * slot_size
+
+        with self._locked(INIT_LOCK):
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                HEADER.pack_into(self._shm.buf, 0, MAGIC, bucket_count, ways, slot_size)
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+        # Workers come and go independently; the segment must outlive whichever one created it.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        magic, self.bucket_count, self.ways, self.slot_size = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC:
+            raise RuntimeError(f"Shared memory segment '{name}' is not a row cache.")
+        self._generations_offset = HEADER_SIZE
+        self._hands_offset = HEADER_SIZE + GENERATION_SLOTS * GENERATION.size
+        self._slots_offset = self._hands_offset + _align(self.bucket_count)
+        self._buf = self._shm.buf
+
+    @contextmanager
+    def _locked(self, lock_index: int):
+        with self._thread_locks[lock_index]:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, lock_index)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, lock_index)
+
+    def _bucket(self, key_hash: int) -> int:
+        return key_hash % self.bucket_count
+
+    def _stripe_lock(self, bucket: int) -> int:
+        return 1 + bucket % LOCK_STRIPES
+
+    def _slot_offset(self, bucket: int, way: int) -> int:
+        return self._slots_offset + (bucket * self.ways + way) * self.slot_size
+
+    def _generation_offset(self, table_hash: int) -> int:
+        return self._generations_offset + table_hash % GENERATION_SLOTS * GENERATION.size
+
+    def _current_generation(self, table_hash: int) -> int:
+        return GENERATION.unpack_from(self._buf, self._generation_offset(table_hash))[0]
+
+    def generation(self, table_key: str) -> int:
+        """Returns the table's generation; read it before querying the database and pass it to set."""
+        return self._current_generation(_hash(table_key.encode()))
+
+    def get(self, key: str) -> Optional[bytes]:
+        key_bytes = key.encode()
+        key_hash = _hash(key_bytes)
+        bucket = self._bucket(key_hash)
+        for way in range(self.ways):
+            offset = self._slot_offset(bucket, way)
+            for _ in range(READ_RETRIES):
+                version, slot_hash, table_hash, expires_at, ref, key_len, value_len, generation = (
+                    SLOT_HEADER.unpack_from(self._buf, offset)
+                )
+                if version & 1:
+                    continue
+                if slot_hash != key_hash:
+                    break
+                data_offset = offset + SLOT_HEADER.size
+                stored_key = bytes(self._buf[data_offset:data_offset + key_len])
+                value = bytes(self._buf[data_offset + key_len:data_offset + key_len + value_len])
+                if VERSION.unpack_from(self._buf, offset)[0] != version:
+                    continue
+                if stored_key != key_bytes or expires_at < time.time():
+                    return None
+                if generation != self._current_generation(table_hash):
+                    return None
+                if not ref:
+                    # A lost update here only costs one CLOCK pass, so no lock is taken.
+                    self._buf[offset + REF_OFFSET] = 1
+                return value
+        return None
+
+    def set(self, key: str, table_key: str, value: bytes, ttl: float, generation: int) -> bool:
+        key_bytes = key.encode()
+        if SLOT_HEADER.size + len(key_bytes) + len(value) > self.slot_size:
+            return False
+        table_hash = _hash(table_key.encode())
+        if generation != self._current_generation(table_hash):
+            return False
+        key_hash = _hash(key_bytes)
+        bucket = self._bucket(key_hash)
+        with self._locked(self._stripe_lock(bucket)):
+            way = self._choose_way(bucket, key_hash)
+            self._write_slot(
+                self._slot_offset(bucket, way), key_hash, table_hash,
+                time.time() + ttl, key_bytes, value, generation
+            )
+        return True
+
+    def _choose_way(self, bucket: int, key_hash: int) -> int:
+        now = time.time()
+        for way in range(self.ways):
+            _, slot_hash, table_hash, expires_at, _, _, _, generation = (
+                SLOT_HEADER.unpack_from(self._buf, self._slot_offset(bucket, way))
+            )
+            if slot_hash == key_hash or slot_hash == 0 or expires_at < now:
+                return way
+            if generation != self._current_generation(table_hash):
+                return way
+        hand_offset = self._hands_offset + bucket
+        hand = self._buf[hand_offset] % self.ways
+        for _ in range(2 * self.ways):
+            ref_offset = self._slot_offset(bucket, hand) + REF_OFFSET
+            if not self._buf[ref_offset]:
+                break
+            self._buf[ref_offset] = 0
+            hand = (hand + 1) % self.ways
+        self._buf[hand_offset] = (hand + 1) % self.ways
+        return hand
+
+    def _write_slot(self, offset: int, key_hash: int, table_hash: int, expires_at: float,
+                    key_bytes: bytes = b"", value: bytes = b"", generation: int = 0):
+        version = VERSION.unpack_from(self._buf, offset)[0]
+        VERSION.pack_into(self._buf, offset, version + 1)
+        SLOT_HEADER.pack_into(
+            self._buf, offset, version + 1, key_hash, table_hash, expires_at, 0, len(key_bytes), len(value), generation
+        )
+        data_offset = offset + SLOT_HEADER.size
+        self._buf[data_offset:data_offset + len(key_bytes)] = key_bytes
+        self._buf[data_offset + len(key_bytes):data_offset + len(key_bytes) + len(value)] = value
+        VERSION.pack_into(self._buf, offset, version + 2)
+
+    def invalidate(self, key: str):
+        key_hash = _hash(key.encode())
+        bucket = self._bucket(key_hash)
+        with self._locked(self._stripe_lock(bucket)):
+            for way in range(self.ways):
+                offset = self._slot_offset(bucket, way)
+                if SLOT_HEADER.unpack_from(self._buf, offset)[1] == key_hash:
+                    self._write_slot(offset, 0, 0, 0.0)
+
+    def invalidate_table(self, table_key: str):
+        self._bump_generations([self._generation_offset(_hash(table_key.encode()))])
+
+    def clear(self):
+        self._bump_generations(
+            self._generations_offset + index * GENERATION.size for index in range(GENERATION_SLOTS)
+        )
+
+    def _bump_generations(self, offsets):
+        with self._locked(GENERATION_LOCK):
+            for offset in offsets:
+                GENERATION.pack_into(self._buf, offset, GENERATION.unpack_from(self._buf, offset)[0] + 1)
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        os.close(self._lock_fd)
@@ -0,0 +1,423 @@
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2 import sql
+
+from openapi_server.db.catalog import parse_table_columns, primary_key_column
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"OASSNAP1"
+HEADER = struct.Struct("=8sQ")  # magic, metadata length
+ALIGNMENT = 8
+FLUSH_BYTES = 1 << 20
+COPY_NULL = b"\\N"
+COPY_ESCAPE_PATTERN = re.compile(rb"\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)", re.S)
+COPY_ESCAPES = {b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v"}
+
+# Postgres type OIDs whose text form is decoded to the Python type psycopg2 would return.
+DECODER_NAMES_BY_TYPE_OID = {
+    16: "bool",
+    20: "int", 21: "int", 23: "int", 26: "int",
+    700: "float", 701: "float",
+    1700: "decimal",
+    114: "json", 3802: "json",
+}
+DECODERS: Dict[str, Callable[[memoryview], Any]] = {
+    "text": lambda value: str(value, "utf-8"),
+    "int": lambda value: int(bytes(value)),
+    "float": lambda value: float(bytes(value)),
+    "decimal": lambda value: Decimal(str(value, "ascii")),
+    "bool": lambda value: bytes(value) == b"t",
+    "json": lambda value: json.loads(bytes(value)),
+}
+
+
+def snapshot_file_name(schema: str, table: str) -> str:
+    return f"{schema}.{table}.snap"
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _unescape_match(match) -> bytes:
+    escape = match.group(1)
+    if escape[:1] == b"x" and len(escape) > 1:
+        return bytes([int(escape[1:], 16)])
+    if escape[:1].isdigit():
+        return bytes([int(escape, 8) & 0xFF])
+    return COPY_ESCAPES.get(escape, escape)
+
+
+def unescape_copy_value(value: bytes) -> bytes:
+    return COPY_ESCAPE_PATTERN.sub(_unescape_match, value) if b"\\" in value else value
+
+
+class _Spool:
+    """An append-only temporary file that buffers writes in memory."""
+
+    def __init__(self, directory: str):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.length = 0
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        self.length += len(data)
+        if len(self._buffer) >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self._buffer)
+        self._buffer.clear()
+
+    def close(self):
+        self.file.close()
+
+
+class _ColumnWriter:
+    """Spools one column as (row count + 1) offsets, a null bitmap and the concatenated values."""
+
+    def __init__(self, directory: str):
+        self.offsets = _Spool(directory)
+        self.data = _Spool(directory)
+        self.nulls = bytearray()
+        self.offsets.write(struct.pack("=Q", 0))
+
+    def append(self, row: int, value: Optional[bytes]):
+        if row % 8 == 0:
+            self.nulls.append(0)
+        if value is None:
+            self.nulls[row >> 3] |= 1 << (row & 7)
+        else:
+            self.data.write(value)
+        self.offsets.write(struct.pack("=Q", self.data.length))
+
+
+class SnapshotWriter:
+    """File-like target for ``COPY ... TO STDOUT`` that builds a snapshot file.
+
+    Rows must arrive in strictly increasing key order: integer order for integer
+    keys, byte order of the text form for all others. Each column is stored on
+    its own, so no row is ever held in memory. Integer keys also get a sorted
+    int64 index. Text keys are searched through the key column's own offsets.
+    """
+
+    def __init__(self, path: str, schema: str, table: str, key_column: str, columns: List[Dict[str, str]]):
+        self._path = path
+        self._directory = os.path.dirname(os.path.abspath(path))
+        self._meta = {
+            "schema": schema,
+            "table": table,
+            "key_column": key_column,
+            "columns": columns,
+        }
+        self._key_index = [column["name"] for column in columns].index(key_column)
+        self.key_type = "int" if columns[self._key_index]["type"] == "int" else "text"
+        self._columns = [_ColumnWriter(self._directory) for _ in columns]
+        self._keys = _Spool(self._directory) if self.key_type == "int" else None
+        self._previous_key = None
+        self._pending = b""
+        self.rows = 0
+
+    def write(self, data: bytes):
+        lines = (self._pending + bytes(data)).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._add_row(line.split(b"\t"))
+
+    def _add_row(self, fields: List[bytes]):
+        if len(fields) != len(self._columns):
+            raise ValueError(f"COPY row {self.rows} has {len(fields)} fields, expected {len(self._columns)}")
+        values = [None if field == COPY_NULL else unescape_copy_value(field) for field in fields]
+        key = values[self._key_index]
+        if key is None:
+            raise ValueError(f"Row {self.rows} has no {self._meta['key_column']}")
+        if self.key_type == "int":
+            key = int(key)
+        if self._previous_key is not None and key <= self._previous_key:
+            raise ValueError(f"{self._meta['key_column']} values must be unique and sorted, {key!r} is out of order")
+        self._previous_key = key
+        if self._keys is not None:
+            self._keys.write(struct.pack("=q", key))
+        for column, value in zip(self._columns, values):
+            column.append(self.rows, value)
+        self.rows += 1
+
+    def _sections(self) -> List[Tuple[str, Any, int]]:
+        sections = [("keys", self._keys, self._keys.length)] if self._keys is not None else []
+        for index, column in enumerate(self._columns):
+            sections += [
+                (f"{index}.offsets", column.offsets, column.offsets.length),
+                (f"{index}.nulls", bytes(column.nulls), len(column.nulls)),
+                (f"{index}.data", column.data, column.data.length),
+            ]
+        return sections
+
+    def finish(self):
+        """Writes the snapshot next to its final path, then renames it into place."""
+        if self._pending:
+            raise ValueError("COPY output ended in the middle of a row")
+        sections = self._sections()
+        offset = 0
+        layout = {}
+        for name, _, length in sections:
+            layout[name] = [offset, length]
+            offset = _aligned(offset + length)
+        meta = json.dumps({
+            **self._meta,
+            "key_type": self.key_type,
+            "rows": self.rows,
+            "created_at": time.time(),
+            "sections": layout,
+        }).encode()
+
+        handle, temporary_path = tempfile.mkstemp(dir=self._directory, prefix=f".{os.path.basename(self._path)}.")
+        try:
+            with os.fdopen(handle, "wb") as snapshot_file:
+                snapshot_file.write(HEADER.pack(MAGIC, len(meta)) + meta)
+                snapshot_file.write(b"\0" * (_aligned(HEADER.size + len(meta)) - HEADER.size - len(meta)))
+                for name, section, length in sections:
+                    if isinstance(section, bytes):
+                        snapshot_file.write(section)
+                    else:
+                        section.flush()
+                        section.file.seek(0)
+                        shutil.copyfileobj(section.file, snapshot_file)
+                    snapshot_file.write(b"\0" * (_aligned(length) - length))
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            # Readers that still map the previous file keep it until they let go of it.
+            os.replace(temporary_path, self._path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        for column in self._columns:
+            column.offsets.close()
+            column.data.close()
+        if self._keys is not None:
+            self._keys.close()
+
+
+def export_snapshot(session_factory, schema: str, table: str, key_column: Optional[str], path: str) -> int:
+    """Streams a table through COPY into a snapshot file at ``path``; returns the number of rows.
+
+    The key column defaults to the table's primary key.
+    """
+    table_name = sql.Identifier(schema, table)
+    with session_factory() as (conn, cursor):
+        if key_column is None:
+            key_column = primary_key_column(conn, schema, table)
+            if key_column is None:
+                raise ValueError(f"{schema}.{table} has no single-column primary key, give it as {schema}.{table}:<column>")
+        key = sql.Identifier(key_column)
+        cursor.execute(sql.SQL("SELECT * FROM {table} LIMIT 0").format(table=table_name))
+        columns = [
+            {"name": column.name, "type": DECODER_NAMES_BY_TYPE_OID.get(column.type_code, "text")}
+            for column in cursor.description
+        ]
+        if key_column not in [column["name"] for column in columns]:
+            raise ValueError(f"{schema}.{table} has no column {key_column}")
+        writer = SnapshotWriter(path, schema, table, key_column, columns)
+        try:
+            # Byte order of the text form ("C" collation) is what the reader's binary search compares.
+            order = sql.SQL("{key}") if writer.key_type == "int" else sql.SQL('{key}::text COLLATE "C"')
+            cursor.copy_expert(sql.SQL(
+                "COPY (SELECT * FROM {table} WHERE {key} IS NOT NULL ORDER BY {order}) TO STDOUT"
+            ).format(table=table_name, key=key, order=order.format(key=key)), writer)
+        except BaseException:
+            writer.close()
+            raise
+    writer.finish()
+    return writer.rows
+
+
+class Snapshot:
+    """A read-only, memory-mapped table snapshot written by SnapshotWriter.
+
+    Opening a snapshot reads nothing but its metadata, whatever the table size,
+    and the pages are shared by every worker through the OS page cache. Lookups
+    are not zero-copy: an integer key is searched in place, but each text key
+    compared and each field of the matching row is copied out of the mapping. The
+    mapping stays valid after the file is replaced, and it is released once the
+    last lookup holding this object finishes.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as snapshot_file:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(mapped)
+        magic, meta_length = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a table snapshot")
+        meta = json.loads(bytes(buffer[HEADER.size:HEADER.size + meta_length]))
+        base = _aligned(HEADER.size + meta_length)
+
+        def section(name: str) -> memoryview:
+            offset, length = meta["sections"][name]
+            return buffer[base + offset:base + offset + length]
+
+        self.path = path
+        self.schema = meta["schema"]
+        self.table = meta["table"]
+        self.key_column = meta["key_column"]
+        self.key_type = meta["key_type"]
+        self.rows = meta["rows"]
+        self.created_at = meta["created_at"]
+        self.size = len(mapped)
+        self._columns = [
+            (column["name"], DECODERS[column["type"]], section(f"{index}.offsets").cast("Q"),
+             section(f"{index}.nulls"), section(f"{index}.data"))
+            for index, column in enumerate(meta["columns"])
+        ]
+        key_index = [column["name"] for column in meta["columns"]].index(self.key_column)
+        _, _, self._key_offsets, _, self._key_data = self._columns[key_index]
+        self._keys = section("keys").cast("q") if self.key_type == "int" else None
+
+    def _find(self, key: Any) -> Optional[int]:
+        if self._keys is not None:
+            try:
+                key = int(key)
+            except (TypeError, ValueError):
+                return None
+            index = bisect.bisect_left(self._keys, key)
+            return index if index < self.rows and self._keys[index] == key else None
+        key = str(key).encode()
+        offsets, data = self._key_offsets, self._key_data
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(data[offsets[middle]:offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.rows and data[offsets[low]:offsets[low + 1]] == key:
+            return low
+        return None
+
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        index = self._find(key)
+        if index is None:
+            return None
+        row = {}
+        for name, decode, offsets, nulls, data in self._columns:
+            if nulls[index >> 3] & (1 << (index & 7)):
+                row[name] = None
+            else:
+                row[name] = decode(data[offsets[index]:offsets[index + 1]])
+        return row
+
+
+class SnapshotStore:
+    """Finds the current snapshot of each table in ``directory``.
+
+    The file of a table is looked at again at most every ``check_interval``
+    seconds. When it has been replaced, the new file is opened and swapped in,
+    while lookups already running finish against the old one. Tables in
+    ``served_tables`` are read from their snapshot instead of Postgres.
+    """
+
+    def __init__(self, directory: str, served_tables: Iterable[Tuple[str, str]], check_interval: float):
+        self._directory = directory
+        self._served_tables = set(served_tables)
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshots: Dict[Tuple[str, str], Snapshot] = {}
+        self._signatures: Dict[Tuple[str, str], tuple] = {}
+        self._checked_at: Dict[Tuple[str, str], float] = {}
+
+    def path(self, schema: str, table: str) -> str:
+        return os.path.join(self._directory, snapshot_file_name(schema, table))
+
+    def serves(self, schema: str, table: str) -> bool:
+        return (schema, table) in self._served_tables
+
+    def snapshot(self, schema: str, table: str) -> Optional[Snapshot]:
+        key = (schema, table)
+        if time.monotonic() - self._checked_at.get(key, float("-inf")) >= self._check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at.get(key, float("-inf")) >= self._check_interval:
+                    self._reload(key)
+                    self._checked_at[key] = time.monotonic()
+        return self._snapshots.get(key)
+
+    def _reload(self, key: Tuple[str, str]):
+        path = self.path(*key)
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            if self._snapshots.pop(key, None) is not None:
+                LOGGER.warning(f"Snapshot {path} was removed")
+            self._signatures.pop(key, None)
+            return
+        signature = (status.st_ino, status.st_mtime_ns, status.st_size)
+        if signature == self._signatures.get(key):
+            return
+        try:
+            snapshot = Snapshot(path)
+        except (OSError, ValueError, KeyError):
+            LOGGER.exception(f"Loading snapshot {path} failed, keeping the previous one")
+            return
+        if (snapshot.schema, snapshot.table) != key:
+            LOGGER.error(f"Snapshot {path} holds {snapshot.schema}.{snapshot.table}, ignoring it")
+            return
+        self._snapshots[key] = snapshot
+        self._signatures[key] = signature
+        LOGGER.info(f"Loaded snapshot {path}: {snapshot.rows} rows, {snapshot.size} bytes")
+
+    def lookup_snapshot(self, schema: str, table: str, params: Dict[str, Any]) -> Optional[Snapshot]:
+        """Returns the snapshot that can answer a GET with these filters, which must be exactly its key column."""
+        snapshot = self.snapshot(schema, table)
+        if snapshot is None or len(params) != 1 or params.get(snapshot.key_column) is None:
+            return None
+        return snapshot
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            f"{schema}.{table}": {
+                "rows": snapshot.rows,
+                "size_bytes": snapshot.size,
+                "age_seconds": round(time.time() - snapshot.created_at, 1),
+                "served": self.serves(schema, table),
+            }
+            for (schema, table), snapshot in list(self._snapshots.items())
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export tables into snapshot files for read-only lookups")
+    parser.add_argument("tables", nargs="+", help="Tables to export, as schema.table[:key column], the key defaults to the primary key")
+    parser.add_argument("--directory", help="Where to write the snapshots, defaults to DB_SNAPSHOT_DIR")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from openapi_server.db.database import DB_SNAPSHOT_DIR, db_session
+
+    directory = args.directory or DB_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    for (schema, table), key_column in parse_table_columns(",".join(args.tables)).items():
+        path = os.path.join(directory, snapshot_file_name(schema, table))
+        started = time.monotonic()
+        rows = export_snapshot(db_session, schema, table, key_column, path)
+        LOGGER.info(f"Exported {rows} rows of {schema}.{table} to {path} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
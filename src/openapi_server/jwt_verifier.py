@@ -0,0 +1,157 @@
+# coding: utf-8
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import jwt
+import requests
+
+LOGGER = logging.getLogger(__name__)
+
+JWKS_FETCH_TIMEOUT = 5.0
+# Tokens with an unknown kid force a refetch at most this often, so a client can't hammer the identity provider.
+MIN_UNKNOWN_KID_REFRESH_INTERVAL = 30.0
+
+
+class KeySetUnavailable(Exception):
+    pass
+
+
+class JWKSKeySet:
+    """Signing keys fetched from a JWKS URL and kept in memory.
+
+    Once the keys are older than ``refresh_interval`` they are refetched on a
+    background thread while requests keep using the current ones. Only the
+    first fetch, and a token signed with a ``kid`` that is not in the set
+    (after a key rotation), make a request wait for the URL.
+    """
+
+    def __init__(self, url: str, refresh_interval: float, on_change: Optional[Callable[[], None]] = None):
+        self._url = url
+        self._refresh_interval = refresh_interval
+        self.on_change = on_change
+        self._keys: Dict[Optional[str], Any] = {}
+        self._jwks_document = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _fetch(self):
+        response = requests.get(self._url, timeout=JWKS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        jwks = response.json()
+        keys = {}
+        for key in jwt.PyJWKSet.from_dict(jwks).keys:
+            if key.public_key_use in (None, "sig"):
+                keys[key.key_id] = key.key
+        document = json.dumps(jwks.get("keys"), sort_keys=True)
+        changed = self._jwks_document is not None and document != self._jwks_document
+        self._keys = keys
+        self._jwks_document = document
+        self._fetched_at = time.monotonic()
+        if changed and self.on_change:
+            self.on_change()
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch()
+        except Exception:
+            LOGGER.exception(f"Refreshing the JWKS from {self._url} failed; keeping the current keys")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def resolve(self, header: Dict[str, Any]) -> Any:
+        kid = header.get("kid")
+        age = time.monotonic() - self._fetched_at
+        if not self._keys or (kid not in self._keys and age > MIN_UNKNOWN_KID_REFRESH_INTERVAL):
+            with self._lock:
+                try:
+                    stale = time.monotonic() - self._fetched_at > MIN_UNKNOWN_KID_REFRESH_INTERVAL
+                    # Another request may have fetched the keys while this one waited for the lock.
+                    if not self._keys or (kid not in self._keys and stale):
+                        self._fetch()
+                except (requests.RequestException, ValueError, jwt.PyJWKSetError) as error:
+                    if not self._keys:
+                        raise KeySetUnavailable(f"Could not fetch the JWKS from {self._url}: {error}")
+                    LOGGER.warning(f"Refetching the JWKS from {self._url} failed: {error}")
+        elif age > self._refresh_interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, name="jwks-refresh", daemon=True).start()
+
+        if kid in self._keys:
+            return self._keys[kid]
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        raise jwt.InvalidTokenError(f"No signing key found for kid '{kid}'")
+
+
+class JWTVerifier:
+    """Verifies JWTs and remembers the claims of verified tokens until they expire.
+
+    Tokens are cached by their SHA-256 digest, so the token itself is never kept,
+    in a bounded LRU. A cached token skips the signature check and claim
+    validation, except for its expiry, which is checked on every hit. Failed
+    verifications are never cached. ``clear`` drops every verified token, which
+    the key set does when its keys change, so a revoked key stops working
+    immediately.
+    """
+
+    def __init__(
+        self,
+        key_resolver: Callable[[Dict[str, Any]], Any],
+        algorithms: List[str],
+        audience: Optional[str] = None,
+        issuer: Optional[str] = None,
+        leeway: float = 0,
+        cache_size: int = 10000
+    ):
+        self._key_resolver = key_resolver
+        self._algorithms = algorithms
+        self._audience = audience
+        self._issuer = issuer
+        self._leeway = leeway
+        self._cache_size = cache_size
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        digest = hashlib.sha256(token.encode()).digest() if self._cache_size > 0 else None
+        if digest:
+            with self._lock:
+                entry = self._verified.get(digest)
+                if entry is not None:
+                    claims, expires_at = entry
+                    if time.time() < expires_at + self._leeway:
+                        self._verified.move_to_end(digest)
+                        return claims
+                    del self._verified[digest]
+
+        key = self._key_resolver(jwt.get_unverified_header(token))
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=self._algorithms,
+            audience=self._audience,
+            issuer=self._issuer,
+            leeway=self._leeway,
+            options={"require": ["exp"]},
+        )
+        if digest:
+            with self._lock:
+                self._verified[digest] = (claims, claims["exp"])
+                while len(self._verified) > self._cache_size:
+                    self._verified.popitem(last=False)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
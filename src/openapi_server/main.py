@@ -1,8 +1,54 @@
 # coding: utf-8
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from openapi_server.apis.admin_api import router as AdminApiRouter
 from openapi_server.apis.default_api import router as DefaultApiRouter
+from openapi_server.apis.openapi_api import router as OpenApiRouter
+from openapi_server.db.database import get_optional_config_value, key_filters
+from openapi_server.db.notify import start_change_listener
+from openapi_server.openapi_document import build_openapi_document
+from openapi_server.tracing import JsonlSpanExporter, OtlpSpanExporter, TracingMiddleware
+
+try:
+    from openapi_server.apis.specialized_api import router as SpecializedApiRouter
+except ModuleNotFoundError as e:
+    # Only a missing generated module means "not generated"; errors inside it must surface.
+    if e.name != "openapi_server.apis.specialized_api":
+        raise
+    SpecializedApiRouter = None
+
+TRACE_EXPORTER = get_optional_config_value("TRACE_EXPORTER", "").lower()
+TRACE_FILE = get_optional_config_value("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = get_optional_config_value("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = get_optional_config_value("TRACE_SERVICE_NAME", "openapi-server")
+TRACE_SAMPLE_RATE = float(get_optional_config_value("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(get_optional_config_value("TRACE_SLOW_MS", "500"))
+
+if TRACE_EXPORTER == "jsonl":
+    span_exporter = JsonlSpanExporter(TRACE_SERVICE_NAME, TRACE_FILE)
+elif TRACE_EXPORTER == "otlp":
+    span_exporter = OtlpSpanExporter(TRACE_SERVICE_NAME, TRACE_OTLP_ENDPOINT)
+else:
+    span_exporter = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.openapi_document = build_openapi_document(app)
+    change_listener = start_change_listener()
+    if key_filters:
+        key_filters.start()
+    yield
+    if key_filters:
+        key_filters.stop()
+    if change_listener:
+        change_listener.stop()
+    if span_exporter:
+        span_exporter.shutdown()
+
 
 app = FastAPI(
     title="User API",
@@ -11,6 +57,20 @@ app = FastAPI(
     servers=[
         {"url": "/", "description": "Root Server"},
     ],
+    lifespan=lifespan,
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
 )
 
+if span_exporter:
+    app.add_middleware(
+        TracingMiddleware, exporter=span_exporter, sample_rate=TRACE_SAMPLE_RATE, slow_ms=TRACE_SLOW_MS
+    )
+
+# Generated specialised routes must be matched before the generic ones they replace.
+if SpecializedApiRouter is not None:
+    app.include_router(SpecializedApiRouter)
 app.include_router(DefaultApiRouter)
+app.include_router(OpenApiRouter)
+app.include_router(AdminApiRouter)
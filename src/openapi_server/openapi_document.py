@@ -0,0 +1,54 @@
+# coding: utf-8
+
+import gzip
+import hashlib
+import json
+import os
+
+import yaml
+from fastapi import FastAPI, Request, Response
+
+PREBUILT_OPENAPI_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openapi.json")
+GZIP_MIN_SIZE = 1024
+
+
+class SerializedDocument:
+    """One pre-serialised representation of the OpenAPI document, with its gzip variant and ETag."""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.media_type = media_type
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0) if len(body) >= GZIP_MIN_SIZE else None
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        if self.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip_body, media_type=self.media_type, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
+
+
+class OpenAPIDocument:
+    def __init__(self, spec: dict):
+        self.json = SerializedDocument(
+            json.dumps(spec, separators=(",", ":"), default=str).encode(), "application/json"
+        )
+        self.yaml = SerializedDocument(
+            yaml.dump(spec, Dumper=yaml.CDumper, sort_keys=False).encode(), "application/yaml"
+        )
+
+
+def load_openapi_spec(app: FastAPI) -> dict:
+    # The prebuilt file is the merged spec written by `python src/utils.py --build`; fall back to FastAPI's own.
+    if os.path.exists(PREBUILT_OPENAPI_FILE):
+        with open(PREBUILT_OPENAPI_FILE, "r", encoding="utf-8") as spec_file:
+            return json.load(spec_file)
+    return app.openapi()
+
+
+def build_openapi_document(app: FastAPI) -> OpenAPIDocument:
+    return OpenAPIDocument(load_openapi_spec(app))
@@ -0,0 +1,105 @@
+# coding: utf-8
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Leaf functions of threads that are blocked rather than burning CPU.
+IDLE_LEAF_FUNCTIONS = {"wait", "select", "poll", "_wait_for_tstate_lock", "_worker"}
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of every other thread at a fixed interval.
+
+    Stacks are stored collapsed (root first, ``;``-separated) so the output can be
+    fed straight into flamegraph tools. Sampling only reads frames, so the cost is
+    one ``sys._current_frames()`` call per interval.
+    """
+
+    def __init__(self, interval: float, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+
+    def _sample(self, own_thread_id: int):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            if not self.include_idle and frame.f_code.co_name in IDLE_LEAF_FUNCTIONS:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self, duration: float):
+        own_thread_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        next_sample = time.monotonic()
+        while next_sample < deadline:
+            self._sample(own_thread_id)
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int) -> List[Dict[str, object]]:
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        stack_samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": label,
+                "self": self_counts[label],
+                "total": total,
+                "self_percent": round(100 * self_counts[label] / stack_samples, 2),
+                "total_percent": round(100 * total / stack_samples, 2),
+            }
+            for label, total in sorted(total_counts.items(), key=lambda item: (-self_counts[item[0]], -item[1]))[:limit]
+        ]
+
+
+class ProfilerGate:
+    """Allows one profile at a time per worker and enforces a cooldown between them."""
+
+    def __init__(self, cooldown: float):
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._running = False
+        self._last_finished: Optional[float] = None
+
+    def acquire(self) -> Optional[float]:
+        """Returns None when profiling may start, otherwise the seconds to wait."""
+        with self._lock:
+            if self._running:
+                return self.cooldown
+            if self._last_finished is not None:
+                remaining = self._last_finished + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    return remaining
+            self._running = True
+            return None
+
+    def release(self):
+        with self._lock:
+            self._running = False
+            self._last_finished = time.monotonic()
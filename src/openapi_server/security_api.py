@@ -1,8 +1,11 @@
 # coding: utf-8
 
-from typing import List
+import hmac
+from typing import List, Optional
 
-from fastapi import Depends, Security  # noqa: F401
+import jwt
+
+from fastapi import Depends, HTTPException, Security  # noqa: F401
 from fastapi.openapi.models import OAuthFlowImplicit, OAuthFlows  # noqa: F401
 from fastapi.security import (  # noqa: F401
     HTTPAuthorizationCredentials,
@@ -16,5 +19,75 @@ from fastapi.security import (  # noqa: F401
 )
 from fastapi.security.api_key import APIKeyCookie, APIKeyHeader, APIKeyQuery  # noqa: F401
 
+from openapi_server.db.database import get_optional_config_value
+from openapi_server.jwt_verifier import JWKSKeySet, JWTVerifier, KeySetUnavailable
 from openapi_server.models.extra_models import TokenModel
 
+ADMIN_TOKEN = get_optional_config_value("ADMIN_TOKEN", "")
+JWT_JWKS_URL = get_optional_config_value("JWT_JWKS_URL", "")
+JWT_SECRET = get_optional_config_value("JWT_SECRET", "")
+JWT_ALGORITHMS = get_optional_config_value("JWT_ALGORITHMS", "RS256" if JWT_JWKS_URL else "HS256").split(",")
+JWT_AUDIENCE = get_optional_config_value("JWT_AUDIENCE", "") or None
+JWT_ISSUER = get_optional_config_value("JWT_ISSUER", "") or None
+JWT_LEEWAY_SECONDS = float(get_optional_config_value("JWT_LEEWAY_SECONDS", "0"))
+JWT_JWKS_REFRESH_SECONDS = float(get_optional_config_value("JWT_JWKS_REFRESH_SECONDS", "300"))
+JWT_TOKEN_CACHE_SIZE = int(get_optional_config_value("JWT_TOKEN_CACHE_SIZE", "10000"))
+
+admin_token_header = APIKeyHeader(name="X-Admin-Token", auto_error=False)
+
+
+def get_admin_token(token: str = Security(admin_token_header)) -> str:
+    # Admin endpoints don't exist unless a token is configured.
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    return token
+
+
+def build_jwt_verifier() -> Optional[JWTVerifier]:
+    if JWT_JWKS_URL:
+        key_set = JWKSKeySet(JWT_JWKS_URL, JWT_JWKS_REFRESH_SECONDS)
+        key_resolver = key_set.resolve
+    elif JWT_SECRET:
+        key_set = None
+        key_resolver = lambda header: JWT_SECRET  # noqa: E731
+    else:
+        return None
+    verifier = JWTVerifier(
+        key_resolver,
+        algorithms=JWT_ALGORITHMS,
+        audience=JWT_AUDIENCE,
+        issuer=JWT_ISSUER,
+        leeway=JWT_LEEWAY_SECONDS,
+        cache_size=JWT_TOKEN_CACHE_SIZE
+    )
+    if key_set:
+        # Tokens verified with a key that was rotated out must not keep working from the cache.
+        key_set.on_change = verifier.clear
+    return verifier
+
+
+jwt_verifier = build_jwt_verifier()
+
+bearer_auth = HTTPBearer(auto_error=False)
+
+
+def get_token_bearer(credentials: HTTPAuthorizationCredentials = Security(bearer_auth)) -> TokenModel:
+    if jwt_verifier is None:
+        raise HTTPException(status_code=500, detail="Bearer authentication is not configured")
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = jwt_verifier.verify(credentials.credentials)
+    except KeySetUnavailable as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    except jwt.InvalidTokenError as error:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Invalid token: {error}",
+            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'}
+        )
+    if not isinstance(claims.get("sub"), str):
+        raise HTTPException(status_code=401, detail="Token has no subject", headers={"WWW-Authenticate": "Bearer"})
+    return TokenModel(sub=claims["sub"])
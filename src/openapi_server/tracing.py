@@ -0,0 +1,339 @@
+# coding: utf-8
+
+import abc
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import requests
+
+LOGGER = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+TRACESTATE_HEADER = "tracestate"
+TRACEPARENT_PATTERN = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+SAMPLED_FLAG = 0x01
+
+# OTLP span kinds and status codes.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+EXPORT_QUEUE_SIZE = 10000
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL = 1.0
+OTLP_TIMEOUT = 5.0
+
+current_span: ContextVar[Optional["Span"]] = ContextVar("openapi_server_current_span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id: str, sampled: bool, tracestate: Optional[str] = None):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.tracestate = tracestate
+        self.spans: List[Span] = []
+        self.last_child_end_ns: Optional[int] = None
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """Returns (trace_id, parent_span_id, sampled) for a valid W3C traceparent header, otherwise None."""
+    match = TRACEPARENT_PATTERN.match(value.strip().lower()) if value else None
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == INVALID_TRACE_ID or span_id == INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & SAMPLED_FLAG)
+
+
+def format_traceparent(span: Span) -> str:
+    return f"00-{span.trace.trace_id}-{span.span_id}-{SAMPLED_FLAG if span.trace.sampled else 0:02x}"
+
+
+@contextmanager
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL):
+    """Opens a child of the current span; does nothing when the request is not being traced."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as error:
+        if getattr(error, "status_code", 500) >= 500:
+            span.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        current_span.reset(token)
+        span.end()
+        if parent.kind == SPAN_KIND_SERVER:
+            parent.trace.last_child_end_ns = span.end_ns
+
+
+def statement_text(query, cursor) -> str:
+    if hasattr(query, "as_string"):
+        try:
+            return query.as_string(cursor)
+        except (TypeError, ValueError):
+            # Tracing must never fail the query it describes.
+            return repr(query)
+    return query.decode() if isinstance(query, bytes) else str(query)
+
+
+class TracedCursor:
+    """Wraps a DB-API cursor so that every execute gets its own span. Parameter values are never recorded."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, vars=None):
+        attributes = {"db.system": "postgresql", "db.statement": statement_text(query, self._cursor)}
+        with start_span("db.query", attributes, SPAN_KIND_CLIENT):
+            return self._cursor.execute(query, vars)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def trace_cursor(cursor):
+    return TracedCursor(cursor) if current_span.get() is not None else cursor
+
+
+def span_record(span: Span, service_name: str) -> Dict[str, Any]:
+    return {
+        "service": service_name,
+        "trace_id": span.trace.trace_id,
+        "span_id": span.span_id,
+        "parent_span_id": span.parent_id,
+        "name": span.name,
+        "kind": span.kind,
+        "start_time_unix_nano": span.start_ns,
+        "end_time_unix_nano": span.end_ns,
+        "duration_ms": round(span.duration_ms, 3),
+        "attributes": span.attributes,
+        "error": span.error,
+    }
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span: Span) -> Dict[str, Any]:
+    record = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span.attributes.items()],
+        "status": {"code": STATUS_ERROR, "message": span.error} if span.error else {"code": STATUS_UNSET},
+    }
+    if span.parent_id:
+        record["parentSpanId"] = span.parent_id
+    if span.trace.tracestate and span.parent_id is None:
+        record["traceState"] = span.trace.tracestate
+    return record
+
+
+class SpanExporter(abc.ABC):
+    """Hands finished traces to a background thread, so requests never wait on export I/O.
+
+    Traces are dropped, and counted in ``dropped``, when the queue is full.
+    """
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=EXPORT_INTERVAL)
+                while True:
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.extend(item)
+                    if len(batch) >= EXPORT_BATCH_SIZE:
+                        break
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    LOGGER.exception(f"Exporting {len(batch)} spans failed")
+
+    @abc.abstractmethod
+    def _write(self, spans: List[Span]):
+        """Writes one batch of spans; runs on the exporter thread."""
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=OTLP_TIMEOUT + 1)
+
+
+class JsonlSpanExporter(SpanExporter):
+    def __init__(self, service_name: str, file_path: str):
+        self._file_path = file_path
+        super().__init__(service_name)
+
+    def _write(self, spans: List[Span]):
+        lines = "".join(json.dumps(span_record(span, self.service_name), default=str) + "\n" for span in spans)
+        # One append per batch keeps lines from different workers from interleaving.
+        with open(self._file_path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(lines)
+
+
+class OtlpSpanExporter(SpanExporter):
+    """Sends spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, service_name: str, endpoint: str):
+        self._endpoint = endpoint
+        self._session = requests.Session()
+        super().__init__(service_name)
+
+    def _write(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": otlp_value(self.service_name)}]},
+                "scopeSpans": [{"scope": {"name": "openapi_server"}, "spans": [otlp_span(span) for span in spans]}],
+            }]
+        }
+        response = self._session.post(self._endpoint, json=payload, timeout=OTLP_TIMEOUT)
+        response.raise_for_status()
+
+
+class TracingMiddleware:
+    """Traces each HTTP request and exports the ones worth keeping.
+
+    The server span continues the trace from an incoming ``traceparent`` header,
+    or starts a new one, and the response carries a ``traceparent`` header for
+    it. A trace is head-sampled when the caller marked it sampled or it fell
+    within ``sample_rate``. Only head-sampled requests get handler and query
+    spans, and they are always exported. An unsampled request only times its
+    server span, which tail sampling exports on its own when the request took
+    at least ``slow_ms`` or failed with a 5xx status. A caller that marked the
+    trace unsampled gets nothing exported, since a lone span of a trace the
+    caller does not record would be an orphan. The time between the last
+    handler span and the response start is recorded as ``response.serialize``.
+    """
+
+    def __init__(self, app, exporter: SpanExporter, sample_rate: float, slow_ms: float):
+        self.app = app
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        incoming = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+            trace = Trace(trace_id, sampled, headers.get(TRACESTATE_HEADER))
+        else:
+            parent_id = None
+            trace = Trace(os.urandom(16).hex(), random.random() < self.sample_rate)
+        root = Span(trace, f"{scope['method']} {scope['path']}", parent_id, SPAN_KIND_SERVER, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        status_code = 500
+
+        async def traced_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if trace.last_child_end_ns:
+                    Span(trace, "response.serialize", root.span_id, start_ns=trace.last_child_end_ns).end()
+                message["headers"] = list(message.get("headers", [])) + [
+                    (TRACEPARENT_HEADER.encode(), format_traceparent(root).encode())
+                ]
+            await send(message)
+
+        # Without a current span, start_span and trace_cursor do nothing.
+        token = current_span.set(root) if trace.sampled else None
+        try:
+            await self.app(scope, receive, traced_send)
+        except BaseException as error:
+            root.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            if token is not None:
+                current_span.reset(token)
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                root.name = f"{scope['method']} {route.path}"
+                root.attributes["http.route"] = route.path
+            root.attributes["http.status_code"] = status_code
+            if status_code >= 500 and not root.error:
+                root.error = f"HTTP {status_code}"
+            root.end()
+            if trace.sampled or (not incoming and (root.duration_ms >= self.slow_ms or root.error)):
+                self.exporter.export(trace.spans)
@@ -1,10 +1,16 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
 import yaml
 from fastapi import (
     FastAPI,
     HTTPException
 )
 import copy
-from openapi_server.main import app
+
+MERGE_CACHE_VERSION = 1
 
 def load_existing_openapi(file_path: str) -> dict:
     try:
@@ -185,6 +191,98 @@ def clean_schema_properties(existing_schema: dict, new_schema: dict):
     if not existing_schema["properties"]:
         existing_schema.pop("properties", None)
 
+def fingerprint(*items) -> str:
+    # Dict order is stable for unchanged input (FastAPI output and YAML load order), so no key sorting is needed.
+    return hashlib.blake2b(json.dumps(items, default=str).encode(), digest_size=16).hexdigest()
+
+def merge_path_item(path: str, new_item: dict, existing_item: dict) -> dict:
+    merged_item = merge_paths({path: new_item}, {path: existing_item})[path]
+    clean_operations(new_item, merged_item)
+    return merged_item
+
+def merge_schema_item(new_schema: dict, existing_schema: dict) -> dict:
+    merged_schema = merge_schemas(existing_schema, new_schema)
+    clean_schema_properties(merged_schema, new_schema)
+    return merged_schema
+
+def merge_incrementally(new_items: dict, existing_items: dict, cached_items: dict, merge_func) -> tuple:
+    merged_items = {}
+    fingerprints = {}
+    ordered_keys = [key for key in existing_items if key in new_items]
+    ordered_keys += [key for key in new_items if key not in existing_items]
+    for key in ordered_keys:
+        new_item = new_items[key]
+        existing_item = existing_items.get(key, {})
+        item_fingerprint = fingerprint(new_item, existing_item)
+        cached = cached_items.get(key)
+        if cached and cached[0] == item_fingerprint:
+            merged_items[key] = cached[1]
+        else:
+            merged_items[key] = merge_func(key, new_item, existing_item)
+        fingerprints[key] = (item_fingerprint, merged_items[key])
+    return merged_items, fingerprints
+
+def find_and_apply_updates_incremental(new_openapi: dict, existing_openapi: dict, cache: dict) -> dict:
+    """Same result as find_and_apply_updates, but only re-merges path items and schemas whose inputs changed.
+
+    ``cache`` holds the fingerprints and merged entries of the previous run and is
+    updated in place. Nothing in ``existing_openapi`` is copied or mutated.
+    """
+    merged_openapi = dict(existing_openapi)
+    for field in ["openapi", "info", "servers"]:
+        if field in new_openapi:
+            merged_openapi[field] = merge_with_extensions(existing_openapi.get(field, {}), new_openapi[field])
+    merged_openapi["security"] = new_openapi.get("security", merged_openapi.pop("security", None))
+
+    if "paths" in new_openapi or "paths" in existing_openapi:
+        merged_openapi["paths"], cache["paths"] = merge_incrementally(
+            new_openapi.get("paths", {}),
+            existing_openapi.get("paths", {}),
+            cache.get("paths", {}),
+            merge_path_item
+        )
+
+    if "components" in merged_openapi or "components" in new_openapi:
+        existing_components = existing_openapi.get("components", {})
+        new_components = new_openapi.get("components", {})
+        merged_components = dict(existing_components)
+        for key in ["schemas", "parameters", "securitySchemes"]:
+            if key not in existing_components and not new_components.get(key):
+                continue
+            if key == "schemas":
+                merged_components[key], cache["schemas"] = merge_incrementally(
+                    new_components.get(key, {}),
+                    existing_components.get(key, {}),
+                    cache.get("schemas", {}),
+                    lambda _, new_schema, existing_schema: merge_schema_item(new_schema, existing_schema)
+                )
+            else:
+                existing_items = existing_components.get(key, {})
+                merged_components[key] = {
+                    name: merge_with_extensions(existing_items.get(name, {}), new_item)
+                    for name, new_item in new_components.get(key, {}).items()
+                }
+        merged_openapi["components"] = merged_components
+    return merged_openapi
+
+def load_merge_cache(file_path: str) -> dict:
+    # Pickled rather than JSON so merged entries keep their YAML-loaded types (dates etc.).
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != MERGE_CACHE_VERSION:
+        return {}
+    return cache
+
+def save_merge_cache(file_path: str, cache: dict):
+    cache["version"] = MERGE_CACHE_VERSION
+    with open(file_path, 'wb') as cache_file:
+        pickle.dump(cache, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
 def listed_security_requirement(scheme):
         return frozenset((k, tuple(v)) for k, v in scheme.items())
 
@@ -192,14 +290,49 @@ def save_openapi(file_path: str, openapi_data: dict):
     with open(file_path, 'w') as openapi_file:
         yaml.dump(openapi_data, openapi_file, Dumper=yaml.CDumper)
 
+def cli_args_config():
+    parser = argparse.ArgumentParser(description="Regenerate the OpenAPI file from the FastAPI app")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-merge path items and schemas that changed since the last run"
+    )
+    parser.add_argument(
+        "--cache_file",
+        default="./.openapi-merge-cache",
+        help="Where incremental mode keeps its fingerprints"
+    )
+    parser.add_argument(
+        "--build",
+        action="store_true",
+        help="Also write the merged spec into the server package so the app serves it"
+    )
+    return parser.parse_args()
+
+def save_prebuilt_openapi(openapi_data: dict):
+    from openapi_server.openapi_document import PREBUILT_OPENAPI_FILE
+    with open(PREBUILT_OPENAPI_FILE, 'w', encoding='utf-8') as openapi_file:
+        json.dump(openapi_data, openapi_file, default=str)
+    return PREBUILT_OPENAPI_FILE
+
 def main():    
+    from openapi_server.main import app
+
+    cli_args = cli_args_config()
     existing_file = './openapi.yaml'
     output_file = './regenerated-openapi.yaml'
     try:
         new_openapi = generate_new_openapi(app)
         existing_openapi = load_existing_openapi(existing_file)
-        updated_openapi = find_and_apply_updates(new_openapi, existing_openapi)
+        if cli_args.incremental:
+            cache = load_merge_cache(cli_args.cache_file)
+            updated_openapi = find_and_apply_updates_incremental(new_openapi, existing_openapi, cache)
+            save_merge_cache(cli_args.cache_file, cache)
+        else:
+            updated_openapi = find_and_apply_updates(new_openapi, existing_openapi)
         save_openapi(output_file, updated_openapi)
+        if cli_args.build:
+            print(f"Prebuilt OpenAPI document saved to {save_prebuilt_openapi(updated_openapi)}")
     except Exception as e:
         print(e)
         exit
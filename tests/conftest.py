@@ -0,0 +1,27 @@
+import os
+import sys
+
+import psycopg2.pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# database.py reads its settings and opens its pool on import. The tests never talk to Postgres,
+# so they get placeholder settings and a pool that must not be used.
+for name, value in {
+    "DB_HOST": "localhost", "DB_NAME": "test", "DB_USER": "test", "DB_PASSWORD": "test", "DB_PORT": "5432",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+class UnusedPool:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def getconn(self):
+        raise AssertionError("Tests must not check out a real connection")
+
+    def putconn(self, conn):
+        pass
+
+
+psycopg2.pool.ThreadedConnectionPool = UnusedPool
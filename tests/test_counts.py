@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+
+from openapi_server.db.counts import RowCounter
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.while_counting = None
+
+    @contextmanager
+    def session(self, *args):
+        yield None, self
+
+    def execute(self, query, params=None):
+        if self.while_counting:
+            self.while_counting()
+
+    def fetchone(self):
+        return (self.rows,)
+
+
+def test_exact_count_is_cached_until_the_table_is_invalidated():
+    table = FakeTable(5)
+    counter = RowCounter(table.session, ttl=60, exact_threshold=0)
+    assert counter.count("s", "t", mode="exact") == {"count": 5, "exact": True}
+
+    table.rows = 6
+    assert counter.count("s", "t", mode="exact")["count"] == 5
+    counter.invalidate("s", "t")
+    assert counter.count("s", "t", mode="exact")["count"] == 6
+
+
+def test_count_that_raced_an_invalidation_is_not_cached():
+    table = FakeTable(5)
+    counter = RowCounter(table.session, ttl=60, exact_threshold=0)
+    table.while_counting = lambda: counter.invalidate("s", "t")
+    assert counter.count("s", "t", mode="exact")["count"] == 5
+
+    table.while_counting = None
+    table.rows = 6
+    assert counter.count("s", "t", mode="exact")["count"] == 6
+
+
+def test_count_that_raced_a_full_invalidation_is_not_cached():
+    table = FakeTable(5)
+    counter = RowCounter(table.session, ttl=60, exact_threshold=0)
+    table.while_counting = lambda: counter.invalidate(None, None)
+    counter.count("s", "t", mode="exact")
+
+    table.while_counting = None
+    table.rows = 6
+    assert counter.count("s", "t", mode="exact")["count"] == 6
@@ -0,0 +1,139 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+from fastapi import HTTPException
+from psycopg2 import sql
+
+from openapi_server.db.group_commit import GroupCommitter
+from openapi_server.db.resilience import CircuitOpenError, TransientDatabaseError
+
+
+def render(query) -> str:
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return ".".join(query.strings)
+    if isinstance(query, sql.Literal):
+        return repr(query.wrapped)
+    return "%s"
+
+
+class FakeDatabase:
+    """Inserts rows by echoing their values back; ``reject`` names values that violate a constraint."""
+
+    def __init__(self, reject=(), error=None):
+        self.reject = set(reject)
+        self.error = error
+        self.sessions = 0
+        self.inserts = []
+        self.commits = []
+
+    @contextmanager
+    def session(self, *args):
+        self.sessions += 1
+        if self.error is not None:
+            raise self.error
+        yield FakeConn(self), FakeCursor(self)
+
+
+class FakeConn:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self):
+        return CatalogCursor()
+
+    def commit(self):
+        self.database.commits.append(len(self.database.inserts))
+
+
+class CatalogCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params):
+        pass
+
+    def fetchall(self):
+        return [("name", "text")]
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+
+    def execute(self, query, params):
+        text = render(query)
+        assert "ORDER BY openapi_server_ordinal" in text
+        self.database.inserts.append(list(params))
+        if self.database.reject & set(params):
+            raise HTTPException(status_code=500, detail="Database error: duplicate key")
+        self.rows = [{"id": index, "name": value} for index, value in enumerate(params)]
+
+    def fetchall(self):
+        return self.rows
+
+
+def submit_concurrently(committer, names):
+    results = {}
+    barrier = threading.Barrier(len(names))
+
+    def submit(name):
+        barrier.wait()
+        try:
+            results[name] = committer.submit("s", "t", {"name": name})
+        except HTTPException as error:
+            results[name] = error
+
+    threads = [threading.Thread(target=submit, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_each_caller_gets_its_own_row_from_one_insert():
+    database = FakeDatabase()
+    committed = []
+    committer = GroupCommitter(database.session, lambda schema, table: committed.append(table), 3, 1.0)
+
+    results = submit_concurrently(committer, ["a", "b", "c"])
+
+    assert {name: row["name"] for name, row in results.items()} == {"a": "a", "b": "b", "c": "c"}
+    assert len(database.inserts) == 1
+    assert committed == ["t"]
+
+
+def test_constraint_error_fails_only_the_offending_row():
+    database = FakeDatabase(reject={"b"})
+    committer = GroupCommitter(database.session, lambda schema, table: None, 3, 1.0)
+
+    results = submit_concurrently(committer, ["a", "b", "c"])
+
+    assert results["a"]["name"] == "a"
+    assert results["c"]["name"] == "c"
+    assert isinstance(results["b"], HTTPException)
+    # One failed batch insert, then one insert per row.
+    assert len(database.inserts) == 4
+
+
+@pytest.mark.parametrize("error", [
+    TransientDatabaseError("Database unavailable", write_safe=True, outage=True),
+    CircuitOpenError(retry_after=1),
+])
+def test_outage_is_raised_to_every_caller_without_retrying_rows(error):
+    database = FakeDatabase(error=error)
+    committer = GroupCommitter(database.session, lambda schema, table: None, 3, 1.0)
+
+    results = submit_concurrently(committer, ["a", "b", "c"])
+
+    assert all(result is error for result in results.values())
+    assert database.sessions == 1
@@ -0,0 +1,192 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from fastapi import HTTPException
+from psycopg2 import sql
+
+from openapi_server.db.idempotency import IdempotencyStore, record_result
+
+
+def render(query) -> str:
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return ".".join(query.strings)
+    return str(query)
+
+
+class FakeTable:
+    """The idempotency table, shared by every store that uses it as if they ran in different workers."""
+
+    def __init__(self):
+        self.rows = {}
+        self.session_deadlines = []
+
+    @contextmanager
+    def session(self, deadline=None, *args):
+        self.session_deadlines.append(deadline)
+        cursor = FakeCursor(self)
+        yield FakeConn(cursor), cursor
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def commit(self):
+        if self.cursor.pending:
+            key, response = self.cursor.pending
+            self.cursor.table.rows[key].update(response=response, claimed_until=None)
+            self.cursor.pending = None
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.result = None
+        self.pending = None
+
+    def execute(self, query, params=()):
+        text = render(query)
+        rows = self.table.rows
+        self.result = None
+        if text.startswith(("CREATE", "ALTER")) or (text.startswith("DELETE") and "created_at" in text):
+            return
+        if text.startswith("INSERT"):
+            key, fingerprint, token, lease = params
+            row = rows.get(key)
+            if row is None or (row["response"] is None and row["claimed_until"] < time.monotonic()):
+                rows[key] = {
+                    "fingerprint": fingerprint, "response": None, "token": token,
+                    "claimed_until": time.monotonic() + lease,
+                }
+                self.result = (key,)
+        elif text.startswith("SELECT"):
+            row = rows.get(params[0])
+            if row:
+                stored = row["response"]
+                self.result = (row["fingerprint"], stored and stored[0], stored is not None)
+        elif text.startswith("UPDATE"):
+            response, key, token = params
+            if rows.get(key, {}).get("token") == token:
+                self.pending = (key, (response.adapted,))
+                self.result = (key,)
+        elif text.startswith("DELETE"):
+            key, token = params
+            if rows.get(key, {}).get("token") == token and rows[key]["response"] is None:
+                del rows[key]
+        else:
+            raise AssertionError(f"Unexpected statement {text}")
+
+    def fetchone(self):
+        return self.result
+
+
+def writing(table, value):
+    """An operation that stores its response in its own transaction, as the write paths do."""
+    def operation():
+        with table.session() as (conn, cursor):
+            record_result(cursor, value)
+            conn.commit()
+        return value
+    return operation
+
+
+def test_retry_is_answered_from_memory():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    assert store.execute("k", "f", lambda: {"id": 1}) == {"id": 1}
+    assert store.execute("k", "f", lambda: pytest.fail("executed twice")) == {"id": 1}
+
+
+def test_key_reused_for_a_different_request_is_rejected():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    store.execute("k", "f", lambda: 1)
+    with pytest.raises(HTTPException) as raised:
+        store.execute("k", "other", lambda: 2)
+    assert raised.value.status_code == 422
+
+
+def test_duplicate_waits_for_the_first_execution():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def first():
+        started.set()
+        release.wait(5)
+        return "first"
+
+    thread = threading.Thread(target=lambda: results.append(store.execute("k", "f", first)))
+    thread.start()
+    started.wait(5)
+    duplicate = threading.Thread(
+        target=lambda: results.append(store.execute("k", "f", lambda: "second", time.monotonic() + 5))
+    )
+    duplicate.start()
+    release.set()
+    thread.join(5)
+    duplicate.join(5)
+    assert results == ["first", "first"]
+
+
+def test_duplicate_behind_a_stuck_execution_gives_up_at_its_deadline():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    started, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=lambda: store.execute("k", "f", lambda: started.set() or release.wait(5)))
+    thread.start()
+    started.wait(5)
+    began = time.monotonic()
+    with pytest.raises(HTTPException) as raised:
+        store.execute("k", "f", lambda: "second", time.monotonic() + 0.1)
+    release.set()
+    thread.join(5)
+    assert raised.value.status_code == 409
+    assert time.monotonic() - began < 1
+
+
+def test_response_stored_with_the_write_is_replayed_by_another_worker():
+    table = FakeTable()
+    first = IdempotencyStore(10, 60, table.session, ("public", "idempotency"))
+    second = IdempotencyStore(10, 60, table.session, ("public", "idempotency"))
+
+    deadline = time.monotonic() + 5
+    assert first.execute("k", "f", writing(table, {"id": 1}), deadline) == {"id": 1}
+    assert second.execute("k", "f", lambda: pytest.fail("executed twice")) == {"id": 1}
+    assert deadline in table.session_deadlines
+
+
+def test_key_whose_lease_ran_out_is_claimed_again():
+    table = FakeTable()
+    table.rows["k"] = {"fingerprint": "f", "response": None, "token": "dead", "claimed_until": time.monotonic() - 1}
+    store = IdempotencyStore(10, 60, table.session, ("public", "idempotency"))
+
+    assert store.execute("k", "f", writing(table, {"id": 2})) == {"id": 2}
+    assert table.rows["k"]["response"] == ({"id": 2},)
+
+
+def test_in_flight_key_of_another_worker_gives_up_at_the_deadline():
+    table = FakeTable()
+    table.rows["k"] = {"fingerprint": "f", "response": None, "token": "other", "claimed_until": time.monotonic() + 60}
+    store = IdempotencyStore(10, 60, table.session, ("public", "idempotency"))
+
+    with pytest.raises(HTTPException) as raised:
+        store.execute("k", "f", lambda: pytest.fail("executed twice"), time.monotonic() + 0.1)
+    assert raised.value.status_code == 409
+
+
+def test_write_whose_claim_was_taken_over_is_rejected():
+    table = FakeTable()
+    store = IdempotencyStore(10, 60, table.session, ("public", "idempotency"))
+
+    def taken_over():
+        table.rows["k"]["token"] = "thief"
+        return writing(table, {"id": 3})()
+
+    with pytest.raises(HTTPException) as raised:
+        store.execute("k", "f", taken_over)
+    assert raised.value.status_code == 409
+    assert table.rows["k"]["response"] is None
@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import pytest
+
+from openapi_server.db import notify
+from openapi_server.db.database import APPLICATION_NAME
+from openapi_server.db.key_filter import KeyFilters, SharedBloomFilter
+
+
+def remove(key_filter: SharedBloomFilter):
+    # Segments outlive their workers on purpose, so the test removes what it created.
+    key_filter.close()
+    shared_memory.SharedMemory(name=key_filter._name).unlink()
+    os.unlink(os.path.join(tempfile.gettempdir(), f"{key_filter._name}.lock"))
+
+
+@pytest.fixture
+def filter_name():
+    return f"openapi_server_test_{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def bloom(filter_name):
+    key_filter = SharedBloomFilter(filter_name, capacity=1000, fp_rate=0.001)
+    yield key_filter
+    remove(key_filter)
+
+
+def test_filter_answers_maybe_until_it_is_built(bloom):
+    assert bloom.might_contain(b"anything")
+    assert bloom.rebuild(lambda: iter([b"1", b"2"]), max_age=3600)
+    assert bloom.might_contain(b"1")
+    assert not bloom.might_contain(b"3")
+
+
+def test_filter_is_shared_between_workers(bloom, filter_name):
+    bloom.rebuild(lambda: iter([b"1"]), max_age=3600)
+    other_worker = SharedBloomFilter(filter_name, capacity=1000, fp_rate=0.001)
+    try:
+        other_worker.add([b"2"])
+        assert bloom.might_contain(b"2")
+    finally:
+        other_worker.close()
+
+
+def test_keys_added_during_a_rebuild_are_kept(bloom):
+    bloom.rebuild(lambda: iter([b"1"]), max_age=0)
+
+    def scan():
+        bloom.add([b"2"])
+        yield b"1"
+
+    assert bloom.rebuild(scan, max_age=0)
+    assert bloom.might_contain(b"2")
+
+
+def test_marking_stale_during_a_rebuild_keeps_the_filter_not_ready(bloom):
+    def scan():
+        bloom.mark_stale()
+        yield b"1"
+
+    bloom.rebuild(scan, max_age=3600)
+    assert not bloom.ready
+    assert bloom.might_contain(b"3")
+
+
+class Catalog:
+    """Answers primary key lookups and counts the sessions opened for them."""
+
+    def __init__(self, primary_keys):
+        self.primary_keys = primary_keys
+        self.sessions = 0
+
+    @contextmanager
+    def session(self, *args):
+        self.sessions += 1
+        yield self, None
+
+    def cursor(self, name=None):
+        return CatalogCursor(self.primary_keys)
+
+
+class CatalogCursor:
+    def __init__(self, primary_keys):
+        self.primary_keys = primary_keys
+        self.table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params):
+        self.table = params[1]
+
+    def fetchall(self):
+        column = self.primary_keys.get(self.table)
+        return [(column,)] if column else []
+
+
+def key_filters(catalog, filter_name, tables):
+    return KeyFilters(catalog.session, tables, filter_name, capacity=1000, fp_rate=0.001, rebuild_interval=3600)
+
+
+def close(filters):
+    for key_filter in filters._filters.values():
+        remove(key_filter)
+
+
+def test_writes_never_open_a_session_to_find_the_key_column(filter_name):
+    catalog = Catalog({"users": "user_id"})
+    filters = key_filters(catalog, filter_name, {("s", "users"): None})
+    try:
+        filters.add_rows("s", "users", [{"user_id": 1}])
+        assert catalog.sessions == 0
+        assert not filters._filters[("s", "users")].ready
+
+        filters.resolve_columns()
+        assert catalog.sessions == 1
+        assert filters.stats()["s.users"]["column"] == "user_id"
+    finally:
+        close(filters)
+
+
+def test_columns_are_resolved_in_one_session_and_tables_without_a_key_are_not_retried(filter_name):
+    catalog = Catalog({"users": "user_id"})
+    filters = key_filters(catalog, filter_name, {("s", "users"): None, ("s", "events"): None})
+    try:
+        filters.resolve_columns()
+        filters.resolve_columns()
+        assert catalog.sessions == 1
+        assert filters.stats()["s.events"]["column"] is None
+    finally:
+        close(filters)
+
+
+def test_lookup_by_a_key_that_was_never_written_is_a_definite_miss(filter_name):
+    filters = key_filters(Catalog({}), filter_name, {("s", "users"): "user_id"})
+    try:
+        filters._filters[("s", "users")].rebuild(lambda: iter([b"1"]), max_age=3600)
+        filters.add_rows("s", "users", [{"user_id": 2}])
+        assert not filters.definitely_missing("s", "users", {"user_id": 1})
+        assert not filters.definitely_missing("s", "users", {"user_id": 2})
+        assert filters.definitely_missing("s", "users", {"user_id": 3})
+        # Only lookups by exactly the key column are answered.
+        assert not filters.definitely_missing("s", "users", {"user_id": 3, "name": "x"})
+    finally:
+        close(filters)
+
+
+@pytest.mark.parametrize("change, stale", [
+    ({"op": "INSERT", "application": "psql"}, True),
+    ({"op": "UPDATE", "application": "psql"}, True),
+    ({"op": "INSERT", "application": APPLICATION_NAME}, False),
+    ({"op": "DELETE", "application": "psql"}, False),
+])
+def test_foreign_inserts_mark_the_key_filter_stale(monkeypatch, filter_name, change, stale):
+    filters = key_filters(Catalog({}), filter_name, {("s", "users"): "user_id"})
+    monkeypatch.setattr(notify, "key_filters", filters)
+    try:
+        filters._filters[("s", "users")].rebuild(lambda: iter([b"1"]), max_age=3600)
+        notify.handle_notification(json.dumps({"schema": "s", "table": "users", **change}))
+        assert filters._filters[("s", "users")].ready is not stale
+    finally:
+        close(filters)
@@ -0,0 +1,130 @@
+import pytest
+from fastapi import HTTPException
+from psycopg2 import OperationalError
+
+from openapi_server.db import database
+from openapi_server.db.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, TransientDatabaseError
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_after_a_good_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.before_call()
+    assert breaker.state == "half-open"
+    # Only one probe at a time.
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_open_breaker_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert raised.value.status_code == 503
+
+
+def test_retry_policy_does_not_retry_a_write_that_may_have_committed():
+    attempts = []
+
+    def operation():
+        attempts.append(1)
+        raise TransientDatabaseError("Database unavailable", write_safe=False, outage=True)
+
+    with pytest.raises(TransientDatabaseError):
+        RetryPolicy(attempts=3, base_delay=0, max_delay=0).run(operation, idempotent=False)
+    assert len(attempts) == 1
+
+
+class FakeCursor:
+    def __init__(self, fail=None):
+        self.query = None
+        self.fail = fail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.query = query
+        if self.fail:
+            raise self.fail
+
+
+class FakeConn:
+    closed = False
+
+    def __init__(self, fail=None):
+        self.fail = fail
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self.fail)
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def half_open_breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setattr(database, "circuit_breaker", breaker)
+    monkeypatch.setattr(database, "release_db_connection", lambda conn: None)
+    return breaker
+
+
+def test_probe_that_never_got_a_connection_leaves_the_breaker_open(monkeypatch, half_open_breaker):
+    def pool_timeout(deadline=None):
+        raise TransientDatabaseError("No database connection became free in time", write_safe=True, outage=False)
+
+    monkeypatch.setattr(database, "get_db_connection", pool_timeout)
+    with pytest.raises(TransientDatabaseError):
+        with database.db_session():
+            pass
+    assert half_open_breaker.state == "open"
+    # The next call may probe.
+    half_open_breaker.before_call()
+    assert half_open_breaker.state == "half-open"
+
+
+def test_probe_that_ran_a_statement_closes_the_breaker(monkeypatch, half_open_breaker):
+    monkeypatch.setattr(database, "get_db_connection", lambda deadline=None: FakeConn())
+    with pytest.raises(HTTPException):
+        with database.db_session() as (conn, cursor):
+            cursor.execute("SELECT * FROM t")
+            raise HTTPException(status_code=404, detail="No records found")
+    assert half_open_breaker.state == "closed"
+
+
+def test_probe_without_statements_checks_the_database_itself(monkeypatch, half_open_breaker):
+    conn = FakeConn()
+    monkeypatch.setattr(database, "get_db_connection", lambda deadline=None: conn)
+    with database.db_session():
+        pass
+    assert half_open_breaker.state == "closed"
+
+
+def test_probe_that_lost_its_connection_opens_the_breaker_again(monkeypatch, half_open_breaker):
+    monkeypatch.setattr(
+        database, "get_db_connection", lambda deadline=None: FakeConn(fail=OperationalError("server closed"))
+    )
+    with pytest.raises(TransientDatabaseError):
+        with database.db_session() as (conn, cursor):
+            cursor.execute("SELECT 1")
+    assert half_open_breaker.state == "open"
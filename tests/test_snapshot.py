@@ -0,0 +1,125 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+
+from openapi_server.db.catalog import parse_table_columns
+from openapi_server.db.snapshot import Snapshot, SnapshotStore, export_snapshot, snapshot_file_name
+
+INT4 = 23
+TEXT = 25
+
+
+class Column:
+    def __init__(self, name, type_code):
+        self.name = name
+        self.type_code = type_code
+
+
+class FakeTable:
+    """A table whose COPY output is ``copy_rows``; ``primary_key`` is what the catalog reports."""
+
+    def __init__(self, columns, copy_rows, primary_key):
+        self.columns = columns
+        self.copy_rows = copy_rows
+        self.primary_key = primary_key
+        self.copy_query = None
+
+    @contextmanager
+    def session(self, *args):
+        yield self, self
+
+    @property
+    def description(self):
+        return self.columns
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [(self.primary_key,)] if self.primary_key else []
+
+    def copy_expert(self, query, target):
+        self.copy_query = query
+        target.write(b"".join(b"\t".join(row) + b"\n" for row in self.copy_rows))
+
+
+def users(primary_key="user_id"):
+    return FakeTable(
+        [Column("user_id", INT4), Column("name", TEXT)],
+        [[b"1", b"ada"], [b"2", b"grace\\tscript"], [b"10", b"\\N"]],
+        primary_key
+    )
+
+
+def test_parse_table_columns():
+    assert parse_table_columns(" s.users , s.orders:order_id,") == {("s", "users"): None, ("s", "orders"): "order_id"}
+    with pytest.raises(ValueError):
+        parse_table_columns("users")
+
+
+def test_export_keys_the_snapshot_by_the_primary_key(tmp_path):
+    path = str(tmp_path / "s.users.snap")
+    assert export_snapshot(users().session, "s", "users", None, path) == 3
+
+    snapshot = Snapshot(path)
+    assert snapshot.key_column == "user_id"
+    assert snapshot.key_type == "int"
+    assert snapshot.get(2) == {"user_id": 2, "name": "grace\tscript"}
+    assert snapshot.get("10") == {"user_id": 10, "name": None}
+    assert snapshot.get(3) is None
+    assert snapshot.get("not a number") is None
+
+
+def test_export_without_a_primary_key_needs_a_column(tmp_path):
+    with pytest.raises(ValueError, match="s.users:<column>"):
+        export_snapshot(users(primary_key=None).session, "s", "users", None, str(tmp_path / "s.users.snap"))
+
+
+def test_text_keys_are_searched_in_byte_order(tmp_path):
+    table = users(primary_key=None)
+    table.copy_rows = sorted(table.copy_rows, key=lambda row: row[1].replace(b"\\N", b""))[1:]
+    path = str(tmp_path / "s.users.snap")
+    export_snapshot(table.session, "s", "users", "name", path)
+
+    snapshot = Snapshot(path)
+    assert snapshot.key_type == "text"
+    assert snapshot.get("ada")["user_id"] == 1
+    assert snapshot.get("grace\tscript")["user_id"] == 2
+    assert snapshot.get("bob") is None
+
+
+def test_unsorted_export_is_rejected(tmp_path):
+    table = users()
+    table.copy_rows = list(reversed(table.copy_rows))
+    with pytest.raises(ValueError, match="out of order"):
+        export_snapshot(table.session, "s", "users", None, str(tmp_path / "s.users.snap"))
+    assert os.listdir(tmp_path) == []
+
+
+def test_store_swaps_in_a_replaced_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path), {("s", "users")}, check_interval=0)
+    assert store.snapshot("s", "users") is None
+
+    path = os.path.join(str(tmp_path), snapshot_file_name("s", "users"))
+    export_snapshot(users().session, "s", "users", None, path)
+    first = store.lookup_snapshot("s", "users", {"user_id": 1})
+    assert first.get(1)["name"] == "ada"
+
+    table = users()
+    table.copy_rows = [[b"1", b"lovelace"]]
+    export_snapshot(table.session, "s", "users", None, path)
+    assert store.snapshot("s", "users").get(1)["name"] == "lovelace"
+    # Lookups still holding the old snapshot keep reading it.
+    assert first.get(1)["name"] == "ada"
+    # Only lookups by exactly the key column are answered from the snapshot.
+    assert store.lookup_snapshot("s", "users", {"name": "ada"}) is None